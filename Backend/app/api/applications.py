@@ -1,28 +1,40 @@
-from fastapi import APIRouter, HTTPException, status, Depends
-from app.models.application import ApplicationCreate, ApplicationPublic, ApplicationStatusUpdate
+from fastapi import APIRouter, HTTPException, status, Depends, Query, Request
+from app.models.application import ApplicationCreate, ApplicationPage, ApplicationPublic, ApplicationStatusUpdate
 from app.db.mongodb import db
 from app.auth.dependencies import get_current_user
+from app.services.room_loader import RoomLoader, get_room_loader
+from app.services.room_stats import count_application, move_application
+from app.utils.pagination import decode_cursor, encode_cursor, keyset_filter
+from app.utils.responses import FastJSONResponse
+from app.utils.streaming import wants_stream, stream_response
 from bson.objectid import ObjectId
+from pymongo import ReturnDocument
 from datetime import datetime
+from typing import Literal, Optional
 
 # This router handles all endpoints related to room applications.
 router = APIRouter(prefix="/applications", tags=["Applications"])
 
 # Helper function to convert MongoDB application documents into a more friendly format for our API responses.
+# The result is exactly an ApplicationPublic, so routes can send it without validating it again.
 def application_serializer(application):
     return {
         "id": str(application["_id"]),
         "user_email": application["user_email"],
         "room_id": application["room_id"],
         "status": application["status"],
-        "applied_at": application["applied_at"]
+        "applied_at": application["applied_at"],
+        "room": None,
     }
 
+# "My applications" are listed newest first; _id makes the order unique for cursors.
+APPLICATION_SORT = [("_id", -1)]
+
 # Endpoint to apply for a room
 @router.post("/", response_model=ApplicationPublic, status_code=201)
 async def apply_for_room(data: ApplicationCreate, user=Depends(get_current_user)):
     # First, check if the room exists before allowing the user to apply.
-    room = await db.rooms.find_one({"_id": ObjectId(data.room_id)})
+    room = await db.rooms.find_one({"_id": ObjectId(data.room_id)}, {"_id": 1})
     if not room:
         raise HTTPException(404, "Room not found")
     # Prevent users from applying more than once to the same room.
@@ -30,26 +42,62 @@ async def apply_for_room(data: ApplicationCreate, user=Depends(get_current_user)
     if existing:
         raise HTTPException(400, "Already applied for this room.")
     # If checks pass, create a new application document.
+    # MongoDB stores datetimes to the millisecond, so truncate now: the response
+    # then matches what a later GET /applications/ reads back.
+    now = datetime.utcnow()
+    now = now.replace(microsecond=now.microsecond // 1000 * 1000)
     doc = {
         "user_email": user,
         "room_id": data.room_id,
         "status": "applied",
-        "applied_at": datetime.utcnow()
+        "applied_at": now
     }
     # Insert the application into the MongoDB collection.
     result = await db.applications.insert_one(doc)
-    # Fetch and return the newly created application using the helper serializer.
-    new_app = await db.applications.find_one({"_id": result.inserted_id})
-    return application_serializer(new_app)
+    # Keep the room's per-status counters in step (see app/services/room_stats.py).
+    await count_application(data.room_id, "applied")
+    # Return the document we just built (plus its new ID), no need to read it back.
+    doc["_id"] = result.inserted_id
+    return FastJSONResponse(application_serializer(doc), status_code=201)
 
-# Endpoint to get all of the current user's applications.
-@router.get("/", response_model=list[ApplicationPublic])
-async def get_my_applications(user=Depends(get_current_user)):
-    apps = []
-    # Search for all applications where the user_email matches the current user.
-    async for app in db.applications.find({"user_email": user}):
-        apps.append(application_serializer(app))
-    return apps
+# Endpoint to get the current user's applications, newest first, one page at a time
+# (same `limit`/`cursor`/`next_cursor` paging as GET /rooms/).
+# With ?expand=room each application carries a summary of its room, so the client
+# doesn't need a GET /rooms/{id} per application; all rooms on the page come from one query.
+# Add ?stream=true or Accept: application/x-ndjson to stream every application instead.
+@router.get("/", response_model=ApplicationPage)
+async def get_my_applications(
+    request: Request,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    expand: Optional[Literal["room"]] = None,
+    stream: bool = False,
+    user=Depends(get_current_user),
+    rooms: RoomLoader = Depends(get_room_loader),
+):
+    query = {"user_email": user}
+    if wants_stream(request, stream):
+        if expand:
+            raise HTTPException(400, "expand can't be combined with streaming")
+        return stream_response(request, db.applications.find(query).sort(APPLICATION_SORT), application_serializer)
+    # Carry on after the last application of the previous page.
+    if cursor:
+        values = decode_cursor(cursor, "newest", APPLICATION_SORT)
+        if values is None:
+            raise HTTPException(400, "Invalid cursor")
+        query.update(keyset_filter(APPLICATION_SORT, values))
+    # Ask for one extra application so we know whether there is a next page.
+    docs = await db.applications.find(query).sort(APPLICATION_SORT).limit(limit + 1).to_list(limit + 1)
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        next_cursor = encode_cursor("newest", APPLICATION_SORT, docs[-1])
+    apps = [application_serializer(app) for app in docs]
+    if expand == "room":
+        summaries = await rooms.load_many([app["room_id"] for app in apps])
+        for app, summary in zip(apps, summaries):
+            app["room"] = summary
+    return FastJSONResponse({"items": apps, "next_cursor": next_cursor})
 
 # Endpoint to get a specific application by its ID.
 @router.get("/{application_id}", response_model=ApplicationPublic)
@@ -61,7 +109,7 @@ async def get_application_by_id(application_id: str, user=Depends(get_current_us
     app = await db.applications.find_one({"_id": ObjectId(application_id)})
     if not app or app["user_email"] != user:
         raise HTTPException(404, "Application not found")
-    return application_serializer(app)
+    return FastJSONResponse(application_serializer(app))
 
 # Endpoint to cancel an application.
 @router.patch("/{application_id}/cancel", response_model=ApplicationPublic)
@@ -69,18 +117,21 @@ async def cancel_application(application_id: str, user=Depends(get_current_user)
     # Again, check that the ID is valid.
     if not ObjectId.is_valid(application_id):
         raise HTTPException(400, "Invalid application ID")
-    # Find the application for this user.
-    app = await db.applications.find_one({"_id": ObjectId(application_id)})
-    if not app or app["user_email"] != user:
+    # Cancel in one atomic step: only matches if the application belongs to this user
+    # and isn't cancelled yet, and hands back the document as it was before, so we know
+    # which status counter to move it from.
+    app = await db.applications.find_one_and_update(
+        {"_id": ObjectId(application_id), "user_email": user, "status": {"$ne": "cancelled"}},
+        {"$set": {"status": "cancelled"}},
+        return_document=ReturnDocument.BEFORE
+    )
+    if app is not None:
+        await move_application(app["room_id"], app["status"], "cancelled")
+        app["status"] = "cancelled"
+        return FastJSONResponse(application_serializer(app))
+    # Nothing matched, so find out why (only happens on the error path).
+    existing = await db.applications.find_one({"_id": ObjectId(application_id)}, {"user_email": 1, "status": 1})
+    if not existing or existing["user_email"] != user:
         raise HTTPException(404, "Application not found")
     # Don't allow cancellation if it's already cancelled.
-    if app["status"] == "cancelled":
-        raise HTTPException(400, "Application already cancelled")
-    # Set the status of the application to 'cancelled'.
-    await db.applications.update_one(
-        {"_id": ObjectId(application_id)},
-        {"$set": {"status": "cancelled"}}
-    )
-    # Return the updated application to the client.
-    updated_app = await db.applications.find_one({"_id": ObjectId(application_id)})
-    return application_serializer(updated_app)
+    raise HTTPException(400, "Application already cancelled")
@@ -1,76 +1,217 @@
-from fastapi import APIRouter, HTTPException
+from typing import List, Optional
+
+from fastapi import APIRouter, HTTPException, Query
 from app.db.mongodb import db
-from app.services.geocode_service import postcode_to_coords
-from app.services.distance_service import calculate_osrm_distance
-from app.services.cache import get_cache, set_cache
+from app.models.geocode import BulkGeocodeRequest, BulkGeocodeResponse
+from app.services.geocode_service import (
+    postcode_to_coords, cached_postcodes_to_coords, normalise_postcode
+)
+from app.services.distance_service import calculate_osrm_distance, calculate_osrm_distances, estimate_distances
+from app.services.cache import get_many_cache
+from app.services.campus import CAMPUS_POSTCODES, DEFAULT_CAMPUS, get_campus_coords, distance_cache_key
+from app.services.fallback import get_with_stale, set_many_with_stale
+from app.services.geocode_warmup import record_postcode_requests
+from app.services.room_location import is_location_fresh, enqueue_room_location
+from app.utils.logger import get_logger
 from bson.objectid import ObjectId
 
+logger = get_logger(__name__)
+
 # This router handles endpoints for external integrations (like geocoding and distance).
 router = APIRouter(prefix="/external", tags=["External Services"])
 
-# This is the postcode for the campus. Change this if your campus postcode is different!
-CAMPUS_POSTCODE = "E1 4NS"
-
 # Endpoint to get the latitude and longitude of any UK postcode.
 @router.get("/geocode")
 async def geocode_postcode(postcode: str):
-    # Try to get cached coordinates to avoid unnecessary external API calls.
-    cache_key = f"geocode:{postcode.strip().replace(' ', '').upper()}"
-    result = get_cache(cache_key)
-    if result is not None:
-        return result
-
-    # If not cached, call the geocoding service to get the coordinates.
-    lat, lon = await postcode_to_coords(postcode)
-    if lat is None or lon is None:
-        raise HTTPException(400, "Could not geocode postcode")
-    value = {"latitude": lat, "longitude": lon}
-    # Store the result in the cache for future requests.
-    set_cache(cache_key, value)
-    return value
-
-# Endpoint to calculate the distance from a room to the campus, using room_id.
+    # Serve from the cache when we can (even a stale value, refreshed in the background).
+    # If several requests ask for the same postcode at once, only one of them
+    # actually calls the geocoding service.
+    cache_key = f"geocode:{normalise_postcode(postcode)}"
+    record_postcode_requests([normalise_postcode(postcode)])
+
+    async def fetch():
+        # If not cached, call the geocoding service to get the coordinates.
+        lat, lon = await postcode_to_coords(postcode)
+        if lat is None or lon is None:
+            raise HTTPException(400, "Could not geocode postcode")
+        return {"latitude": lat, "longitude": lon}
+
+    return await get_with_stale(cache_key, fetch)
+
+# Endpoint to geocode many postcodes at once (e.g. for the frontend or import jobs).
+@router.post("/geocode/bulk", response_model=BulkGeocodeResponse)
+async def geocode_postcodes_bulk(data: BulkGeocodeRequest):
+    # Normalise and remove duplicates, keeping the order the client sent them in.
+    postcodes = list(dict.fromkeys(normalise_postcode(p) for p in data.postcodes))
+    valid = [p for p in postcodes if p]
+    record_postcode_requests(valid)
+
+    # Serve whatever we can from the cache in one lookup, and resolve the rest
+    # through the postcodes.io bulk lookup (caching what we found).
+    coords = await cached_postcodes_to_coords(valid)
+
+    # Build one result per postcode, including the ones that failed.
+    results = []
+    for p in postcodes:
+        lat, lon = coords.get(p, (None, None))
+        if not p:
+            results.append({"postcode": p, "error": "Invalid postcode"})
+        elif lat is None or lon is None:
+            results.append({"postcode": p, "error": "Could not geocode postcode"})
+        else:
+            results.append({"postcode": p, "latitude": lat, "longitude": lon})
+    return {"results": results}
+
+# Most room IDs accepted in one /room-distance request.
+MAX_ROOM_IDS = 200
+
+# Endpoint to calculate the distance from a room to a campus, using room_id.
+# Pass room_id several times (?room_id=a&room_id=b) to get many rooms in one request,
+# and campus=<name> to measure to another configured campus than the default one.
 @router.get("/room-distance")
-async def room_to_campus_distance(room_id: str):
-    # Some debug printouts to help when developing or troubleshooting!
-    print(f"DEBUG: Received room_id: '{room_id}' (length: {len(room_id)})")
+async def room_to_campus_distance(room_id: List[str] = Query(...), campus: Optional[str] = None):
+    campus = campus or DEFAULT_CAMPUS
+    if campus not in CAMPUS_POSTCODES:
+        raise HTTPException(400, f"Unknown campus, expected one of: {', '.join(CAMPUS_POSTCODES)}")
+    if len(room_id) == 1:
+        return await _single_room_distance(room_id[0], campus)
+    if len(room_id) > MAX_ROOM_IDS:
+        raise HTTPException(400, f"At most {MAX_ROOM_IDS} room IDs per request")
+    return {"results": await _many_room_distances(room_id, campus)}
+
+async def _single_room_distance(room_id: str, campus: str):
     clean_room_id = room_id.strip()
-    print(f"DEBUG: Cleaned room_id: '{clean_room_id}' (length: {len(clean_room_id)})")
     try:
         obj_id = ObjectId(clean_room_id)
     except Exception as e:
-        print(f"DEBUG: ObjectId conversion error: {e}")
+        logger.debug("invalid room id", extra={"room_id": room_id, "error": str(e)})
         raise HTTPException(400, "Invalid room ID")
 
-    # Try to get the distance from the cache first for efficiency.
-    cache_key = f"distance:{clean_room_id}"
-    result = get_cache(cache_key)
-    if result is not None:
-        return result
-
-    # Find the room in the database. If it's not there, return an error.
-    room = await db.rooms.find_one({"_id": obj_id})
-    if not room:
-        print(f"DEBUG: Room not found for _id: {obj_id}")
-        raise HTTPException(404, "Room not found")
-
-    # Geocode both the room's postcode and the campus postcode.
-    room_lat, room_lon = await postcode_to_coords(room["postcode"])
-    campus_lat, campus_lon = await postcode_to_coords(CAMPUS_POSTCODE)
-    if None in (room_lat, room_lon, campus_lat, campus_lon):
-        print(f"DEBUG: Failed to geocode postcodes: {room['postcode']} / {CAMPUS_POSTCODE}")
-        raise HTTPException(400, "Failed to geocode postcodes")
-
-    # Call the distance calculation service (OSRM) to get distance and duration.
-    meters, duration = await calculate_osrm_distance(room_lat, room_lon, campus_lat, campus_lon)
-    if meters is None:
-        print("DEBUG: OSRM routing failed")
-        raise HTTPException(400, "OSRM routing failed")
-
-    # Prepare the result and save it in the cache.
-    value = {
-        "distance_meters": meters,
-        "duration_seconds": duration
-    }
-    set_cache(cache_key, value)
-    return value
+    # Try to get the distance from the cache first for efficiency (one entry per room and campus).
+    # Concurrent misses for the same room share one lookup (single-flight).
+    cache_key = distance_cache_key(clean_room_id, campus)
+
+    async def fetch():
+        # Find the room in the database. If it's not there, return an error.
+        room = await db.rooms.find_one({"_id": obj_id}, {"postcode": 1, "location": 1})
+        if not room:
+            logger.debug("room not found", extra={"room_id": clean_room_id})
+            raise HTTPException(404, "Room not found")
+
+        if is_location_fresh(room):
+            # Most rooms already have their distance to the default campus worked out and
+            # stored when they were created/updated, so we can answer straight from the document.
+            if campus == DEFAULT_CAMPUS:
+                return {
+                    "distance_meters": room["location"]["distance_meters"],
+                    "duration_seconds": room["location"]["duration_seconds"]
+                }
+            # For other campuses we still know where the room is, so only routing is left.
+            room_lat, room_lon = room["location"]["latitude"], room["location"]["longitude"]
+        else:
+            # Otherwise compute it now, and ask the background workers to store it for next time.
+            enqueue_room_location(clean_room_id)
+            room_lat, room_lon = await postcode_to_coords(room["postcode"])
+        # Campus coordinates were resolved on startup, so this doesn't call out.
+        campus_lat, campus_lon = await get_campus_coords(campus)
+        if None in (room_lat, room_lon, campus_lat, campus_lon):
+            logger.info("failed to geocode postcodes", extra={"postcode": room["postcode"], "campus": campus})
+            raise HTTPException(400, "Failed to geocode postcodes")
+
+        # Call the distance calculation service (OSRM) to get distance and duration.
+        meters, duration = await calculate_osrm_distance(room_lat, room_lon, campus_lat, campus_lon)
+        if meters is None:
+            # OSRM is down or has no route: fall back to a straight-line estimate.
+            logger.info("OSRM routing failed, using estimate", extra={"room_id": clean_room_id})
+            (meters, duration), = estimate_distances([(room_lat, room_lon)], campus_lat, campus_lon)
+            return {"distance_meters": meters, "duration_seconds": duration, "estimated": True}
+
+        # Prepare the result, get_with_stale saves it in the cache.
+        return {
+            "distance_meters": meters,
+            "duration_seconds": duration
+        }
+
+    # Stale distances are served straight away while being refreshed in the background.
+    # Estimates aren't cached: next time OSRM may be back.
+    return await get_with_stale(cache_key, fetch, cacheable=lambda value: not value.get("estimated"))
+
+async def _many_room_distances(room_ids: list, campus: str) -> list:
+    """
+    Distances from many rooms to one campus at once: one cache lookup, one MongoDB $in query,
+    one bulk geocode and OSRM /table requests for the rooms that still need routing.
+    Returns one result per unique room ID, with an "error" for the ones that failed.
+    """
+    ids = list(dict.fromkeys(room_id.strip() for room_id in room_ids))
+    results = {}
+    valid = []
+    for room_id in ids:
+        if ObjectId.is_valid(room_id):
+            valid.append(room_id)
+        else:
+            results[room_id] = {"room_id": room_id, "error": "Invalid room ID"}
+
+    # 1. Whatever is cached already.
+    cached = await get_many_cache([distance_cache_key(room_id, campus) for room_id in valid])
+    missing = []
+    for room_id in valid:
+        value = cached.get(distance_cache_key(room_id, campus))
+        if value is not None:
+            results[room_id] = {"room_id": room_id, **value}
+        else:
+            missing.append(room_id)
+
+    # 2. One query for all the other rooms; use stored locations where they're fresh.
+    new_values = {}
+    known = []      # (room_id, (lat, lon)) for rooms we already have coordinates for
+    to_geocode = []
+    if missing:
+        cursor = db.rooms.find({"_id": {"$in": [ObjectId(room_id) for room_id in missing]}}, {"postcode": 1, "location": 1})
+        rooms = {str(room["_id"]): room async for room in cursor}
+        for room_id in missing:
+            room = rooms.get(room_id)
+            if room is None:
+                results[room_id] = {"room_id": room_id, "error": "Room not found"}
+            elif is_location_fresh(room) and campus == DEFAULT_CAMPUS:
+                new_values[distance_cache_key(room_id, campus)] = {
+                    "distance_meters": room["location"]["distance_meters"],
+                    "duration_seconds": room["location"]["duration_seconds"]
+                }
+            elif is_location_fresh(room):
+                known.append((room_id, (room["location"]["latitude"], room["location"]["longitude"])))
+            else:
+                to_geocode.append(room)
+                enqueue_room_location(room_id)
+
+    # 3. Geocode and route the rest in batches, estimating where OSRM can't answer.
+    if known or to_geocode:
+        campus_lat, campus_lon = await get_campus_coords(campus)
+        routable = known
+        coords = await cached_postcodes_to_coords([room["postcode"] for room in to_geocode]) if to_geocode else {}
+        for room in to_geocode:
+            lat, lon = coords.get(normalise_postcode(room["postcode"]), (None, None))
+            if lat is None:
+                results[str(room["_id"])] = {"room_id": str(room["_id"]), "error": "Failed to geocode postcodes"}
+            else:
+                routable.append((str(room["_id"]), (lat, lon)))
+        if campus_lat is None:
+            for room_id, _ in routable:
+                results[room_id] = {"room_id": room_id, "error": "Failed to geocode postcodes"}
+            routable = []
+        points = [point for _, point in routable]
+        distances = await calculate_osrm_distances(points, campus_lat, campus_lon) if points else []
+        estimates = estimate_distances(points, campus_lat, campus_lon) if points else []
+        for (room_id, _), (meters, duration), estimate in zip(routable, distances, estimates):
+            if meters is None:
+                meters, duration = estimate
+                results[room_id] = {"room_id": room_id, "distance_meters": meters,
+                                    "duration_seconds": duration, "estimated": True}
+            else:
+                new_values[distance_cache_key(room_id, campus)] = {"distance_meters": meters, "duration_seconds": duration}
+
+    # Cache the real (non-estimated) answers for next time.
+    for key, value in new_values.items():
+        room_id = key.rsplit(":", 1)[1]
+        results[room_id] = {"room_id": room_id, **value}
+    await set_many_with_stale(new_values)
+    return [results[room_id] for room_id in ids]
@@ -1,23 +1,76 @@
-from fastapi import APIRouter, HTTPException, status, Depends
-from app.models.room import RoomCreate, RoomUpdate, RoomPublic
-from app.db.mongodb import db
+import os
+import re
+from typing import Literal, Optional
+
+from fastapi import APIRouter, HTTPException, status, Depends, Query, Request
+from pydantic import ValidationError
+from app.models.room import (
+    RoomCreate, RoomUpdate, RoomPublic, RoomPage, NearbyRoomPage,
+    BulkImportReport, BulkPriceUpdate, BulkPriceUpdateReport, RoomStats,
+)
+from app.db.mongodb import db, read_db
 from app.auth.dependencies import get_current_user
+from app.services.room_location import enqueue_room_location, enqueue_room_locations
+from app.services.cache import delete_cache
+from app.services.campus import distance_cache_keys
+from app.services.response_cache import (
+    room_etag, rooms_list_etag, room_changed, rooms_changed, is_not_modified,
+    not_modified_response, get_cached_body, json_response, response_cache_total,
+)
+from app.services.room_postcodes import POSTCODE_KEY, with_postcode_key
+from app.services.room_stats import get_room_stats, stats_serializer
+from app.services.geocode_service import normalise_postcode
+from app.services.geo_index import GEO_BACKEND, geo_point, room_geo_index, unindex_room
+from app.utils.pagination import encode_cursor, decode_cursor, keyset_filter
+from app.utils.responses import FastJSONResponse
+from app.utils.streaming import wants_stream, stream_response
+from app.utils.uploads import RowTooLarge, iter_csv_rows, iter_ndjson_rows
 from bson.objectid import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
 
 # This router takes care of all room-related endpoints.
 router = APIRouter(prefix="/rooms", tags=["Rooms"])
 
+# Only the fields RoomPublic needs, so listings don't pull whole documents
+# (e.g. the stored location) out of MongoDB.
+ROOM_PUBLIC_FIELDS = {"title": 1, "description": 1, "address": 1, "price_per_month": 1, "postcode": 1}
+
+# Sort options for the listing. Each one ends with _id so the order is always
+# unique (needed for cursor pagination) and matches an index on rooms.
+ROOM_SORTS = {
+    "newest": [("_id", -1)],
+    "oldest": [("_id", 1)],
+    "price_asc": [("price_per_month", 1), ("_id", 1)],
+    "price_desc": [("price_per_month", -1), ("_id", -1)],
+}
+# Nearby results are ordered by distance, then _id for rooms at the same spot (same postcode).
+NEARBY_SORT = [("distance_meters", 1), ("_id", 1)]
+
+# Bulk endpoints, configurable from the environment.
+# - BULK_BATCH_SIZE: rows validated and inserted together (all an import holds in memory)
+# - BULK_MAX_ROW_BYTES: longest line/record accepted in an upload
+# - BULK_MAX_ERRORS: row errors listed in an import report (the failed count is always exact)
+# - BULK_MAX_UPDATES: price updates accepted by one PATCH /rooms/bulk
+BULK_BATCH_SIZE = int(os.getenv("BULK_BATCH_SIZE", "500"))
+BULK_MAX_ROW_BYTES = int(os.getenv("BULK_MAX_ROW_BYTES", "65536"))
+BULK_MAX_ERRORS = int(os.getenv("BULK_MAX_ERRORS", "1000"))
+BULK_MAX_UPDATES = int(os.getenv("BULK_MAX_UPDATES", "1000"))
+# Most rooms GET /rooms/stats answers for in one request.
+STATS_MAX_IDS = int(os.getenv("STATS_MAX_IDS", "100"))
+
 def room_serializer(room):
     """
     Helper function: Converts the MongoDB room object into a Python dict
     that works well for JSON responses in our API.
+    The result is exactly a RoomPublic, so routes can send it without validating it again.
     """
     return {
         "id": str(room["_id"]),
         "title": room["title"],
         "description": room.get("description"),
         "address": room["address"],
-        "price_per_month": room["price_per_month"],
+        "price_per_month": float(room["price_per_month"]),
         "postcode": room["postcode"]
     }
 
@@ -25,30 +78,324 @@ def room_serializer(room):
 @router.post("/", response_model=RoomPublic, status_code=201)
 async def create_room(room: RoomCreate, user=Depends(get_current_user)):
     # Only authenticated users can create a room.
-    result = await db.rooms.insert_one(room.dict())
-    # After creating, fetch the new room from the DB and return it.
-    new_room = await db.rooms.find_one({"_id": result.inserted_id})
-    return room_serializer(new_room)
-
-# Endpoint to get all rooms (for students to browse).
-@router.get("/", response_model=list[RoomPublic])
-async def list_rooms():
-    rooms = []
-    # Go through every room in the collection and serialize for API response.
-    async for room in db.rooms.find():
-        rooms.append(room_serializer(room))
-    return rooms
+    new_room = with_postcode_key(room.model_dump())
+    result = await db.rooms.insert_one(new_room)
+    # Geocode the room and work out its campus distance in the background.
+    enqueue_room_location(str(result.inserted_id))
+    # Listings now include the new room.
+    await rooms_changed()
+    # We already have everything we just saved, so return it without reading it back.
+    new_room["_id"] = result.inserted_id
+    return FastJSONResponse(room_serializer(new_room), status_code=201)
+
+# Endpoint to browse rooms, one page at a time (for students to browse).
+# With ?stream=true (JSON array) or Accept: application/x-ndjson, every matching room
+# is streamed instead, which is what exports should use.
+@router.get("/", response_model=RoomPage)
+async def list_rooms(
+    request: Request,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    sort: Literal["newest", "oldest", "price_asc", "price_desc"] = "newest",
+    min_price: Optional[float] = Query(None, ge=0),
+    max_price: Optional[float] = Query(None, ge=0),
+    postcode: Optional[str] = None,
+    stream: bool = False,
+):
+    sort_fields = ROOM_SORTS[sort]
+    streaming = wants_stream(request, stream)
+    # Listing pages are cached until any room changes. A client that already has
+    # the current page gets a 304 without us touching the database.
+    if not streaming:
+        etag = await rooms_list_etag(limit, cursor, sort, min_price, max_price, postcode)
+        if is_not_modified(request, etag):
+            response_cache_total.inc(route="/rooms/", outcome="not_modified")
+            return not_modified_response(etag)
+        body = get_cached_body(etag)
+        if body is not None:
+            response_cache_total.inc(route="/rooms/", outcome="hit")
+            return json_response(etag, None, body)
+        response_cache_total.inc(route="/rooms/", outcome="miss")
+    # Build the filters on the server so MongoDB only returns matching rooms.
+    filters = []
+    if min_price is not None or max_price is not None:
+        price = {}
+        if min_price is not None:
+            price["$gte"] = min_price
+        if max_price is not None:
+            price["$lte"] = max_price
+        filters.append({"price_per_month": price})
+    if postcode:
+        # Anchored prefix match on the normalised postcode ("e1 4" -> "E14..."),
+        # which can use the postcode_key index.
+        filters.append({POSTCODE_KEY: {"$regex": "^" + re.escape(normalise_postcode(postcode))}})
+    # Carry on after the last room of the previous page.
+    if cursor:
+        values = decode_cursor(cursor, sort, sort_fields)
+        if values is None:
+            raise HTTPException(400, "Invalid cursor")
+        filters.append(keyset_filter(sort_fields, values))
+    query = {"$and": filters} if filters else {}
+
+    # Streaming mode: send every matching room as it comes off the cursor (no page limit).
+    if streaming:
+        return stream_response(request, read_db.rooms.find(query, ROOM_PUBLIC_FIELDS).sort(sort_fields), room_serializer)
+
+    # Ask for one extra room so we know whether there is a next page. The page is cached
+    # under the current generation, so it's read from the primary: a lagging secondary
+    # could miss a room created a moment ago and keep it out of the cache for that generation.
+    docs = await db.rooms.find(query, ROOM_PUBLIC_FIELDS).sort(sort_fields).limit(limit + 1).to_list(limit + 1)
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        next_cursor = encode_cursor(sort, sort_fields, docs[-1])
+    return json_response(etag, {"items": [room_serializer(room) for room in docs], "next_cursor": next_cursor})
+
+# Endpoint to find rooms near a point (e.g. the campus), nearest first, optionally under a budget.
+@router.get("/nearby", response_model=NearbyRoomPage)
+async def nearby_rooms(
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    radius_m: float = Query(2000, gt=0, le=50000),
+    max_price: Optional[float] = Query(None, ge=0),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+):
+    # The cursor remembers the distance and _id of the last room on the previous page.
+    after = None
+    if cursor:
+        after = decode_cursor(cursor, "nearby", NEARBY_SORT)
+        if after is None:
+            raise HTTPException(400, "Invalid cursor")
+
+    # Ask for one extra room so we know whether there is a next page.
+    if GEO_BACKEND == "memory":
+        docs = await _nearby_from_memory(lat, lon, radius_m, max_price, limit + 1, after)
+    else:
+        docs = await _nearby_from_mongo(lat, lon, radius_m, max_price, limit + 1, after)
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        next_cursor = encode_cursor("nearby", NEARBY_SORT, docs[-1])
+    items = [dict(room_serializer(room), distance_meters=float(room["distance_meters"])) for room in docs]
+    return FastJSONResponse({"items": items, "next_cursor": next_cursor})
+
+async def _nearby_from_mongo(lat, lon, radius_m, max_price, limit, after):
+    """Nearby search with $geoNear on the rooms.geo 2dsphere index."""
+    geo_near = {
+        "near": geo_point(lat, lon),
+        "distanceField": "distance_meters",
+        "maxDistance": radius_m,
+        "spherical": True,
+        "key": "geo",
+    }
+    if max_price is not None:
+        geo_near["query"] = {"price_per_month": {"$lte": max_price}}
+    pipeline = []
+    if after:
+        # Skip everything closer than the last room we already returned.
+        geo_near["minDistance"] = after[0]
+        pipeline = [{"$geoNear": geo_near}, {"$match": keyset_filter(NEARBY_SORT, after)}]
+    else:
+        pipeline = [{"$geoNear": geo_near}]
+    pipeline += [
+        {"$sort": {"distance_meters": 1, "_id": 1}},
+        {"$limit": limit},
+        {"$project": dict(ROOM_PUBLIC_FIELDS, distance_meters=1)},
+    ]
+    return await read_db.rooms.aggregate(pipeline).to_list(limit)
+
+async def _nearby_from_memory(lat, lon, radius_m, max_price, limit, after):
+    """
+    Nearby search with the in-memory grid index: the index finds the room IDs in range,
+    then MongoDB is asked for those rooms (and the price filter) in small $in batches.
+    """
+    candidates = room_geo_index.within(lat, lon, radius_m)
+    if after:
+        last = (after[0], str(after[1]))
+        candidates = [c for c in candidates if c > last]
+    results = []
+    for i in range(0, len(candidates), 200):
+        chunk = candidates[i:i + 200]
+        query = {"_id": {"$in": [ObjectId(room_id) for _, room_id in chunk]}}
+        if max_price is not None:
+            query["price_per_month"] = {"$lte": max_price}
+        docs = {str(room["_id"]): room async for room in read_db.rooms.find(query, ROOM_PUBLIC_FIELDS)}
+        for distance, room_id in chunk:
+            if room_id in docs:
+                results.append(dict(docs[room_id], distance_meters=distance))
+                if len(results) >= limit:
+                    return results
+    return results
+
+def _validation_message(error: ValidationError) -> str:
+    """One line per invalid field, e.g. "price_per_month: Input should be a valid number"."""
+    return "; ".join(
+        f"{'.'.join(str(part) for part in item['loc']) or 'row'}: {item['msg']}" for item in error.errors()
+    )
+
+class _ImportReport:
+    """Counts and (up to BULK_MAX_ERRORS) row errors of one bulk import."""
+
+    def __init__(self):
+        self.inserted = 0
+        self.failed = 0
+        self.errors = []
+        self.errors_truncated = False
+        self.aborted = None
+
+    def fail(self, row: int, error: str):
+        self.failed += 1
+        if len(self.errors) < BULK_MAX_ERRORS:
+            self.errors.append({"row": row, "error": error})
+        else:
+            self.errors_truncated = True
+
+    def to_dict(self) -> dict:
+        return {"inserted": self.inserted, "failed": self.failed, "errors": self.errors,
+                "errors_truncated": self.errors_truncated, "aborted": self.aborted}
+
+async def _insert_room_batch(docs: list, rows: list, report: _ImportReport):
+    """
+    Insert one batch with an unordered insert_many (a bad document doesn't stop the
+    others), then queue the new rooms to be geocoded and routed together.
+    """
+    for doc in docs:
+        doc["_id"] = ObjectId()
+    failed = set()
+    try:
+        await db.rooms.insert_many(docs, ordered=False)
+    except BulkWriteError as e:
+        for error in e.details.get("writeErrors", []):
+            failed.add(error["index"])
+            report.fail(rows[error["index"]], error.get("errmsg", "Insert failed"))
+    ids = [str(doc["_id"]) for i, doc in enumerate(docs) if i not in failed]
+    report.inserted += len(ids)
+    if ids:
+        await rooms_changed()
+        enqueue_room_locations(ids)
+
+# Endpoint to import many rooms at once from a CSV (with a header line) or NDJSON upload.
+# The body is read as a stream and stored in batches, so uploads of any size use the same memory.
+# Rows are validated like POST /rooms/; the report lists the rows that couldn't be stored.
+@router.post("/bulk", response_model=BulkImportReport)
+async def bulk_import_rooms(
+    request: Request,
+    format: Optional[Literal["csv", "ndjson"]] = None,
+    user=Depends(get_current_user),
+):
+    content_type = request.headers.get("content-type", "")
+    if format is None:
+        if "csv" in content_type:
+            format = "csv"
+        elif "ndjson" in content_type or "jsonl" in content_type:
+            format = "ndjson"
+        else:
+            raise HTTPException(415, "Send text/csv or application/x-ndjson, or pass ?format=csv|ndjson")
+    parse_rows = iter_csv_rows if format == "csv" else iter_ndjson_rows
+
+    report = _ImportReport()
+    docs, rows = [], []
+    try:
+        async for number, row, error in parse_rows(request.stream(), BULK_MAX_ROW_BYTES):
+            if error:
+                report.fail(number, error)
+                continue
+            try:
+                room = RoomCreate(**row)
+            except ValidationError as e:
+                report.fail(number, _validation_message(e))
+                continue
+            docs.append(with_postcode_key(room.model_dump()))
+            rows.append(number)
+            if len(docs) >= BULK_BATCH_SIZE:
+                await _insert_room_batch(docs, rows, report)
+                docs, rows = [], []
+    except RowTooLarge as e:
+        # Everything before the oversized row is kept; the client can fix it and resend the rest.
+        report.aborted = str(e)
+    if docs:
+        await _insert_room_batch(docs, rows, report)
+    return report.to_dict()
+
+# Endpoint to change the price of many rooms in one request (one bulk_write round trip).
+@router.patch("/bulk", response_model=BulkPriceUpdateReport)
+async def bulk_update_prices(data: BulkPriceUpdate, user=Depends(get_current_user)):
+    if len(data.updates) > BULK_MAX_UPDATES:
+        raise HTTPException(400, f"At most {BULK_MAX_UPDATES} updates per request")
+    errors = []
+    operations = []
+    room_ids = []
+    for update in data.updates:
+        if not ObjectId.is_valid(update.id):
+            errors.append({"id": update.id, "error": "Invalid room ID"})
+            continue
+        operations.append(UpdateOne({"_id": ObjectId(update.id)},
+                                    {"$set": {"price_per_month": float(update.price_per_month)}}))
+        room_ids.append(update.id)
+    if not operations:
+        return {"matched": 0, "modified": 0, "errors": errors}
+
+    result = await db.rooms.bulk_write(operations, ordered=False)
+    unique_ids = list(dict.fromkeys(room_ids))
+    # Only when something didn't match do we look up which rooms don't exist.
+    if result.matched_count < len(operations):
+        cursor = db.rooms.find({"_id": {"$in": [ObjectId(room_id) for room_id in unique_ids]}}, {"_id": 1})
+        found = {str(room["_id"]) async for room in cursor}
+        errors += [{"id": room_id, "error": "Room not found"} for room_id in unique_ids if room_id not in found]
+    await room_changed(*unique_ids)
+    return {"matched": result.matched_count, "modified": result.modified_count, "errors": errors}
+
+# Endpoint for the landlord dashboard: application counters of many rooms at once,
+# e.g. /rooms/stats?ids=a,b,c (one lookup for all of them). Rooms without any
+# application get zeros. Declared before /{room_id} so "stats" isn't taken for an ID.
+@router.get("/stats", response_model=list[RoomStats])
+async def rooms_stats(ids: str = Query(..., description="Comma-separated room IDs"), user=Depends(get_current_user)):
+    room_ids = list(dict.fromkeys(room_id.strip() for room_id in ids.split(",") if room_id.strip()))
+    if not room_ids:
+        raise HTTPException(400, "No room IDs given")
+    if len(room_ids) > STATS_MAX_IDS:
+        raise HTTPException(400, f"At most {STATS_MAX_IDS} room IDs per request")
+    invalid = [room_id for room_id in room_ids if not ObjectId.is_valid(room_id)]
+    if invalid:
+        raise HTTPException(400, f"Invalid room ID: {invalid[0]}")
+    stats = await get_room_stats(room_ids)
+    return FastJSONResponse([stats_serializer(room_id, stats.get(room_id)) for room_id in room_ids])
 
 # Endpoint to get details of a single room by its ID.
 @router.get("/{room_id}", response_model=RoomPublic)
-async def get_room(room_id: str):
+async def get_room(room_id: str, request: Request):
     # Ensure room_id is a valid MongoDB ObjectId string.
     if not ObjectId.is_valid(room_id):
         raise HTTPException(400, "Invalid room ID")
-    room = await db.rooms.find_one({"_id": ObjectId(room_id)})
+    # The ETag is taken before reading, so if the room changes while we read it,
+    # the copy we cache is filed under the old version and never served again.
+    etag = await room_etag(room_id)
+    if is_not_modified(request, etag):
+        response_cache_total.inc(route="/rooms/{room_id}", outcome="not_modified")
+        return not_modified_response(etag)
+    body = get_cached_body(etag)
+    if body is not None:
+        response_cache_total.inc(route="/rooms/{room_id}", outcome="hit")
+        return json_response(etag, None, body)
+    response_cache_total.inc(route="/rooms/{room_id}", outcome="miss")
+    # Read from the primary: the body is cached under the room's new version, and a secondary
+    # might still hold the room from before the update that created that version.
+    room = await db.rooms.find_one({"_id": ObjectId(room_id)}, ROOM_PUBLIC_FIELDS)
     if not room:
         raise HTTPException(404, "Room not found")
-    return room_serializer(room)
+    return json_response(etag, room_serializer(room))
+
+# Endpoint to get how many applications a room has, per status.
+@router.get("/{room_id}/stats", response_model=RoomStats)
+async def room_stats(room_id: str, user=Depends(get_current_user)):
+    if not ObjectId.is_valid(room_id):
+        raise HTTPException(400, "Invalid room ID")
+    stats = (await get_room_stats([room_id])).get(room_id)
+    # No counters yet: either nobody has applied, or there's no such room.
+    if stats is None and not await db.rooms.find_one({"_id": ObjectId(room_id)}, {"_id": 1}):
+        raise HTTPException(404, "Room not found")
+    return FastJSONResponse(stats_serializer(room_id, stats))
 
 # Endpoint to update an existing room (owner only, in real-world).
 @router.put("/{room_id}", response_model=RoomPublic)
@@ -64,13 +411,24 @@ async def update_room(room_id: str, data: RoomUpdate, user=Depends(get_current_u
     # If nothing was sent to update, show error.
     if not update_data:
         raise HTTPException(400, "No data provided to update")
-    # Try to update the room. If not found, error.
-    result = await db.rooms.update_one({"_id": ObjectId(room_id)}, {"$set": update_data})
-    if result.matched_count == 0:
+    update = {"$set": with_postcode_key(update_data)}
+    # A new postcode means the stored location is wrong, so drop it and recompute in the background.
+    if "postcode" in update_data:
+        update["$unset"] = {"location": "", "geo": ""}
+    # Update the room and get the updated version back in the same round trip. If not found, error.
+    room = await db.rooms.find_one_and_update(
+        {"_id": ObjectId(room_id)}, update,
+        projection=ROOM_PUBLIC_FIELDS, return_document=ReturnDocument.AFTER
+    )
+    if room is None:
         raise HTTPException(404, "Room not found")
-    # Fetch and return the updated room.
-    room = await db.rooms.find_one({"_id": ObjectId(room_id)})
-    return room_serializer(room)
+    await room_changed(room_id)
+    if "postcode" in update_data:
+        for key in distance_cache_keys(room_id):
+            await delete_cache(key)
+        unindex_room(room_id)
+        enqueue_room_location(room_id)
+    return FastJSONResponse(room_serializer(room))
 
 # Endpoint to delete a room listing (for admin/owner).
 @router.delete("/{room_id}", status_code=204)
@@ -82,5 +440,9 @@ async def delete_room(room_id: str, user=Depends(get_current_user)):
     result = await db.rooms.delete_one({"_id": ObjectId(room_id)})
     if result.deleted_count == 0:
         raise HTTPException(404, "Room not found")
+    await room_changed(room_id)
+    unindex_room(room_id)
+    for key in distance_cache_keys(room_id):
+        await delete_cache(key)
     # 204 status means "No Content" so we return nothing.
     return
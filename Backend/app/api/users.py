@@ -1,9 +1,10 @@
 from fastapi import APIRouter, HTTPException, status, Depends
 from app.models.user import UserCreate, UserLogin, UserPublic
 from app.db.mongodb import db
-from app.auth.dependencies import hash_password, verify_password
+from app.auth.dependencies import hash_password_async, verify_password_async
 from app.auth.jwt_handler import create_access_token
 from bson.objectid import ObjectId
+from pymongo.errors import DuplicateKeyError
 
 # This router manages all endpoints for user registration and login.
 router = APIRouter(prefix="/users", tags=["Users"])
@@ -11,14 +12,20 @@ router = APIRouter(prefix="/users", tags=["Users"])
 # Register a new user (student or landlord)
 @router.post("/register", response_model=UserPublic)
 async def register(user: UserCreate):
-    # First, check if the email is already registered.
-    existing = await db.users.find_one({"email": user.email})
-    if existing:
+    # Turn away known emails before hashing: bcrypt is the expensive part, and
+    # repeated registrations shouldn't tie up the password pool.
+    if await db.users.find_one({"email": user.email}, {"_id": 1}):
+        raise HTTPException(status_code=400, detail="Email already registered")
+    # Hash the user's password before saving (never store plain text!).
+    # Hashing runs on a worker thread so it doesn't hold up other requests.
+    hashed_pw = await hash_password_async(user.password)
+    # The unique index on users.email still rejects duplicates for us, even if two
+    # registrations for the same email arrive at the same time.
+    try:
+        await db.users.insert_one({"email": user.email, "hashed_password": hashed_pw})
+    except DuplicateKeyError:
         # If a user already exists with this email, return an error.
         raise HTTPException(status_code=400, detail="Email already registered")
-    # If not, hash the user's password before saving (never store plain text!).
-    hashed_pw = hash_password(user.password)
-    await db.users.insert_one({"email": user.email, "hashed_password": hashed_pw})
     # Only return the public-facing user info, never the password!
     return UserPublic(email=user.email)
 
@@ -28,8 +35,14 @@ async def login(user: UserLogin):
     # Look up the user by email.
     db_user = await db.users.find_one({"email": user.email})
     # If user doesn't exist or the password doesn't match, return error.
-    if not db_user or not verify_password(user.password, db_user["hashed_password"]):
+    if not db_user:
+        raise HTTPException(status_code=401, detail="Invalid email or password")
+    valid, new_hash = await verify_password_async(user.password, db_user["hashed_password"])
+    if not valid:
         raise HTTPException(status_code=401, detail="Invalid email or password")
+    # If the bcrypt cost setting changed since this password was hashed, upgrade the stored hash.
+    if new_hash:
+        await db.users.update_one({"_id": db_user["_id"]}, {"$set": {"hashed_password": new_hash}})
     # If login is successful, create a JWT token with the user's email as the subject.
     token = create_access_token({"sub": user.email})
     # Return the token and token type, which the frontend will use for authentication.
@@ -1,7 +1,25 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import Depends, HTTPException, status
 from passlib.context import CryptContext
 
+# bcrypt cost factor. Raising it makes hashes slower to brute-force (and to compute).
+# Existing users are moved to the new cost automatically the next time they log in.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# bcrypt is slow on purpose, so it runs on a small dedicated thread pool instead of
+# blocking the event loop. If too many requests are already waiting, we refuse new ones.
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "4"))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64"))
+
 # Set up the password context using bcrypt for secure hashing.
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+# Created on first use, so it can be shut down and started again (e.g. between tests).
+_hash_pool = None
+# Counters for monitoring the pool (pending = running + waiting for a thread).
+_hash_pool_stats = {"pending": 0, "max_pending": 0, "completed": 0, "rejected": 0}
 
 def hash_password(password: str) -> str:
     """
@@ -17,9 +35,55 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     """
     return pwd_context.verify(plain_password, hashed_password)
 
-from fastapi import Depends, HTTPException, status
+async def _run_in_hash_pool(func, *args):
+    """
+    Run a bcrypt call on the password thread pool and wait for it without blocking
+    other requests. Raises 503 if the pool already has too much work queued.
+    """
+    if _hash_pool_stats["pending"] >= PASSWORD_HASH_MAX_PENDING:
+        _hash_pool_stats["rejected"] += 1
+        raise HTTPException(status_code=503, detail="Server busy, please try again", headers={"Retry-After": "1"})
+    _hash_pool_stats["pending"] += 1
+    _hash_pool_stats["max_pending"] = max(_hash_pool_stats["max_pending"], _hash_pool_stats["pending"])
+    global _hash_pool
+    if _hash_pool is None:
+        _hash_pool = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_hash_pool, func, *args)
+    finally:
+        _hash_pool_stats["pending"] -= 1
+        _hash_pool_stats["completed"] += 1
+
+async def hash_password_async(password: str) -> str:
+    """Async version of hash_password, runs bcrypt on the password thread pool."""
+    return await _run_in_hash_pool(pwd_context.hash, password)
+
+async def verify_password_async(plain_password: str, hashed_password: str):
+    """
+    Async version of verify_password, runs bcrypt on the password thread pool.
+    Returns (is_valid, new_hash). new_hash is only set when the password was right
+    but the stored hash uses an old bcrypt cost, so the caller should save it.
+    """
+    return await _run_in_hash_pool(pwd_context.verify_and_update, plain_password, hashed_password)
+
+def password_pool_stats() -> dict:
+    """Queue depth and throughput of the password hashing pool."""
+    pending = _hash_pool_stats["pending"]
+    return dict(
+        _hash_pool_stats,
+        workers=PASSWORD_HASH_WORKERS,
+        queued=max(0, pending - PASSWORD_HASH_WORKERS),
+    )
+
+def shutdown_password_pool():
+    """Stop the password hashing threads. Called on app shutdown."""
+    global _hash_pool
+    if _hash_pool is not None:
+        _hash_pool.shutdown(wait=False, cancel_futures=True)
+        _hash_pool = None
+
 from fastapi.security import OAuth2PasswordBearer
-from app.auth.jwt_handler import decode_access_token
+from app.auth.jwt_handler import verify_access_token
 
 # This sets up OAuth2 "Password Bearer" for JWT-based auth.
 # tokenUrl is the login endpoint (where frontend POSTs to get a token).
@@ -31,7 +95,7 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
     It decodes the JWT access token from the Authorization header
     and returns the user's email (from the "sub" field in JWT payload).
     """
-    payload = decode_access_token(token)
+    payload = await verify_access_token(token)
     # If token is missing or invalid, raise an error so user can't access protected routes.
     if not payload or "sub" not in payload:
         raise HTTPException(status_code=401, detail="Invalid authentication credentials")
@@ -1,12 +1,99 @@
+import base64
+import calendar
+import hashlib
+import heapq
+import hmac
+import json
 import os
+import time
+import uuid
 from datetime import datetime, timedelta
 from jose import JWTError, jwt
+import redis.asyncio as redis
+from redis.exceptions import RedisError
+
+from app.services.cache import CACHE_KEY_PREFIX, REDIS_URL, TTLCache
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
 
 # Secret key for signing JWTs, loaded from environment variable for security.
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = "HS256"  # Using HMAC-SHA256 algorithm for JWTs.
 ACCESS_TOKEN_EXPIRE_MINUTES = 60  # Tokens are valid for 1 hour.
 
+# Which JWT implementation to use:
+# - "jose":   python-jose (default)
+# - "native": a small HS256-only implementation using the standard library's hmac,
+#             which skips python-jose's generic parsing and is noticeably faster.
+# Both produce and accept the same tokens.
+JWT_BACKEND = os.getenv("JWT_BACKEND", "jose")
+
+# Tokens we've already verified, keyed by a SHA-256 digest of the token.
+# Clients send the same token on every request, so we only check the signature once
+# and keep the result until the token's own "exp" time.
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+_verified_tokens = TTLCache(max_entries=TOKEN_CACHE_SIZE)
+# Revoked tokens (e.g. on logout), keyed by the token's "jti" claim (or its digest, for
+# tokens issued without one), each kept until the token would have expired anyway.
+# Unlike the caches there is no size cap: a revocation must not be forgotten while the
+# token still works.
+# - _revoked: this worker's denylist, key -> exp, pruned in expiry order
+# - with a Redis store (REDIS_URL), every revocation is also a Redis key that expires at
+#   the token's exp (SET ... EXAT), so all workers and replicas see it
+REVOKED_KEY_PREFIX = CACHE_KEY_PREFIX + "revoked:"
+_revoked = {}
+_revoked_expiry = []  # heap of (exp, key), to prune _revoked without scanning it
+_revocation_store = None
+# Extra checks that can reject a valid token, e.g. "this user was disabled".
+# Each one is called with the payload and returns True if the token should be rejected.
+_revocation_checks = []
+
+
+def _b64url_encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _b64url_decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def _native_encode(payload: dict) -> str:
+    """Sign an HS256 JWT with the standard library (same output format as python-jose)."""
+    claims = {
+        # JWTs store dates as seconds since the epoch.
+        k: calendar.timegm(v.utctimetuple()) if isinstance(v, datetime) else v
+        for k, v in payload.items()
+    }
+    header = _b64url_encode(json.dumps({"alg": ALGORITHM, "typ": "JWT"}, separators=(",", ":")).encode())
+    body = _b64url_encode(json.dumps(claims, separators=(",", ":")).encode())
+    signing_input = f"{header}.{body}".encode()
+    signature = hmac.new(SECRET_KEY.encode(), signing_input, hashlib.sha256).digest()
+    return f"{header}.{body}.{_b64url_encode(signature)}"
+
+
+def _native_decode(token: str):
+    """Verify an HS256 JWT with the standard library. Returns the payload or None."""
+    try:
+        header, body, signature = token.split(".")
+        if json.loads(_b64url_decode(header)).get("alg") != ALGORITHM:
+            return None
+        expected = hmac.new(SECRET_KEY.encode(), f"{header}.{body}".encode(), hashlib.sha256).digest()
+        if not hmac.compare_digest(expected, _b64url_decode(signature)):
+            return None
+        payload = json.loads(_b64url_decode(body))
+    except (ValueError, TypeError, AttributeError):
+        return None
+    if not isinstance(payload, dict):
+        return None
+    if "exp" in payload:
+        # Like python-jose, a token whose exp isn't a number is invalid, not a server error.
+        exp = payload["exp"]
+        if isinstance(exp, bool) or not isinstance(exp, (int, float)) or exp <= time.time():
+            return None
+    return payload
+
+
 def create_access_token(data: dict, expires_delta: timedelta = None):
     """
     Creates a signed JWT access token.
@@ -16,18 +103,148 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
     to_encode = data.copy()
     expire = datetime.utcnow() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
     to_encode.update({"exp": expire})  # Add expiration time to the payload.
+    # A unique ID, so the token can be revoked on its own (see revoke_token).
+    to_encode.setdefault("jti", uuid.uuid4().hex)
     # Return encoded JWT string (signed with our SECRET_KEY).
+    if JWT_BACKEND == "native":
+        return _native_encode(to_encode)
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
+
+def _verify_token(token: str):
+    """Check the token's signature and expiry with the configured backend (no caching)."""
+    if JWT_BACKEND == "native":
+        return _native_decode(token)
+    try:
+        return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+
+
+def _token_digest(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def _revocation_key(token: str, payload: dict) -> str:
+    jti = payload.get("jti")
+    return f"jti:{jti}" if isinstance(jti, str) and jti else f"sha256:{_token_digest(token)}"
+
+
+def _prune_revoked(now: float):
+    """Forget revocations of tokens that have expired by now (they're rejected anyway)."""
+    while _revoked_expiry and _revoked_expiry[0][0] <= now:
+        exp, key = heapq.heappop(_revoked_expiry)
+        if _revoked.get(key) == exp:
+            del _revoked[key]
+
+
+def _add_revoked(key: str, exp: float):
+    now = time.time()
+    _prune_revoked(now)
+    if exp > now and _revoked.get(key, 0) < exp:
+        _revoked[key] = exp
+        heapq.heappush(_revoked_expiry, (exp, key))
+
+
+def _is_revoked_locally(key: str) -> bool:
+    exp = _revoked.get(key)
+    return exp is not None and exp > time.time()
+
+
 def decode_access_token(token: str):
     """
     Decodes a JWT access token.
     - Returns the payload if token is valid and not expired.
-    - Returns None if the token is invalid or expired.
+    - Returns None if the token is invalid, expired or revoked.
+    Tokens we've already verified are answered from a cache until they expire.
+    Only this worker's denylist is checked; routes use verify_access_token(), which
+    also asks the shared store.
+    """
+    digest = _token_digest(token)
+    payload = _verified_tokens.get(digest)
+    if payload is None:
+        # If anything goes wrong (invalid, expired, wrong signature), this is None.
+        payload = _verify_token(token)
+        if payload is None:
+            return None
+        # Only cache tokens that expire, and only for as long as they're valid.
+        if "exp" in payload:
+            _verified_tokens.set(digest, payload, ttl=payload["exp"] - time.time())
+    if _is_revoked_locally(_revocation_key(token, payload)):
+        return None
+    if any(check(payload) for check in _revocation_checks):
+        return None
+    return payload
+
+
+async def verify_access_token(token: str):
     """
+    decode_access_token(), plus the shared denylist when there is one, so a token
+    revoked by another worker is rejected here too (one Redis EXISTS per request).
+    If Redis is unreachable, only this worker's denylist is used.
+    """
+    payload = decode_access_token(token)
+    if payload is None or _revocation_store is None:
+        return payload
+    key = _revocation_key(token, payload)
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        revoked = await _revocation_store.exists(REVOKED_KEY_PREFIX + key)
+    except RedisError as e:
+        logger.warning("revocation store unavailable", extra={"error": str(e)})
         return payload
-    except JWTError:
-        # If anything goes wrong (invalid, expired, wrong signature), return None.
+    if revoked:
+        # Remember it here, so the next request with this token doesn't need Redis.
+        _add_revoked(key, payload.get("exp", time.time() + ACCESS_TOKEN_EXPIRE_MINUTES * 60))
         return None
+    return payload
+
+
+async def revoke_token(token: str):
+    """
+    Reject this token from now on (e.g. when the user logs out), even though
+    its signature is still valid. The entry is kept until the token expires.
+    """
+    _verified_tokens.delete(_token_digest(token))
+    payload = _verify_token(token)
+    if payload is None:
+        return  # invalid or expired: already rejected
+    exp = payload.get("exp", time.time() + ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+    key = _revocation_key(token, payload)
+    _add_revoked(key, exp)
+    if _revocation_store is not None:
+        try:
+            await _revocation_store.set(REVOKED_KEY_PREFIX + key, 1, exat=int(exp) + 1)
+        except RedisError as e:
+            logger.warning("revocation not shared", extra={"error": str(e)})
+
+
+def add_revocation_check(check):
+    """
+    Register a function `check(payload) -> bool` that is run for every token,
+    cached or not. If it returns True the token is treated as invalid.
+    """
+    _revocation_checks.append(check)
+
+
+def use_revocation_store(client):
+    """Share revocations through this Redis client (or None for this worker only), e.g. a fakeredis one in tests."""
+    global _revocation_store
+    _revocation_store = client
+
+
+async def connect_revocation_store(url: str = REDIS_URL):
+    """Connect the shared denylist on startup, if a REDIS_URL is configured."""
+    if url:
+        use_revocation_store(redis.from_url(url))
+
+
+async def close_revocation_store():
+    """Close the Redis connection pool on shutdown."""
+    if _revocation_store is not None:
+        await _revocation_store.aclose()
+        use_revocation_store(None)
+
+
+def token_cache_stats() -> dict:
+    """Hit/miss counters and size of the verified-token cache, and how many revocations this worker holds."""
+    return {**_verified_tokens.stats(), "revoked": len(_revoked)}
@@ -0,0 +1,54 @@
+import os
+from dataclasses import dataclass, fields
+from typing import Optional
+
+from dotenv import load_dotenv
+
+# Loads environment variables from the .env file into the app's environment.
+load_dotenv()
+
+
+@dataclass(frozen=True)
+class Settings:
+    """
+    App settings, read once from the environment (or .env).
+    Every field is set by the upper-case variable of the same name,
+    e.g. MONGO_MAX_POOL_SIZE=200 sets mongo_max_pool_size.
+    """
+    mongo_uri: Optional[str] = None
+    database_name: Optional[str] = None
+    # Connection pool: at most this many connections per server, and keep this many open when idle.
+    mongo_max_pool_size: int = 100
+    mongo_min_pool_size: int = 0
+    # How long (ms) a request waits for a free connection before failing. Unset: wait as long as it takes.
+    mongo_wait_queue_timeout_ms: Optional[int] = None
+    # Wire compression, in order of preference. The server picks the first one it supports;
+    # compressors whose Python package isn't installed are skipped with a warning.
+    mongo_compressors: str = "zstd,snappy"
+    # Where reads that can tolerate replication lag (room exports, nearby search, rooms
+    # embedded in applications) send their queries: primary, primaryPreferred, secondary,
+    # secondaryPreferred or nearest. Anything else a secondary serves may be missing a
+    # write made a moment ago, so the default keeps read-your-writes.
+    mongo_read_preference: str = "primary"
+    # Don't read from a secondary lagging more than this (seconds, at least 90). Unset: no limit.
+    mongo_max_staleness_seconds: Optional[int] = None
+
+    @classmethod
+    def from_env(cls) -> "Settings":
+        values = {}
+        for field in fields(cls):
+            name = field.name.upper()
+            raw = os.getenv(name)
+            if raw is None or raw == "":
+                continue
+            if field.type in (int, Optional[int]):
+                try:
+                    values[field.name] = int(raw)
+                except ValueError:
+                    raise ValueError(f"{name} must be a whole number, got {raw!r}")
+            else:
+                values[field.name] = raw
+        return cls(**values)
+
+
+settings = Settings.from_env()
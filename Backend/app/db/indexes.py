@@ -0,0 +1,85 @@
+from pymongo import ASCENDING, DESCENDING, GEOSPHERE, IndexModel
+from pymongo.errors import OperationFailure
+
+# Every index the app relies on, per collection. Add new ones here and they get
+# created on startup (and by `python -m app.scripts.ensure_indexes`).
+INDEXES = {
+    "users": [
+        # Login/registration look users up by email, and emails must be unique.
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+    ],
+    "applications": [
+        # The duplicate-application check (user_email + room_id + status).
+        IndexModel(
+            [("user_email", ASCENDING), ("room_id", ASCENDING), ("status", ASCENDING)],
+            name="user_room_status",
+        ),
+        # "My applications", newest first, one page at a time (_id doubles as the cursor).
+        IndexModel([("user_email", ASCENDING), ("_id", DESCENDING)], name="user_newest"),
+    ],
+    "rooms": [
+        # Price filters and the price_asc/price_desc listing sorts (_id breaks ties for cursors).
+        IndexModel([("price_per_month", ASCENDING), ("_id", ASCENDING)], name="price_per_month_id"),
+        # Postcode prefix filter on the listing (matches the normalised copy, see room_postcodes.py).
+        IndexModel([("postcode_key", ASCENDING)], name="postcode_key"),
+        # GeoJSON point of each room, for $geoNear in /rooms/nearby.
+        IndexModel([("geo", GEOSPHERE)], name="geo_2dsphere"),
+        # Rooms whose campus distance is still to be computed (only those are in the index).
+        IndexModel([("location.pending", ASCENDING)], name="location_pending",
+                   partialFilterExpression={"location.pending": True}),
+    ],
+}
+
+# Index options we compare when checking for drift (the key order is always compared).
+_COMPARED_OPTIONS = ("unique", "sparse", "expireAfterSeconds", "partialFilterExpression")
+
+
+def _spec(document: dict) -> dict:
+    """Reduce an index description to the parts that matter for comparing two indexes."""
+    key = document["key"]
+    # IndexModel gives us a dict, index_information() a list of (field, direction) pairs.
+    spec = {"key": list(key.items()) if isinstance(key, dict) else [tuple(pair) for pair in key]}
+    for option in _COMPARED_OPTIONS:
+        if document.get(option):
+            spec[option] = document[option]
+    return spec
+
+
+async def ensure_indexes(db, create: bool = True) -> list:
+    """
+    Make sure every index in INDEXES exists. Safe to run any number of times.
+
+    Returns a report with one entry per index:
+      - "exists":    already there and matching
+      - "created":   was missing and has been built
+      - "missing":   missing (only when create=False)
+      - "drift":     an index with that name exists but with different keys/options
+      - "failed":    the build failed (e.g. duplicate emails block the unique index)
+      - "unmanaged": exists in MongoDB but isn't in INDEXES
+    """
+    report = []
+    for collection_name, models in INDEXES.items():
+        collection = db[collection_name]
+        existing = await collection.index_information()
+        wanted_names = set()
+        for model in models:
+            wanted = model.document
+            name = wanted["name"]
+            wanted_names.add(name)
+            entry = {"collection": collection_name, "index": name}
+            if name in existing:
+                entry["status"] = "exists" if _spec(existing[name]) == _spec(wanted) else "drift"
+            elif not create:
+                entry["status"] = "missing"
+            else:
+                try:
+                    await collection.create_indexes([model])
+                    entry["status"] = "created"
+                except OperationFailure as e:
+                    entry["status"] = "failed"
+                    entry["error"] = str(e)
+            report.append(entry)
+        for name in existing:
+            if name != "_id_" and name not in wanted_names:
+                report.append({"collection": collection_name, "index": name, "status": "unmanaged"})
+    return report
@@ -1,20 +1,111 @@
-import os
 from motor.motor_asyncio import AsyncIOMotorClient
-from dotenv import load_dotenv
+from pymongo.read_preferences import Nearest, Primary, PrimaryPreferred, Secondary, SecondaryPreferred
 
-# Loads environment variables from the .env file into the app's environment.
-load_dotenv()
-
-# Grab MongoDB URI and database name from environment variables.
-MONGO_URI = os.getenv("MONGO_URI")
-DATABASE_NAME = os.getenv("DATABASE_NAME")
+from app.config import settings
+from app.utils.metrics import MongoCommandMetrics, MongoPoolMetrics
 
 # It's important to check that both are set, otherwise the app can't connect to MongoDB.
-if not MONGO_URI or not DATABASE_NAME:
+if not settings.mongo_uri or not settings.database_name:
     raise Exception("Missing MONGO_URI or DATABASE_NAME in environment variables!")
 
-# Create the async MongoDB client.
-client = AsyncIOMotorClient(MONGO_URI)
+MONGO_URI = settings.mongo_uri
+DATABASE_NAME = settings.database_name
+
+READ_PREFERENCES = {
+    "primary": Primary,
+    "primaryPreferred": PrimaryPreferred,
+    "secondary": Secondary,
+    "secondaryPreferred": SecondaryPreferred,
+    "nearest": Nearest,
+}
+
+# The shared client, created by connect_mongo() on app startup
+# (or on first use, e.g. in scripts) and closed by close_mongo() on shutdown.
+_client = None
+_databases = {}
+
+
+def _read_preference(name: str, max_staleness):
+    if name not in READ_PREFERENCES:
+        raise ValueError(f"Unknown MONGO_READ_PREFERENCE {name!r}, expected one of: {', '.join(READ_PREFERENCES)}")
+    if name == "primary":
+        return Primary()
+    return READ_PREFERENCES[name](max_staleness=max_staleness if max_staleness is not None else -1)
+
+
+def create_client(config=settings) -> AsyncIOMotorClient:
+    """Build a Motor client with the pool, compression and monitoring settings."""
+    options = {
+        "maxPoolSize": config.mongo_max_pool_size,
+        "minPoolSize": config.mongo_min_pool_size,
+        # The listeners time every command and pool checkout so they show up on /metrics.
+        "event_listeners": [MongoCommandMetrics(), MongoPoolMetrics()],
+    }
+    if config.mongo_wait_queue_timeout_ms is not None:
+        options["waitQueueTimeoutMS"] = config.mongo_wait_queue_timeout_ms
+    if config.mongo_compressors:
+        options["compressors"] = config.mongo_compressors
+    return AsyncIOMotorClient(config.mongo_uri, **options)
+
+
+def get_client() -> AsyncIOMotorClient:
+    global _client
+    if _client is None:
+        _client = create_client()
+        _databases["primary"] = _client[DATABASE_NAME]
+        _databases["read"] = _client.get_database(
+            DATABASE_NAME,
+            read_preference=_read_preference(settings.mongo_read_preference, settings.mongo_max_staleness_seconds),
+        )
+    return _client
+
+
+def set_client(client):
+    """Use a specific client, e.g. a local MongoDB stand-in for tests and benchmarks."""
+    global _client
+    _client = client
+    _databases["primary"] = _databases["read"] = client[DATABASE_NAME]
+
+
+def get_database(read_only: bool = False):
+    """The app database. read_only=True gives the handle that follows MONGO_READ_PREFERENCE."""
+    get_client()
+    return _databases["read" if read_only else "primary"]
+
+
+async def connect_mongo():
+    """Create the client. Called on app startup."""
+    get_client()
+
+
+async def close_mongo():
+    """Close the client and its connection pool. Called on app shutdown."""
+    global _client
+    if _client is not None:
+        _client.close()
+        _client = None
+        _databases.clear()
+
+
+class _Database:
+    """
+    Stands in for the Motor database, so modules can import `db` at import time
+    while the client itself is only created on startup (and recreated after a restart).
+    """
+
+    def __init__(self, read_only: bool = False):
+        self._read_only = read_only
+
+    def __getattr__(self, name):
+        return getattr(get_database(self._read_only), name)
+
+    def __getitem__(self, name):
+        return get_database(self._read_only)[name]
+
 
 # This 'db' object is how the rest of the app will talk to the database.
-db = client[DATABASE_NAME]
+db = _Database()
+# Same database, for read-only queries that can be served by a secondary (e.g. room exports).
+# A room written a moment ago may not be visible here yet, so never use it for reads whose
+# result is cached (the response cache files a body under the version current at read time).
+read_db = _Database(read_only=True)
@@ -1,20 +1,87 @@
-from fastapi import FastAPI, Depends
+import time
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 
-from app.db.mongodb import db
+from app.db.mongodb import db, connect_mongo, close_mongo
+from app.db.indexes import ensure_indexes
 from app.api.users import router as user_router
 from app.api.rooms import router as rooms_router
 from app.api.applications import router as applications_router
 from app.api.external_services import router as external_router   # Import the external services router
-from app.auth.dependencies import get_current_user
+from app.auth.dependencies import get_current_user, shutdown_password_pool, password_pool_stats
+from app.auth.jwt_handler import token_cache_stats, connect_revocation_store, close_revocation_store
+from app.services.admission import AdmissionMiddleware, connect_rate_limiter, close_rate_limiter
+from app.services.cache import start_cache_sweeper, stop_cache_sweeper, connect_redis_cache, close_redis_cache, cache_stats
+from app.services.http_client import start_http_client, close_http_client
+from app.services.response_cache import response_cache_stats, connect_version_store, close_version_store
+from app.services.campus import load_campuses
+from app.services.geocode_warmup import warm_geocode_cache, save_geocode_snapshot
+from app.services.room_location import start_location_workers, stop_location_workers
+from app.services.room_postcodes import backfill_postcode_keys
+from app.services.geo_index import load_geo_index
+from app.utils.logger import get_logger
+from app.utils.responses import FastJSONResponse
+from app.utils.metrics import (
+    add_collector, render_metrics,
+    http_requests_total, http_request_duration_seconds, http_requests_in_flight,
+)
+
+logger = get_logger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Runs once when the app starts up and once when it shuts down.
+    Shared resources (MongoDB and HTTP client pools, Redis) and background jobs (cache sweeper, room location workers) are set up and torn down here.
+    """
+    await connect_mongo()
+    # Create any missing MongoDB indexes (already-existing ones are left alone).
+    for entry in await ensure_indexes(db):
+        if entry["status"] != "exists":
+            logger.warning("index not in sync", extra=entry)
+    # Rooms stored before postcodes were normalised get their postcode_key (a no-op once done).
+    await backfill_postcode_keys()
+    await start_http_client()
+    await connect_redis_cache()
+    await connect_rate_limiter()
+    await connect_revocation_store()
+    await connect_version_store()
+    start_cache_sweeper()
+    # Resolve campus coordinates once, and preload the geocode cache with the
+    # postcodes that were asked for most before the last shutdown.
+    await load_campuses()
+    await warm_geocode_cache()
+    await load_geo_index()
+    await start_location_workers()
+    yield
+    await stop_location_workers()
+    await stop_cache_sweeper()
+    await save_geocode_snapshot()
+    await close_rate_limiter()
+    await close_revocation_store()
+    await close_version_store()
+    await close_redis_cache()
+    await close_http_client()
+    shutdown_password_pool()
+    await close_mongo()
 
 # Initialize the FastAPI app with some basic metadata.
 app = FastAPI(
     title="Global Dorm API",
     description="Accommodation finder and integration API for international students",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    # orjson for every JSON response (see app/utils/responses.py).
+    default_response_class=FastJSONResponse,
 )
 
+# Per-route concurrency limits and per-user/per-IP rate limits (see app/services/admission.py).
+# Added before CORS so its 429/503 responses still get the CORS headers the browser needs to read them.
+app.add_middleware(AdmissionMiddleware)
+
 # Enable CORS so that the frontend (like React) can make API calls.
 # In production, you should specify the real frontend domain instead of ["*"]!
 app.add_middleware(
@@ -25,6 +92,55 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """
+    Measure every request: latency per route, status code counts and how many are in flight.
+    Routes are labelled by their template (/rooms/{room_id}), not the actual URL,
+    so the number of metric series stays small.
+    """
+    method = request.method
+    http_requests_in_flight.inc(method=method)
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        route_path = route.path if route is not None else "unmatched"
+        http_requests_in_flight.dec(method=method)
+        http_request_duration_seconds.observe(time.perf_counter() - start, method=method, route=route_path)
+        http_requests_total.inc(method=method, route=route_path, status=str(status_code))
+
+def _collect_app_stats():
+    """Cache, token cache and password pool counters, read when /metrics is scraped."""
+    samples = []
+    for cache_name, stats in (("app", cache_stats()), ("jwt", token_cache_stats()), ("responses", response_cache_stats())):
+        labels = {"cache": cache_name}
+        samples += [
+            ("cache_hits_total", "counter", "Cache hits.", labels, stats["hits"]),
+            ("cache_misses_total", "counter", "Cache misses.", labels, stats["misses"]),
+            ("cache_hit_ratio", "gauge", "Cache hits / lookups since startup.", labels, stats["hit_ratio"]),
+            ("cache_evictions_total", "counter", "Entries evicted to stay within budget.", labels, stats["evictions"]),
+            ("cache_entries", "gauge", "Entries currently cached.", labels, stats["entries"]),
+        ]
+    app_stats = cache_stats()
+    samples += [
+        ("cache_shared_hits_total", "counter", "Hits served by the shared Redis tier.", {}, app_stats["l2_hits"]),
+        ("cache_shared_errors_total", "counter", "Errors talking to the shared Redis tier.", {}, app_stats["l2_errors"]),
+    ]
+    pool = password_pool_stats()
+    samples += [
+        ("password_pool_pending", "gauge", "bcrypt jobs running or waiting.", {}, pool["pending"]),
+        ("password_pool_queued", "gauge", "bcrypt jobs waiting for a thread.", {}, pool["queued"]),
+        ("password_pool_rejected_total", "counter", "bcrypt jobs refused because the pool was full.", {}, pool["rejected"]),
+    ]
+    return samples
+
+add_collector(_collect_app_stats)
+
 # Register all the routers for different parts of the API.
 app.include_router(user_router)           # Handles user registration/login
 app.include_router(rooms_router)          # Handles room listings CRUD
@@ -48,6 +164,14 @@ async def db_status():
     collections = await db.list_collection_names()
     return {"ok": True, "collections": collections}
 
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def metrics():
+    """
+    Prometheus-format metrics: request latency/status per route, external
+    service calls, MongoDB commands, cache hit ratios and the password pool.
+    """
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 @app.get("/protected")
 async def protected_route(current_user: str = Depends(get_current_user)):
     """
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 
 # This model is used when a user submits an application for a room.
@@ -19,6 +19,14 @@ class ApplicationInDB(BaseModel):
     status: str      # Current status of the application.
     applied_at: datetime  # When the application was created.
 
+# The few room fields embedded in an application with ?expand=room.
+class RoomSummary(BaseModel):
+    id: str
+    title: str
+    address: str
+    postcode: str
+    price_per_month: float
+
 # Public model for API responses (what you send to the frontend).
 class ApplicationPublic(BaseModel):
     id: str
@@ -26,3 +34,10 @@ class ApplicationPublic(BaseModel):
     room_id: str
     status: str
     applied_at: datetime
+    # Only filled in with ?expand=room (and None if the room has since been deleted).
+    room: Optional[RoomSummary] = None
+
+# One page of the user's applications, newest first, plus a token for the next page.
+class ApplicationPage(BaseModel):
+    items: List[ApplicationPublic]
+    next_cursor: Optional[str] = None
@@ -0,0 +1,18 @@
+from pydantic import BaseModel, Field
+from typing import List, Optional
+
+# This model is used when a client wants to geocode many postcodes in one request.
+class BulkGeocodeRequest(BaseModel):
+    postcodes: List[str] = Field(..., min_length=1, max_length=2000)  # Postcodes in any spacing/case
+
+# The result for a single postcode inside a bulk response.
+# If it couldn't be geocoded, latitude/longitude are empty and "error" says why.
+class GeocodeResult(BaseModel):
+    postcode: str  # Normalised postcode (no spaces, upper case)
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    error: Optional[str] = None
+
+# What the bulk geocode endpoint returns: one result per unique postcode.
+class BulkGeocodeResponse(BaseModel):
+    results: List[GeocodeResult]
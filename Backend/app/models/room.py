@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import List, Optional
 
 # This base class has all the common fields every room should have.
 class RoomBase(BaseModel):
@@ -28,3 +28,57 @@ class RoomInDB(RoomBase):
 # What the frontend and API will actually see (no Mongo-specific stuff, just a nice "id" field).
 class RoomPublic(RoomBase):
     id: str
+
+# A room in the "near me" search, with its straight-line distance from the searched point.
+class NearbyRoom(RoomPublic):
+    distance_meters: float
+
+# One page of nearby rooms, nearest first.
+class NearbyRoomPage(BaseModel):
+    items: List[NearbyRoom]
+    next_cursor: Optional[str] = None
+
+# One page of the room listing, plus a token to fetch the next page (None on the last page).
+class RoomPage(BaseModel):
+    items: List[RoomPublic]
+    next_cursor: Optional[str] = None
+
+# One row of a bulk import that couldn't be stored, and why.
+class BulkRowError(BaseModel):
+    row: int
+    error: str
+
+# Result of POST /rooms/bulk.
+class BulkImportReport(BaseModel):
+    inserted: int
+    failed: int
+    errors: List[BulkRowError]
+    errors_truncated: bool = False  # True if there were more errors than we list
+    aborted: Optional[str] = None  # Set if the upload was stopped part-way (rows before it were kept)
+
+# A new monthly price for one room, as sent to PATCH /rooms/bulk.
+class RoomPriceUpdate(BaseModel):
+    id: str
+    price_per_month: float
+
+class BulkPriceUpdate(BaseModel):
+    updates: List[RoomPriceUpdate]
+
+# A room ID from a bulk update that couldn't be applied, and why.
+class BulkUpdateError(BaseModel):
+    id: str
+    error: str
+
+# Result of PATCH /rooms/bulk.
+class BulkPriceUpdateReport(BaseModel):
+    matched: int
+    modified: int
+    errors: List[BulkUpdateError]
+
+# How many applications a room has, per status (GET /rooms/{room_id}/stats and GET /rooms/stats).
+class RoomStats(BaseModel):
+    room_id: str
+    applied: int
+    cancelled: int
+    approved: int
+    total: int  # All applications, whatever their status
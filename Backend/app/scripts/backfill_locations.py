@@ -0,0 +1,29 @@
+"""
+Compute and store geolocation + campus distance for rooms that don't have one yet.
+
+Usage (from the Backend/ folder):
+    python -m app.scripts.backfill_locations --batch-size 100 --concurrency 8
+    python -m app.scripts.backfill_locations --all   # recompute every room
+"""
+import argparse
+import asyncio
+
+from app.services.http_client import close_http_client
+from app.services.room_location import backfill_locations
+
+
+async def main(batch_size: int, concurrency: int, recompute_all: bool):
+    try:
+        updated = await backfill_locations(batch_size, concurrency, recompute_all)
+        print(f"Updated locations for {updated} rooms.")
+    finally:
+        await close_http_client()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill room locations and campus distances.")
+    parser.add_argument("--batch-size", type=int, default=100, help="Rooms geocoded per bulk lookup")
+    parser.add_argument("--concurrency", type=int, default=4, help="OSRM requests in flight at once")
+    parser.add_argument("--all", action="store_true", help="Recompute rooms that already have a location")
+    args = parser.parse_args()
+    asyncio.run(main(args.batch_size, args.concurrency, args.all))
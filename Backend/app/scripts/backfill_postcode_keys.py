@@ -0,0 +1,23 @@
+"""
+Give rooms stored before postcodes were normalised their postcode_key, which the
+listing's postcode filter matches on. The app also does this on startup.
+
+Usage (from the Backend/ folder):
+    python -m app.scripts.backfill_postcode_keys --batch-size 1000
+"""
+import argparse
+import asyncio
+
+from app.services.room_postcodes import backfill_postcode_keys
+
+
+async def main(batch_size: int):
+    updated = await backfill_postcode_keys(batch_size)
+    print(f"Added postcode keys to {updated} rooms.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill normalised room postcodes.")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Rooms updated per bulk_write")
+    args = parser.parse_args()
+    asyncio.run(main(args.batch_size))
@@ -0,0 +1,22 @@
+"""
+Compile a postcode CSV (e.g. the ONS Postcode Directory) into the gazetteer
+file used for offline geocoding.
+
+Usage (from the Backend/ folder):
+    python -m app.scripts.build_gazetteer ONSPD.csv data/gazetteer.bin
+Then set GAZETTEER_PATH=data/gazetteer.bin for the API.
+"""
+import argparse
+
+from app.services.gazetteer import build_gazetteer, Gazetteer
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the local postcode gazetteer.")
+    parser.add_argument("csv_path", help="Input CSV with postcode/lat/long columns")
+    parser.add_argument("out_path", help="Where to write the compiled index")
+    args = parser.parse_args()
+    count = build_gazetteer(args.csv_path, args.out_path)
+    gazetteer = Gazetteer(args.out_path)
+    print(f"Wrote {count} postcodes to {args.out_path} ({len(gazetteer)} readable).")
+    gazetteer.close()
@@ -0,0 +1,31 @@
+"""
+Create the MongoDB indexes listed in app/db/indexes.py and report their status.
+
+Usage (from the Backend/ folder):
+    python -m app.scripts.ensure_indexes          # create anything missing
+    python -m app.scripts.ensure_indexes --check  # only report (exits 1 on missing/drift)
+"""
+import argparse
+import asyncio
+import sys
+
+from app.db.indexes import ensure_indexes
+from app.db.mongodb import db
+
+
+async def main(check_only: bool) -> int:
+    report = await ensure_indexes(db, create=not check_only)
+    for entry in report:
+        line = f"{entry['collection']}.{entry['index']}: {entry['status']}"
+        if "error" in entry:
+            line += f" ({entry['error']})"
+        print(line)
+    problems = [e for e in report if e["status"] in ("missing", "drift", "failed")]
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create and check MongoDB indexes.")
+    parser.add_argument("--check", action="store_true", help="Don't create anything, just report")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main(args.check)))
@@ -0,0 +1,27 @@
+"""
+Rebuild the per-room application counters (room_stats) from the applications collection.
+
+Usage (from the Backend/ folder):
+    python -m app.scripts.reconcile_room_stats
+    python -m app.scripts.reconcile_room_stats --batch-size 500
+"""
+import argparse
+import asyncio
+
+from app.db.mongodb import close_mongo
+from app.services.room_stats import reconcile_room_stats
+
+
+async def main(batch_size: int):
+    try:
+        report = await reconcile_room_stats(batch_size)
+        print(f"Checked {report['rooms']} rooms: corrected {report['corrected']}, removed {report['removed']}.")
+    finally:
+        await close_mongo()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild per-room application counters.")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Rooms compared and fixed per round trip")
+    args = parser.parse_args()
+    asyncio.run(main(args.batch_size))
@@ -0,0 +1,375 @@
+import asyncio
+import json
+import math
+import os
+import time
+from dataclasses import dataclass, fields, replace
+
+import redis.asyncio as redis
+from redis.exceptions import RedisError
+from starlette.responses import JSONResponse
+from starlette.routing import compile_path
+
+from app.auth.jwt_handler import decode_access_token
+from app.services.cache import REDIS_URL, CACHE_KEY_PREFIX, TTLCache
+from app.utils.logger import get_logger
+from app.utils.metrics import Counter, Gauge, Histogram, add_collector
+
+logger = get_logger(__name__)
+
+# Admission control: per-route concurrency limits with a bounded wait queue, and
+# token-bucket rate limits per user (JWT "sub") and per client IP.
+# ADMISSION_CONTROL=off turns all of it off (e.g. for in-process benchmarks).
+ADMISSION_CONTROL = os.getenv("ADMISSION_CONTROL", "on").lower() not in ("off", "false", "0")
+# Where rate-limit buckets live: "memory" (per worker) or "redis" (shared by every
+# worker and replica, needs REDIS_URL). If Redis fails we fall back to memory.
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+# Most buckets kept in memory; idle buckets expire once they'd be full again anyway.
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+# Take the client IP from X-Forwarded-For. Only turn on behind a proxy that sets it.
+TRUST_FORWARDED_FOR = os.getenv("TRUST_FORWARDED_FOR", "false").lower() in ("1", "true", "yes")
+
+
+@dataclass(frozen=True)
+class RouteLimit:
+    """Limits of one route. 0 means "no limit" for every field."""
+    max_concurrency: int = 0   # requests handled at once
+    max_queue: int = 0         # requests allowed to wait for a slot; more are turned away with 503
+    queue_timeout: float = 1.0 # seconds a request waits for a slot before giving up with 503
+    user_rate: float = 0       # requests per second per user (needs a valid token)
+    user_burst: int = 0        # bucket size, i.e. how many requests a user can make in a burst
+    ip_rate: float = 0         # requests per second per client IP
+    ip_burst: int = 0
+
+
+# Limits for the routes that can hurt everyone else: bcrypt-heavy auth, calls that fan
+# out to postcodes.io/OSRM, and bulk uploads. Keyed like the route ("METHOD /path").
+DEFAULT_ROUTE_LIMITS = {
+    "POST /users/login": RouteLimit(max_concurrency=8, max_queue=32, ip_rate=2, ip_burst=20),
+    "POST /users/register": RouteLimit(max_concurrency=4, max_queue=16, ip_rate=0.5, ip_burst=10),
+    "GET /external/room-distance": RouteLimit(max_concurrency=32, max_queue=64, ip_rate=10, ip_burst=40),
+    "GET /external/geocode": RouteLimit(max_concurrency=32, max_queue=64, ip_rate=10, ip_burst=40),
+    "POST /external/geocode/bulk": RouteLimit(max_concurrency=4, max_queue=8, ip_rate=1, ip_burst=5),
+    "POST /rooms/bulk": RouteLimit(max_concurrency=2, max_queue=4, queue_timeout=5, user_rate=0.2, user_burst=2),
+    "PATCH /rooms/bulk": RouteLimit(max_concurrency=4, max_queue=8, user_rate=1, user_burst=5),
+    "POST /applications/": RouteLimit(user_rate=1, user_burst=10),
+}
+
+
+def parse_route_limits(raw: str, defaults: dict = DEFAULT_ROUTE_LIMITS) -> dict:
+    """
+    Apply ROUTE_LIMITS overrides (JSON) to the defaults, e.g.
+        {"POST /users/login": {"max_concurrency": 4}, "GET /rooms/": {"ip_rate": 50, "ip_burst": 100}}
+    Fields that aren't given keep their default; routes that aren't listed keep theirs.
+    """
+    limits = dict(defaults)
+    if not raw:
+        return limits
+    names = {field.name for field in fields(RouteLimit)}
+    for route, values in json.loads(raw).items():
+        unknown = set(values) - names
+        if unknown:
+            raise ValueError(f"ROUTE_LIMITS[{route!r}]: unknown setting(s) {', '.join(sorted(unknown))}")
+        limits[route] = replace(limits.get(route, RouteLimit()), **values)
+    return limits
+
+
+ROUTE_LIMITS = parse_route_limits(os.getenv("ROUTE_LIMITS", ""))
+
+admission_requests_total = Counter(
+    "admission_requests_total", "Requests on rate-limited routes, by outcome.", ("method", "route", "outcome"))
+admission_in_flight = Gauge(
+    "admission_in_flight", "Requests holding a concurrency slot.", ("method", "route"))
+admission_queued = Gauge(
+    "admission_queued", "Requests waiting for a concurrency slot.", ("method", "route"))
+admission_queue_wait_seconds = Histogram(
+    "admission_queue_wait_seconds", "Time spent waiting for a concurrency slot.", ("method", "route"))
+rate_limit_backend_errors_total = Counter(
+    "rate_limit_backend_errors_total", "Errors from the shared rate-limit backend (memory was used instead).")
+
+
+def _labels(route_key: str) -> dict:
+    method, _, path = route_key.partition(" ")
+    return {"method": method, "route": path}
+
+
+class Rejected(Exception):
+    """The request is turned away before reaching the route."""
+
+    def __init__(self, status_code: int, outcome: str, detail: str, retry_after: float):
+        self.status_code = status_code
+        self.outcome = outcome
+        self.detail = detail
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class ConcurrencyLimiter:
+    """
+    At most `max_concurrency` requests at once. Up to `max_queue` more wait (at most
+    `queue_timeout` seconds) for a slot; anything past that is shed straight away,
+    so a burst can't pile up behind a slow route and time out anyway.
+    """
+
+    def __init__(self, route_key: str, limit: RouteLimit):
+        self.labels = _labels(route_key)
+        self.limit = limit
+        self.active = 0
+        self.waiting = 0
+        self._semaphore = asyncio.Semaphore(limit.max_concurrency)
+
+    async def acquire(self):
+        if self.active < self.limit.max_concurrency and not self.waiting:
+            await self._semaphore.acquire()
+        else:
+            if self.waiting >= self.limit.max_queue:
+                raise Rejected(503, "shed_queue_full", "Server busy, please try again", self.limit.queue_timeout)
+            self.waiting += 1
+            admission_queued.inc(**self.labels)
+            start = time.perf_counter()
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.limit.queue_timeout)
+            except asyncio.TimeoutError:
+                raise Rejected(503, "shed_timeout", "Server busy, please try again", self.limit.queue_timeout)
+            finally:
+                self.waiting -= 1
+                admission_queued.dec(**self.labels)
+                admission_queue_wait_seconds.observe(time.perf_counter() - start, **self.labels)
+        self.active += 1
+        admission_in_flight.inc(**self.labels)
+
+    def release(self):
+        self.active -= 1
+        admission_in_flight.dec(**self.labels)
+        self._semaphore.release()
+
+
+class MemoryRateLimiter:
+    """Token buckets kept in this worker's memory."""
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        # key -> (tokens, updated_at)
+        self._buckets = TTLCache(max_entries=max_keys, default_ttl=60)
+
+    async def take(self, key: str, rate: float, burst: int) -> float:
+        """Take a token from the bucket. Returns 0 if allowed, else the seconds until one is available."""
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        tokens, updated = bucket if bucket is not None else (burst, now)
+        tokens = min(burst, tokens + (now - updated) * rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / rate
+        # Once the bucket would be full again we can forget it.
+        self._buckets.set(key, (tokens, now), ttl=math.ceil(burst / rate) + 1)
+        return wait
+
+    def stats(self) -> dict:
+        return self._buckets.stats()
+
+    async def close(self):
+        pass
+
+
+# Refill and take a token in one atomic step on the Redis server, using its clock
+# so every worker agrees. Returns the wait in seconds as a string (0 if allowed).
+_TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(bucket[1]) or burst
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+return tostring(wait)
+"""
+
+
+class RedisRateLimiter:
+    """
+    Token buckets shared by every worker and replica through Redis.
+    If Redis is unreachable, the worker's own memory buckets are used instead.
+    """
+
+    def __init__(self, client, prefix: str = CACHE_KEY_PREFIX + "ratelimit:"):
+        self.client = client
+        self.prefix = prefix
+        self.fallback = MemoryRateLimiter()
+        self._script = client.register_script(_TOKEN_BUCKET_SCRIPT)
+
+    async def take(self, key: str, rate: float, burst: int) -> float:
+        try:
+            return float(await self._script(keys=[self.prefix + key], args=[rate, burst]))
+        except RedisError:
+            rate_limit_backend_errors_total.inc()
+            return await self.fallback.take(key, rate, burst)
+
+    def stats(self) -> dict:
+        return self.fallback.stats()
+
+    async def close(self):
+        await self.client.aclose()
+
+
+_rate_limiter = MemoryRateLimiter()
+_limiters = {}
+
+
+def get_rate_limiter():
+    return _rate_limiter
+
+
+def use_rate_limiter(limiter):
+    """Swap the rate-limit backend (tests can pass a RedisRateLimiter on fakeredis)."""
+    global _rate_limiter
+    _rate_limiter = limiter
+
+
+async def connect_rate_limiter(backend: str = RATE_LIMIT_BACKEND, url: str = REDIS_URL):
+    """Use Redis for the buckets if RATE_LIMIT_BACKEND=redis. Called on app startup."""
+    if backend == "redis":
+        if not url:
+            logger.warning("RATE_LIMIT_BACKEND=redis but REDIS_URL is not set, using memory")
+            return
+        use_rate_limiter(RedisRateLimiter(redis.from_url(url)))
+
+
+async def close_rate_limiter():
+    """Close the Redis connection, if any. Called on app shutdown."""
+    await _rate_limiter.close()
+    use_rate_limiter(MemoryRateLimiter())
+
+
+def _client_ip(scope) -> str:
+    if TRUST_FORWARDED_FOR:
+        for name, value in scope["headers"]:
+            if name == b"x-forwarded-for":
+                return value.decode("latin-1").split(",")[0].strip()
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+def _user(scope):
+    """The JWT subject of the request, or None if it has no valid token (the route will deal with that)."""
+    for name, value in scope["headers"]:
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() == "bearer" and token:
+                # Verified tokens are cached, so the route's own check is free afterwards.
+                payload = decode_access_token(token)
+                return payload.get("sub") if payload else None
+    return None
+
+
+def _route_table(app) -> list:
+    """
+    (path regex, methods, path template) of every documented route, in the order they
+    were declared, so we can tell which route a request is for before the router runs.
+    Built from the OpenAPI paths on first use.
+    """
+    table = getattr(app.state, "admission_routes", None)
+    if table is None:
+        table = []
+        for template, operations in app.openapi()["paths"].items():
+            regex, _, _ = compile_path(template)
+            table.append((regex, {method.upper() for method in operations}, template))
+        app.state.admission_routes = table
+    return table
+
+
+def _match_route(scope):
+    """"METHOD /template" of the route that will handle this request, or None."""
+    method = scope["method"]
+    for regex, methods, template in _route_table(scope["app"]):
+        # Like the router, a path match with the wrong method keeps looking
+        # (POST /rooms/bulk and GET /rooms/{room_id} both match /rooms/bulk).
+        if method in methods and regex.match(scope["path"]):
+            return f"{method} {template}"
+    return None
+
+
+async def admit(route_key: str, limit: RouteLimit, scope):
+    """Apply the rate limits of a route. Raises Rejected with a 429 if a bucket is empty."""
+    limiter = get_rate_limiter()
+    if limit.user_rate:
+        user = _user(scope)
+        if user is not None:
+            wait = await limiter.take(f"user:{route_key}:{user}", limit.user_rate, limit.user_burst or 1)
+            if wait:
+                raise Rejected(429, "rate_limited_user", "Too many requests, slow down", wait)
+    if limit.ip_rate:
+        wait = await limiter.take(f"ip:{route_key}:{_client_ip(scope)}", limit.ip_rate, limit.ip_burst or 1)
+        if wait:
+            raise Rejected(429, "rate_limited_ip", "Too many requests, slow down", wait)
+
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware applying ROUTE_LIMITS before a request reaches its route.
+    Rate limits are checked first (429), then the request takes a concurrency slot
+    (503 if the route's queue is full or the wait times out). Both come with Retry-After.
+    The slot is held until the response has been sent, streaming included.
+    """
+
+    def __init__(self, app, limits: dict = None, enabled: bool = ADMISSION_CONTROL):
+        self.app = app
+        self.limits = ROUTE_LIMITS if limits is None else limits
+        self.enabled = enabled
+
+    async def __call__(self, scope, receive, send):
+        if not self.enabled or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        route_key = _match_route(scope)
+        limit = self.limits.get(route_key)
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        limiter = None
+        try:
+            await admit(route_key, limit, scope)
+            if limit.max_concurrency:
+                limiter = _limiters.get(route_key)
+                if limiter is None or limiter.limit != limit:
+                    limiter = _limiters[route_key] = ConcurrencyLimiter(route_key, limit)
+                await limiter.acquire()
+        except Rejected as e:
+            admission_requests_total.inc(**_labels(route_key), outcome=e.outcome)
+            response = JSONResponse({"detail": e.detail}, status_code=e.status_code,
+                                    headers={"Retry-After": str(e.retry_after)})
+            await response(scope, receive, send)
+            return
+        admission_requests_total.inc(**_labels(route_key), outcome="admitted")
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            if limiter is not None:
+                limiter.release()
+
+
+def _collect_admission_stats():
+    """The configured limits of every route, so dashboards can show usage against them."""
+    samples = []
+    for route_key, limit in ROUTE_LIMITS.items():
+        for field in fields(RouteLimit):
+            value = getattr(limit, field.name)
+            if value:
+                samples.append(("admission_limit", "gauge", "Configured admission/rate limits per route.",
+                                dict(_labels(route_key), limit=field.name), value))
+    samples.append(("rate_limit_buckets", "gauge", "Rate-limit buckets held in this worker's memory.",
+                    {}, get_rate_limiter().stats()["entries"]))
+    return samples
+
+
+add_collector(_collect_admission_stats)
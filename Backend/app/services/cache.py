@@ -1,30 +1,467 @@
+import asyncio
+import json
+import os
+import sys
 import time
+from collections import OrderedDict
 
-# This simple dictionary will hold our cache data.
-# Each key maps to a tuple: (timestamp when cached, the actual value)
-_CACHE = {}
+import redis.asyncio as redis
+from redis.exceptions import RedisError
 
-def get_cache(key: str, expire_seconds: int = 600):
+# Cache limits, configurable from the environment.
+# - CACHE_MAX_ENTRIES: how many keys we keep before evicting the least recently used one
+# - CACHE_MAX_BYTES: rough memory budget for all cached values together
+# - CACHE_DEFAULT_TTL: how long (in seconds) a value stays fresh if set_cache isn't told otherwise
+# - CACHE_SWEEP_INTERVAL: how often (in seconds) the background sweeper drops expired keys
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "10000"))
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+CACHE_DEFAULT_TTL = int(os.getenv("CACHE_DEFAULT_TTL", "600"))
+CACHE_SWEEP_INTERVAL = int(os.getenv("CACHE_SWEEP_INTERVAL", "60"))
+# Shared Redis tier (L2). If REDIS_URL isn't set, we only use the in-process cache.
+# - CACHE_L1_TTL: max seconds a worker keeps its own copy of a value that lives in Redis
+# - CACHE_KEY_PREFIX: namespace for our keys in Redis
+REDIS_URL = os.getenv("REDIS_URL")
+CACHE_L1_TTL = int(os.getenv("CACHE_L1_TTL", "60"))
+CACHE_KEY_PREFIX = os.getenv("CACHE_KEY_PREFIX", "globaldorm:")
+
+
+# What a cancelled loader hands to its waiters: "nobody loaded it, try again yourself".
+_RETRY = object()
+
+
+def _estimate_size(value) -> int:
+    """
+    Roughly estimate how many bytes a cached value takes up.
+    We only cache small JSON-like things (dicts, lists, numbers, strings),
+    so walking the structure is cheap and good enough for a memory budget.
+    """
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        for k, v in value.items():
+            size += _estimate_size(k) + _estimate_size(v)
+    elif isinstance(value, (list, tuple, set)):
+        for item in value:
+            size += _estimate_size(item)
+    return size
+
+
+class TTLCache:
+    """
+    An in-memory LRU cache where every key has its own expiry time.
+
+    - Keys are evicted least-recently-used first once max_entries or max_bytes is exceeded.
+    - The TTL is fixed when the value is stored, not when it is read.
+    - get_or_set() makes sure only one coroutine per key calls the loader at a time,
+      everyone else waiting on the same key just awaits that result (single-flight).
+    """
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, max_bytes: int = CACHE_MAX_BYTES,
+                 default_ttl: int = CACHE_DEFAULT_TTL):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        # key -> (expires_at, size_in_bytes, value). OrderedDict keeps LRU order for us.
+        self._data = OrderedDict()
+        self._bytes = 0
+        # key -> asyncio.Future for loads that are currently running.
+        self._inflight = {}
+        # Counters so we can see how well the cache is doing.
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def _remove(self, key):
+        _, size, _ = self._data.pop(key)
+        self._bytes -= size
+
+    def get(self, key: str):
+        """
+        Return the cached value for key, or None if it's missing or expired.
+        A hit moves the key to the "most recently used" end.
+        """
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, _, value = entry
+        if expires_at <= time.monotonic():
+            # Value is too old, drop it and treat as a miss.
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value, ttl: int = None):
+        """
+        Store a value with its own TTL (seconds). Evicts old entries if we're over budget.
+        Values bigger than the whole byte budget are simply not cached.
+        """
+        size = _estimate_size(value)
+        if size > self.max_bytes:
+            return
+        if key in self._data:
+            self._remove(key)
+        expires_at = time.monotonic() + (ttl if ttl is not None else self.default_ttl)
+        self._data[key] = (expires_at, size, value)
+        self._bytes += size
+        # Evict least recently used keys until we fit in both limits again.
+        while len(self._data) > self.max_entries or self._bytes > self.max_bytes:
+            oldest_key = next(iter(self._data))
+            self._remove(oldest_key)
+            self.evictions += 1
+
+    def delete(self, key: str):
+        """Remove a key from the cache if it's there."""
+        if key in self._data:
+            self._remove(key)
+
+    def clear(self):
+        """Empty the cache (counters are kept)."""
+        self._data.clear()
+        self._bytes = 0
+
+    def sweep(self) -> int:
+        """
+        Drop every expired entry. Returns how many were removed.
+        Called periodically by the background sweeper so keys that are
+        never read again don't sit in memory forever.
+        """
+        now = time.monotonic()
+        expired = [key for key, (expires_at, _, _) in self._data.items() if expires_at <= now]
+        for key in expired:
+            self._remove(key)
+        self.expirations += len(expired)
+        return len(expired)
+
+    async def get_or_set(self, key: str, loader, ttl: int = None, cacheable=None):
+        """
+        Return the cached value for key, or call `loader()` (an async function) to fetch it.
+        If another coroutine is already loading the same key, wait for its result
+        instead of calling the upstream service again.
+        A loader returning None is not cached; exceptions are passed on to every waiter.
+        Neither is a value for which `cacheable(value)` is False: the coroutines waiting
+        on this load still get it, but it's never stored.
+        If the coroutine running the loader is cancelled, only it sees the CancelledError:
+        its waiters go round again and one of them loads the key instead.
+        """
+        while True:
+            value = self.get(key)
+            if value is not None:
+                return value
+
+            # Someone else is already fetching this key, just wait for them.
+            inflight = self._inflight.get(key)
+            if inflight is None:
+                break
+            value = await asyncio.shield(inflight)
+            if value is not _RETRY:
+                return value
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await loader()
+        except asyncio.CancelledError:
+            future.set_result(_RETRY)
+            raise
+        except BaseException as exc:
+            future.set_exception(exc)
+            # Mark the exception as retrieved so asyncio doesn't warn when nobody was waiting.
+            future.exception()
+            raise
+        else:
+            if value is not None and (cacheable is None or cacheable(value)):
+                self.set(key, value, ttl)
+            future.set_result(value)
+            return value
+        finally:
+            self._inflight.pop(key, None)
+
+    def stats(self) -> dict:
+        """Return hit/miss/eviction counters and current size, useful for monitoring."""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "inflight": len(self._inflight),
+        }
+
+
+def _dumps(value) -> bytes:
+    # Compact JSON (no spaces) keeps Redis memory and network transfer small.
+    return json.dumps(value, separators=(",", ":")).encode()
+
+
+def _loads(raw: bytes):
+    return json.loads(raw)
+
+
+class RedisCacheBackend:
+    """
+    Shared cache tier stored in Redis, so every uvicorn worker and replica
+    sees the same geocode/distance results.
+    Redis enforces the TTL itself (SET ... EX), and multi-key reads/writes
+    go out as a single pipelined round trip.
+    """
+
+    def __init__(self, client, prefix: str = CACHE_KEY_PREFIX):
+        self.client = client
+        self.prefix = prefix
+
+    async def get_many(self, keys: list) -> dict:
+        """Fetch several keys in one round trip. Missing keys are left out of the result."""
+        raws = await self.client.mget([self.prefix + key for key in keys])
+        return {key: _loads(raw) for key, raw in zip(keys, raws) if raw is not None}
+
+    async def get_many_with_ttl(self, keys: list) -> dict:
+        """
+        Like get_many, but returns {key: (value, seconds_left)}, still in one round trip.
+        seconds_left is None for a key stored without an expiry.
+        """
+        names = [self.prefix + key for key in keys]
+        async with self.client.pipeline(transaction=False) as pipe:
+            pipe.mget(names)
+            for name in names:
+                pipe.pttl(name)
+            raws, *pttls = await pipe.execute()
+        return {
+            key: (_loads(raw), pttl / 1000 if pttl >= 0 else None)
+            for key, raw, pttl in zip(keys, raws, pttls) if raw is not None
+        }
+
+    async def set_many(self, items: dict, ttl: int):
+        """Store several keys (each with the same TTL) in one pipelined round trip."""
+        async with self.client.pipeline(transaction=False) as pipe:
+            for key, value in items.items():
+                pipe.set(self.prefix + key, _dumps(value), ex=ttl)
+            await pipe.execute()
+
+    async def delete(self, key: str):
+        await self.client.delete(self.prefix + key)
+
+    async def close(self):
+        await self.client.aclose()
+
+
+class TieredCache:
+    """
+    The cache the app actually talks to: a TTLCache (L1) in each worker,
+    optionally in front of a shared Redis backend (L2).
+
+    Callers just use get/set/get_or_set and never need to know which tier answered.
+    If Redis is down, errors are counted and we carry on with L1 only.
+    """
+
+    def __init__(self, local: TTLCache, shared=None, l1_ttl: int = CACHE_L1_TTL):
+        self.local = local
+        self.shared = shared
+        self.l1_ttl = l1_ttl
+        self.l2_hits = 0
+        self.l2_misses = 0
+        self.l2_errors = 0
+
+    def _local_ttl(self, ttl: int) -> int:
+        # With a shared tier, keep local copies short so workers don't drift too far from Redis.
+        return min(ttl, self.l1_ttl) if self.shared is not None else ttl
+
+    async def get_many(self, keys: list) -> dict:
+        """Look up several keys: L1 first, then everything still missing from L2 in one go."""
+        found = {}
+        missing = []
+        for key in keys:
+            value = self.local.get(key)
+            if value is not None:
+                found[key] = value
+            else:
+                missing.append(key)
+        if missing:
+            found.update(await self._get_shared(missing))
+        return found
+
+    async def _get_shared(self, keys: list) -> dict:
+        """
+        Look keys up in L2 only, copying any hits into L1. A copy never outlives the
+        Redis key it came from, so an invalidation can't be hidden by L1 for long.
+        """
+        if self.shared is None:
+            return {}
+        try:
+            remote = await self.shared.get_many_with_ttl(keys)
+        except RedisError:
+            self.l2_errors += 1
+            return {}
+        self.l2_hits += len(remote)
+        self.l2_misses += len(keys) - len(remote)
+        local_ttl = self._local_ttl(self.local.default_ttl)
+        for key, (value, seconds_left) in remote.items():
+            self.local.set(key, value, local_ttl if seconds_left is None else min(local_ttl, seconds_left))
+        return {key: value for key, (value, _) in remote.items()}
+
+    async def set_many(self, items: dict, ttl: int = CACHE_DEFAULT_TTL):
+        """Store several keys in both tiers."""
+        for key, value in items.items():
+            self.local.set(key, value, self._local_ttl(ttl))
+        if items and self.shared is not None:
+            try:
+                await self.shared.set_many(items, ttl)
+            except RedisError:
+                self.l2_errors += 1
+
+    async def get(self, key: str):
+        return (await self.get_many([key])).get(key)
+
+    async def set(self, key: str, value, ttl: int = CACHE_DEFAULT_TTL):
+        await self.set_many({key: value}, ttl)
+
+    async def delete(self, key: str):
+        self.local.delete(key)
+        if self.shared is not None:
+            try:
+                await self.shared.delete(key)
+            except RedisError:
+                self.l2_errors += 1
+
+    async def get_or_set(self, key: str, loader, ttl: int = CACHE_DEFAULT_TTL, cacheable=None):
+        """
+        Read-through lookup across both tiers. Single-flight happens at L1,
+        so a worker only asks Redis (and then the upstream) once per key at a time.
+        Values for which `cacheable(value)` is False are returned but stored in neither tier.
+        """
+        async def load_through():
+            # L1 already missed, so only ask Redis before going upstream.
+            value = (await self._get_shared([key])).get(key)
+            if value is not None:
+                return value
+            value = await loader()
+            if value is not None and self.shared is not None and (cacheable is None or cacheable(value)):
+                try:
+                    await self.shared.set_many({key: value}, ttl)
+                except RedisError:
+                    self.l2_errors += 1
+            return value
+
+        return await self.local.get_or_set(key, load_through, self._local_ttl(ttl), cacheable)
+
+    def stats(self) -> dict:
+        stats = self.local.stats()
+        stats.update({
+            "shared_backend": type(self.shared).__name__ if self.shared is not None else None,
+            "l2_hits": self.l2_hits,
+            "l2_misses": self.l2_misses,
+            "l2_errors": self.l2_errors,
+        })
+        return stats
+
+
+# The shared cache used by the whole app. Redis gets plugged in at startup if configured.
+local_cache = TTLCache()
+cache = TieredCache(local_cache)
+
+# Background task that periodically removes expired keys.
+_sweeper_task = None
+
+
+async def get_cache(key: str):
     """
     Get a value from the cache.
     - key: cache key (usually a string related to the API query)
-    - expire_seconds: how long (in seconds) the cache is valid for (default: 10 minutes)
     Returns the cached value if found and not expired, otherwise None.
     """
-    now = time.time()
-    if key in _CACHE:
-        timestamp, value = _CACHE[key]
-        # If value is still fresh, return it
-        if now - timestamp < expire_seconds:
-            return value
-        else:
-            # If value is too old, remove it from cache
-            del _CACHE[key]
-    return None
+    return await cache.get(key)
 
-def set_cache(key: str, value):
+
+async def set_cache(key: str, value, ttl: int = CACHE_DEFAULT_TTL):
     """
     Set a value in the cache.
-    Stores the current time along with the value for expiration checking.
+    - ttl: how long (in seconds) this value stays valid (default: 10 minutes)
     """
-    _CACHE[key] = (time.time(), value)
+    await cache.set(key, value, ttl)
+
+
+async def delete_cache(key: str):
+    """Remove a key from every cache tier (e.g. when the underlying data changes)."""
+    await cache.delete(key)
+
+
+async def get_many_cache(keys: list) -> dict:
+    """Get several values at once. Returns {key: value} for the keys that were found."""
+    return await cache.get_many(keys)
+
+
+async def set_many_cache(items: dict, ttl: int = CACHE_DEFAULT_TTL):
+    """Set several values at once, all with the same TTL."""
+    await cache.set_many(items, ttl)
+
+
+async def get_or_set_cache(key: str, loader, ttl: int = CACHE_DEFAULT_TTL, cacheable=None):
+    """
+    Read-through helper: returns the cached value or awaits `loader()` once per key
+    (concurrent callers for the same key share a single upstream call).
+    Values for which `cacheable(value)` is False are shared with those callers but not stored.
+    """
+    return await cache.get_or_set(key, loader, ttl, cacheable)
+
+
+def cache_stats() -> dict:
+    """Return the cache counters (hits, misses, evictions, size...)."""
+    return cache.stats()
+
+
+def use_shared_backend(backend):
+    """
+    Plug a shared backend (or None to turn it off) into the app cache.
+    Tests can pass a RedisCacheBackend built on a fakeredis client here.
+    """
+    cache.shared = backend
+
+
+async def connect_redis_cache(url: str = REDIS_URL):
+    """Connect the Redis tier on startup, if a REDIS_URL is configured."""
+    if url:
+        use_shared_backend(RedisCacheBackend(redis.from_url(url)))
+
+
+async def close_redis_cache():
+    """Close the Redis connection pool on shutdown."""
+    if cache.shared is not None:
+        await cache.shared.close()
+        use_shared_backend(None)
+
+
+async def _sweep_forever(interval: int):
+    while True:
+        await asyncio.sleep(interval)
+        local_cache.sweep()
+
+
+def start_cache_sweeper(interval: int = CACHE_SWEEP_INTERVAL):
+    """Start the background task that drops expired keys. Called on app startup."""
+    global _sweeper_task
+    if _sweeper_task is None or _sweeper_task.done():
+        _sweeper_task = asyncio.get_running_loop().create_task(_sweep_forever(interval))
+
+
+async def stop_cache_sweeper():
+    """Stop the background sweeper. Called on app shutdown."""
+    global _sweeper_task
+    if _sweeper_task is not None:
+        _sweeper_task.cancel()
+        try:
+            await _sweeper_task
+        except asyncio.CancelledError:
+            pass
+        _sweeper_task = None
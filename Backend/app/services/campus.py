@@ -0,0 +1,90 @@
+import os
+
+from app.services.fallback import set_many_with_stale
+from app.services.geocode_service import postcode_to_coords, postcodes_to_coords, normalise_postcode
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# The campuses we measure room distances to, as "name=POSTCODE" pairs separated by ";",
+# e.g. CAMPUSES="whitechapel=E1 4NS;mile_end=E1 4NS".
+# Stored room locations are measured to DEFAULT_CAMPUS (the first one unless set).
+CAMPUSES = os.getenv("CAMPUSES", "main=E1 4NS")
+
+
+def parse_campuses(value: str) -> dict:
+    """Parse the CAMPUSES setting into {name: postcode}, keeping its order."""
+    campuses = {}
+    for entry in value.split(";"):
+        if not entry.strip():
+            continue
+        name, sep, postcode = entry.partition("=")
+        name, postcode = name.strip(), postcode.strip()
+        if not sep or not name or not postcode:
+            raise ValueError(f"Invalid campus entry {entry!r}, expected name=POSTCODE")
+        campuses[name] = postcode
+    if not campuses:
+        raise ValueError("At least one campus must be configured")
+    return campuses
+
+
+CAMPUS_POSTCODES = parse_campuses(CAMPUSES)
+DEFAULT_CAMPUS = os.getenv("DEFAULT_CAMPUS") or next(iter(CAMPUS_POSTCODES))
+if DEFAULT_CAMPUS not in CAMPUS_POSTCODES:
+    raise ValueError(f"DEFAULT_CAMPUS {DEFAULT_CAMPUS!r} is not one of the configured campuses")
+
+# Campus name -> (lat, lon). Filled on startup by load_campuses(); campuses never
+# move, so once resolved they're never looked up again.
+_coords = {}
+
+
+async def load_campuses() -> dict:
+    """
+    Geocode every configured campus in one bulk lookup and keep the coordinates
+    in memory. Called on app startup. Campuses that can't be geocoded right now
+    are retried on first use.
+
+    Returns:
+        dict: {name: (lat, lon)} for the campuses that were resolved.
+    """
+    resolved = await postcodes_to_coords(list(CAMPUS_POSTCODES.values()))
+    cache_values = {}
+    for name, postcode in CAMPUS_POSTCODES.items():
+        lat, lon = resolved.get(normalise_postcode(postcode), (None, None))
+        if lat is None or lon is None:
+            logger.warning("could not geocode campus", extra={"campus": name, "postcode": postcode})
+            continue
+        _coords[name] = (lat, lon)
+        # /external/geocode gets asked for campus postcodes too.
+        cache_values[f"geocode:{normalise_postcode(postcode)}"] = {"latitude": lat, "longitude": lon}
+    await set_many_with_stale(cache_values)
+    return dict(_coords)
+
+
+async def get_campus_coords(name: str = None):
+    """
+    Coordinates of a campus (the default one if no name is given).
+
+    Returns:
+        (lat, lon), or (None, None) if the campus postcode can't be geocoded.
+    Raises:
+        KeyError: if no campus with that name is configured.
+    """
+    name = name or DEFAULT_CAMPUS
+    postcode = CAMPUS_POSTCODES[name]
+    if name not in _coords:
+        lat, lon = await postcode_to_coords(postcode)
+        if lat is None or lon is None:
+            return None, None
+        _coords[name] = (lat, lon)
+    return _coords[name]
+
+
+def distance_cache_key(room_id: str, campus: str = None) -> str:
+    """Cache key of a room's distance to one campus."""
+    return f"distance:{campus or DEFAULT_CAMPUS}:{room_id}"
+
+
+def distance_cache_keys(room_id: str) -> list:
+    """Cache keys of a room's distance to every campus (to invalidate them all at once)."""
+    return [distance_cache_key(room_id, name) for name in CAMPUS_POSTCODES]
@@ -1,4 +1,26 @@
-import httpx
+import asyncio
+import os
+
+import numpy as np
+
+from app.services.fallback import OSRM, UpstreamUnavailable
+from app.utils.logger import get_logger
+from app.utils.metrics import track_upstream
+
+logger = get_logger(__name__)
+
+OSRM_URL = os.getenv("OSRM_URL", "http://router.project-osrm.org")
+# The OSRM server refuses /table requests with more coordinates than this
+# (the public demo server allows 100). Each request uses one slot for the destination.
+OSRM_TABLE_MAX_COORDINATES = int(os.getenv("OSRM_TABLE_MAX_COORDINATES", "100"))
+# How many /table requests we send at the same time.
+OSRM_TABLE_CONCURRENCY = int(os.getenv("OSRM_TABLE_CONCURRENCY", "2"))
+
+# Used by the straight-line estimate when OSRM can't answer:
+# roads are rarely straight, so we stretch the distance a bit, and assume an average urban speed.
+ESTIMATE_DETOUR_FACTOR = 1.3
+ESTIMATE_SPEED_MPS = 8.0  # ~29 km/h
+EARTH_RADIUS_M = 6_371_000
 
 async def calculate_osrm_distance(start_lat, start_lon, end_lat, end_lon):
     """
@@ -16,15 +38,90 @@ async def calculate_osrm_distance(start_lat, start_lon, end_lat, end_lon):
         Returns (None, None) if OSRM fails or no route found.
     """
     # OSRM expects longitude,latitude order!
-    url = f"http://router.project-osrm.org/route/v1/driving/{start_lon},{start_lat};{end_lon},{end_lat}?overview=false"
-    async with httpx.AsyncClient() as client:
-        resp = await client.get(url)
-        if resp.status_code == 200:
-            data = resp.json()
-            # If at least one route is found, return its distance and duration
-            if data.get("routes"):
-                meters = data["routes"][0]["distance"]
-                duration = data["routes"][0]["duration"]
-                return meters, duration
+    url = f"{OSRM_URL}/route/v1/driving/{start_lon},{start_lat};{end_lon},{end_lat}?overview=false"
+    # Goes through the OSRM resilience policy (timeout, retries, circuit breaker).
+    try:
+        async with track_upstream("osrm", "route") as call:
+            resp = await OSRM.request("GET", url)
+            call.outcome = "ok" if resp.status_code == 200 else str(resp.status_code)
+    except UpstreamUnavailable as e:
+        logger.warning("OSRM unavailable", extra={"error": str(e)})
+        return None, None
+    if resp.status_code == 200:
+        data = resp.json()
+        # If at least one route is found, return its distance and duration
+        if data.get("routes"):
+            meters = data["routes"][0]["distance"]
+            duration = data["routes"][0]["duration"]
+            return meters, duration
     # If anything goes wrong or no routes, return None
     return None, None
+
+async def _osrm_table(origins: list, end_lat, end_lon, semaphore: asyncio.Semaphore) -> list:
+    """
+    One OSRM /table request: every origin as a source, the destination as the only target.
+    Returns a (meters, duration) tuple per origin, (None, None) where OSRM had no answer.
+    """
+    coords = ";".join(f"{lon},{lat}" for lat, lon in origins) + f";{end_lon},{end_lat}"
+    sources = ";".join(str(i) for i in range(len(origins)))
+    url = (f"{OSRM_URL}/table/v1/driving/{coords}"
+           f"?sources={sources}&destinations={len(origins)}&annotations=distance,duration")
+    failed = [(None, None)] * len(origins)
+    async with semaphore:
+        try:
+            async with track_upstream("osrm", "table") as call:
+                resp = await OSRM.request("GET", url)
+                call.outcome = "ok" if resp.status_code == 200 else str(resp.status_code)
+        except UpstreamUnavailable as e:
+            logger.warning("OSRM table request failed", extra={"error": str(e), "size": len(origins)})
+            return failed
+    if resp.status_code != 200:
+        logger.warning("OSRM table request failed", extra={"status": resp.status_code, "size": len(origins)})
+        return failed
+    data = resp.json()
+    if data.get("code") != "Ok":
+        return failed
+    # One row per source, one column (our single destination) per row.
+    return [(d[0], t[0]) if d[0] is not None and t[0] is not None else (None, None)
+            for d, t in zip(data["distances"], data["durations"])]
+
+async def calculate_osrm_distances(origins: list, end_lat, end_lon, concurrency: int = OSRM_TABLE_CONCURRENCY):
+    """
+    Batch version of calculate_osrm_distance: driving distance/duration from many
+    origins to one destination, using OSRM's /table service instead of one /route per origin.
+    Origins are split into chunks that fit the server's coordinate limit.
+
+    Args:
+        origins (list): [(lat, lon), ...] starting points
+        end_lat (float), end_lon (float): the destination (e.g. campus)
+
+    Returns:
+        list: (meters, duration) per origin, in the same order. (None, None) where OSRM failed.
+    """
+    chunk_size = max(1, OSRM_TABLE_MAX_COORDINATES - 1)
+    chunks = [origins[i:i + chunk_size] for i in range(0, len(origins), chunk_size)]
+    semaphore = asyncio.Semaphore(concurrency)
+    results = []
+    for chunk_result in await asyncio.gather(*(_osrm_table(chunk, end_lat, end_lon, semaphore) for chunk in chunks)):
+        results.extend(chunk_result)
+    return results
+
+def estimate_distances(origins: list, end_lat, end_lon) -> list:
+    """
+    Fast offline estimate of distance/duration from many origins to one destination,
+    used when OSRM is slow or down. Computes the haversine (great-circle) distance for
+    all origins at once with NumPy, scaled by a detour factor, and a duration from an
+    average speed. Less accurate than OSRM, but never fails and costs microseconds.
+
+    Returns:
+        list: (meters, duration) per origin, in the same order.
+    """
+    if not origins:
+        return []
+    points = np.radians(np.asarray(origins, dtype=np.float64))
+    lat1, lon1 = points[:, 0], points[:, 1]
+    lat2, lon2 = np.radians(end_lat), np.radians(end_lon)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    meters = 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a)) * ESTIMATE_DETOUR_FACTOR
+    seconds = meters / ESTIMATE_SPEED_MPS
+    return [(round(float(m), 1), round(float(s), 1)) for m, s in zip(meters, seconds)]
@@ -0,0 +1,232 @@
+import asyncio
+import os
+import random
+import time
+
+import httpx
+
+from app.services.cache import (
+    get_many_cache, set_cache, set_many_cache, get_or_set_cache, CACHE_DEFAULT_TTL
+)
+from app.services.http_client import get_http_client
+from app.utils.logger import get_logger
+from app.utils.metrics import Counter, add_collector
+
+logger = get_logger(__name__)
+
+# How long a cached value may still be served after it went stale, while a fresh
+# one is fetched in the background (default: 1 day).
+CACHE_STALE_TTL = int(os.getenv("CACHE_STALE_TTL", "86400"))
+
+upstream_retries_total = Counter(
+    "upstream_retries_total", "Retried calls to external services.", ("service",))
+upstream_rejected_total = Counter(
+    "upstream_rejected_total", "Calls not sent because the circuit was open or the service was busy.",
+    ("service", "reason"))
+
+
+class UpstreamUnavailable(Exception):
+    """The external service is failing, too slow, or its circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Stops calling a service that keeps failing, so we fail fast instead of
+    piling up slow requests against it.
+
+    - closed:    calls go through; `failure_threshold` failures in a row open the circuit
+    - open:      calls are rejected straight away for `reset_timeout` seconds
+    - half_open: one probe call is let through; success closes the circuit, failure reopens it
+    """
+
+    def __init__(self, name: str = "", failure_threshold: int = 5, reset_timeout: float = 30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+
+    def allow(self) -> bool:
+        """Could a call go through now? Moves from open to half_open once the timeout has passed."""
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = "half_open"
+            self._probing = False
+        return self.state == "closed" or (self.state == "half_open" and not self._probing)
+
+    def start_call(self) -> bool:
+        """
+        Like allow(), but in half_open it also takes the single probe slot. Call it right
+        before sending; a probe it lets through must end in record_success() or record_failure(),
+        or the circuit stays half_open with the slot taken.
+        """
+        if not self.allow():
+            return False
+        if self.state == "half_open":
+            self._probing = True
+        return True
+
+    def record_success(self):
+        self.state = "closed"
+        self.failures = 0
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._probing = False
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                logger.warning("circuit opened", extra={"service": self.name, "failures": self.failures})
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+
+class Upstream:
+    """
+    Resilience policy for one external service: its own timeout, a cap on concurrent
+    calls, a few retries with jittered exponential backoff, and a circuit breaker.
+    """
+
+    def __init__(self, name: str, timeout: float, max_concurrency: int = 20, retries: int = 2,
+                 backoff: float = 0.1, queue_timeout: float = 1.0, breaker: CircuitBreaker = None):
+        self.name = name
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.queue_timeout = queue_timeout
+        self.breaker = breaker or CircuitBreaker(name)
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """
+        Send a request through the policy. Returns the response for anything that isn't
+        a server-side failure (so 404s still come back to the caller).
+        Raises UpstreamUnavailable if the circuit is open, every slot stays busy for
+        `queue_timeout` seconds, or every attempt failed (timeout, connection error, 5xx, 429).
+        """
+        if not self.breaker.allow():
+            upstream_rejected_total.inc(service=self.name, reason="circuit_open")
+            raise UpstreamUnavailable(f"{self.name} circuit is open")
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            upstream_rejected_total.inc(service=self.name, reason="busy")
+            raise UpstreamUnavailable(f"{self.name} is busy")
+        try:
+            # Only take the half_open probe slot once we hold a semaphore slot, so waiting
+            # in the queue (and timing out there) never leaves the probe claimed.
+            if not self.breaker.start_call():
+                upstream_rejected_total.inc(service=self.name, reason="circuit_open")
+                raise UpstreamUnavailable(f"{self.name} circuit is open")
+            probe = self.breaker.state == "half_open"
+            settled = False
+            try:
+                error = None
+                for attempt in range(self.retries + 1):
+                    if attempt:
+                        upstream_retries_total.inc(service=self.name)
+                        # Exponential backoff with jitter so retries from many requests don't line up.
+                        await asyncio.sleep(self.backoff * (2 ** (attempt - 1)) * random.uniform(0.5, 1.5))
+                    try:
+                        resp = await get_http_client().request(method, url, timeout=self.timeout, **kwargs)
+                    except httpx.TransportError as e:
+                        error = e
+                        continue
+                    if resp.status_code >= 500 or resp.status_code == 429:
+                        error = f"status {resp.status_code}"
+                        continue
+                    settled = True
+                    self.breaker.record_success()
+                    return resp
+                settled = True
+                self.breaker.record_failure()
+                raise UpstreamUnavailable(f"{self.name} failed after {self.retries + 1} attempts: {error}")
+            finally:
+                # A probe that was cancelled or hit an unexpected error counts as a failed
+                # probe: the circuit reopens instead of rejecting every call from now on.
+                if probe and not settled:
+                    self.breaker.record_failure()
+        finally:
+            self._semaphore.release()
+
+
+# One policy per external service.
+POSTCODES_IO = Upstream(
+    "postcodes_io",
+    timeout=float(os.getenv("POSTCODES_IO_TIMEOUT", "3")),
+    max_concurrency=int(os.getenv("POSTCODES_IO_CONCURRENCY", "20")),
+)
+OSRM = Upstream(
+    "osrm",
+    timeout=float(os.getenv("OSRM_TIMEOUT", "5")),
+    max_concurrency=int(os.getenv("OSRM_CONCURRENCY", "10")),
+)
+UPSTREAMS = (POSTCODES_IO, OSRM)
+
+
+def _collect_breakers():
+    states = ("closed", "half_open", "open")
+    return [
+        ("upstream_circuit_state", "gauge", "Circuit breaker state (1 for the current state).",
+         {"service": upstream.name, "state": state}, int(upstream.breaker.state == state))
+        for upstream in UPSTREAMS for state in states
+    ]
+
+
+add_collector(_collect_breakers)
+
+# Background refreshes that are currently running, so each key is refreshed only once at a time.
+_refreshing = {}
+
+
+async def _refresh(key: str, loader, ttl: int, stale_ttl: int, cacheable):
+    try:
+        value = await loader()
+        if value is not None and cacheable(value):
+            await set_cache(key, value, ttl + stale_ttl)
+            await set_cache(f"fresh:{key}", True, ttl)
+    except Exception as e:
+        # The stale value keeps being served; we'll try again on the next request.
+        logger.info("background refresh failed", extra={"key": key, "error": str(e)})
+    finally:
+        _refreshing.pop(key, None)
+
+
+async def get_with_stale(key: str, loader, ttl: int = CACHE_DEFAULT_TTL, stale_ttl: int = CACHE_STALE_TTL,
+                         cacheable=lambda value: True):
+    """
+    Stale-while-revalidate read-through cache.
+
+    - fresh value cached: return it
+    - stale value cached (older than ttl, younger than ttl + stale_ttl): return it straight
+      away and refresh it in the background, so an upstream outage doesn't slow us down
+    - nothing cached: call `loader()` (once per key, see get_or_set_cache)
+
+    Values for which `cacheable(value)` is False are returned but not stored.
+    """
+    fresh_key = f"fresh:{key}"
+    cached = await get_many_cache([key, fresh_key])
+    value = cached.get(key)
+    if value is not None:
+        if fresh_key not in cached and key not in _refreshing:
+            _refreshing[key] = asyncio.get_running_loop().create_task(
+                _refresh(key, loader, ttl, stale_ttl, cacheable))
+        return value
+
+    async def load():
+        loaded = await loader()
+        if loaded is not None and cacheable(loaded):
+            await set_cache(fresh_key, True, ttl)
+        return loaded
+
+    # Non-cacheable values go to the callers sharing this load, and nowhere else.
+    return await get_or_set_cache(key, load, ttl + stale_ttl, cacheable=cacheable)
+
+
+async def set_many_with_stale(items: dict, ttl: int = CACHE_DEFAULT_TTL, stale_ttl: int = CACHE_STALE_TTL):
+    """Store several values the way get_with_stale() does, so they're served as fresh for `ttl` seconds."""
+    if not items:
+        return
+    await set_many_cache(items, ttl + stale_ttl)
+    await set_many_cache({f"fresh:{key}": True for key in items}, ttl)
@@ -0,0 +1,125 @@
+import csv
+import mmap
+import os
+import struct
+
+# Local postcode -> (lat, lon) index, so most geocoding doesn't need postcodes.io.
+#
+# File layout (little-endian):
+#   header: 8-byte magic + uint32 record count + 4 bytes padding   (16 bytes)
+#   records sorted by postcode, 16 bytes each:
+#       8-byte normalised postcode (no spaces, upper case, padded with \0)
+#       int32 latitude  * 1,000,000
+#       int32 longitude * 1,000,000
+#
+# The file is memory-mapped, so opening it is instant whatever its size, and a
+# lookup is a binary search touching only a few pages.
+MAGIC = b"GDGAZ1\0\0"
+HEADER = struct.Struct("<8sI4x")
+RECORD = struct.Struct("<8sii")
+KEY_SIZE = 8
+SCALE = 1_000_000
+
+# Where the compiled index lives. Leave unset to always use postcodes.io.
+GAZETTEER_PATH = os.getenv("GAZETTEER_PATH")
+
+
+def _key(postcode: str) -> bytes:
+    return postcode.strip().replace(" ", "").upper().encode("ascii", "ignore")[:KEY_SIZE].ljust(KEY_SIZE, b"\0")
+
+
+class Gazetteer:
+    """Read-only view over a compiled gazetteer file."""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self._count = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            self._mm.close()
+            raise ValueError(f"{path} is not a gazetteer file")
+
+    def __len__(self):
+        return self._count
+
+    def lookup(self, postcode: str):
+        """Return (latitude, longitude) for the postcode, or None if it isn't in the index."""
+        key = _key(postcode)
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            offset = HEADER.size + mid * RECORD.size
+            current = self._mm[offset:offset + KEY_SIZE]
+            if current < key:
+                lo = mid + 1
+            elif current > key:
+                hi = mid
+            else:
+                _, lat, lon = RECORD.unpack_from(self._mm, offset)
+                return lat / SCALE, lon / SCALE
+        return None
+
+    def close(self):
+        self._mm.close()
+
+
+def build_gazetteer(csv_path: str, out_path: str) -> int:
+    """
+    Compile a postcode CSV into a gazetteer file. Returns how many postcodes were written.
+
+    Works with the ONS Postcode Directory (columns "pcds"/"pcd", "lat", "long")
+    or any CSV with "postcode", "latitude", "longitude" columns.
+    Rows without real coordinates (ONSPD uses 99.999999 for those) are skipped.
+    """
+    records = {}
+    with open(csv_path, newline="", encoding="utf-8-sig") as f:
+        reader = csv.DictReader(f)
+        for row in reader:
+            postcode = row.get("pcds") or row.get("pcd") or row.get("postcode")
+            lat = row.get("lat") or row.get("latitude")
+            lon = row.get("long") or row.get("longitude")
+            if not postcode or not lat or not lon:
+                continue
+            lat, lon = float(lat), float(lon)
+            if abs(lat) > 90 or abs(lon) > 180:
+                continue
+            records[_key(postcode)] = (round(lat * SCALE), round(lon * SCALE))
+
+    tmp_path = out_path + ".tmp"
+    with open(tmp_path, "wb") as out:
+        out.write(HEADER.pack(MAGIC, len(records)))
+        for key in sorted(records):
+            out.write(RECORD.pack(key, *records[key]))
+    # Swap the new file in at once so a running app never sees a half-written index.
+    os.replace(tmp_path, out_path)
+    return len(records)
+
+
+# The app-wide gazetteer, opened on first use.
+_gazetteer = None
+_gazetteer_loaded = False
+
+
+def get_gazetteer():
+    """Return the loaded gazetteer, or None if GAZETTEER_PATH isn't set or the file is missing."""
+    global _gazetteer, _gazetteer_loaded
+    if not _gazetteer_loaded:
+        _gazetteer_loaded = True
+        if GAZETTEER_PATH and os.path.exists(GAZETTEER_PATH):
+            _gazetteer = Gazetteer(GAZETTEER_PATH)
+    return _gazetteer
+
+
+def set_gazetteer(gazetteer):
+    """Use a specific gazetteer (or None to disable it), e.g. one built from a test fixture."""
+    global _gazetteer, _gazetteer_loaded
+    _gazetteer = gazetteer
+    _gazetteer_loaded = True
+
+
+def local_lookup(postcode: str):
+    """Look a postcode up in the local gazetteer. Returns (lat, lon) or None."""
+    gazetteer = get_gazetteer()
+    if gazetteer is None:
+        return None
+    return gazetteer.lookup(postcode)
@@ -0,0 +1,101 @@
+import math
+import os
+
+from app.db.mongodb import db
+
+# Where /rooms/nearby looks rooms up:
+# - "mongo":  $geoNear on the 2dsphere index (default, what production uses)
+# - "memory": an in-process grid index, for single-node setups and local
+#             MongoDB stand-ins (e.g. mongomock) that don't support $geoNear
+GEO_BACKEND = os.getenv("GEO_BACKEND", "mongo")
+
+EARTH_RADIUS_M = 6_371_000
+# Grid cell size in degrees (~1.1 km north-south).
+CELL_DEGREES = 0.01
+
+
+def haversine_meters(lat1, lon1, lat2, lon2) -> float:
+    """Great-circle distance between two points, in meters."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+
+class GeoGridIndex:
+    """
+    Keeps room coordinates in a grid of small lat/lon cells, so a radius search
+    only looks at the cells the circle touches instead of every room.
+    """
+
+    def __init__(self, cell_degrees: float = CELL_DEGREES):
+        self.cell_degrees = cell_degrees
+        self._cells = {}   # (cell_x, cell_y) -> {room_id: (lat, lon)}
+        self._points = {}  # room_id -> (lat, lon)
+
+    def __len__(self):
+        return len(self._points)
+
+    def _cell(self, lat, lon):
+        return int(math.floor(lat / self.cell_degrees)), int(math.floor(lon / self.cell_degrees))
+
+    def add(self, room_id: str, lat: float, lon: float):
+        self.remove(room_id)
+        self._points[room_id] = (lat, lon)
+        self._cells.setdefault(self._cell(lat, lon), {})[room_id] = (lat, lon)
+
+    def remove(self, room_id: str):
+        point = self._points.pop(room_id, None)
+        if point is not None:
+            cell = self._cell(*point)
+            self._cells[cell].pop(room_id, None)
+            if not self._cells[cell]:
+                del self._cells[cell]
+
+    def within(self, lat: float, lon: float, radius_m: float) -> list:
+        """Return [(distance_meters, room_id), ...] for rooms within radius_m, nearest first."""
+        # How many degrees the radius spans (longitude degrees shrink towards the poles).
+        dlat = math.degrees(radius_m / EARTH_RADIUS_M)
+        dlon = dlat / max(math.cos(math.radians(lat)), 1e-6)
+        min_x, min_y = self._cell(lat - dlat, lon - dlon)
+        max_x, max_y = self._cell(lat + dlat, lon + dlon)
+        found = []
+        for x in range(min_x, max_x + 1):
+            for y in range(min_y, max_y + 1):
+                for room_id, (plat, plon) in self._cells.get((x, y), {}).items():
+                    distance = haversine_meters(lat, lon, plat, plon)
+                    if distance <= radius_m:
+                        found.append((distance, room_id))
+        found.sort()
+        return found
+
+
+# The app-wide in-memory index (only filled when GEO_BACKEND is "memory").
+room_geo_index = GeoGridIndex()
+
+
+def geo_point(lat: float, lon: float) -> dict:
+    """A GeoJSON point, as stored on rooms for the 2dsphere index (note: longitude first)."""
+    return {"type": "Point", "coordinates": [lon, lat]}
+
+
+def index_room_point(room_id: str, lat: float, lon: float):
+    """Record a room's coordinates in the in-memory index (no-op with the mongo backend)."""
+    if GEO_BACKEND == "memory":
+        room_geo_index.add(room_id, lat, lon)
+
+
+def unindex_room(room_id: str):
+    """Forget a room's coordinates (room deleted or its postcode changed)."""
+    if GEO_BACKEND == "memory":
+        room_geo_index.remove(room_id)
+
+
+async def load_geo_index():
+    """Fill the in-memory index from the rooms collection. Called on app startup."""
+    if GEO_BACKEND != "memory":
+        return
+    async for room in db.rooms.find({"geo": {"$exists": True}}, {"geo": 1}):
+        lon, lat = room["geo"]["coordinates"]
+        room_geo_index.add(str(room["_id"]), lat, lon)
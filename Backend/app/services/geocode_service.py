@@ -1,8 +1,34 @@
-import httpx
+import asyncio
+import os
+
+from app.services.cache import get_many_cache
+from app.services.fallback import POSTCODES_IO, UpstreamUnavailable, set_many_with_stale
+from app.services.gazetteer import local_lookup
+from app.utils.logger import get_logger
+from app.utils.metrics import track_upstream, geocode_local_lookups_total
+
+logger = get_logger(__name__)
+
+POSTCODES_IO_URL = "https://api.postcodes.io/postcodes"
+# postcodes.io accepts at most 100 postcodes per bulk lookup.
+BULK_CHUNK_SIZE = 100
+# How many bulk lookups we run against postcodes.io at the same time.
+BULK_CONCURRENCY = int(os.getenv("GEOCODE_BULK_CONCURRENCY", "4"))
+
+
+def normalise_postcode(postcode: str) -> str:
+    """
+    Turn a postcode into the form we use everywhere (cache keys, lookups):
+    no spaces, upper case. " e1 4ns " -> "E14NS".
+    """
+    return postcode.strip().replace(' ', '').upper()
+
 
 async def postcode_to_coords(postcode: str):
     """
-    Converts a UK postcode to (latitude, longitude) using the free postcodes.io API.
+    Converts a UK postcode to (latitude, longitude).
+    The local gazetteer (see gazetteer.py) is tried first; postcodes it doesn't know
+    (or every postcode, if no gazetteer is configured) go to the free postcodes.io API.
     Returns (None, None) if the postcode is not found or if the API fails.
 
     Args:
@@ -11,18 +37,113 @@ async def postcode_to_coords(postcode: str):
     Returns:
         (latitude, longitude): Tuple of floats, or (None, None) on error.
     """
+    coords = local_lookup(postcode)
+    if coords is not None:
+        geocode_local_lookups_total.inc(outcome="hit")
+        return coords
+    geocode_local_lookups_total.inc(outcome="miss")
+
     # Remove spaces and extra characters from the postcode to keep the API happy.
     clean_postcode = postcode.strip().replace(' ', '')
-    url = f"https://api.postcodes.io/postcodes/{clean_postcode}"
-    async with httpx.AsyncClient() as client:
-        resp = await client.get(url)
-        # Print debug info (useful for testing/diagnosing failures)
-        print(f"DEBUG: Postcodes.io status {resp.status_code}, url={url}, body={resp.text}")
-        if resp.status_code == 200:
-            data = resp.json()
-            # Only return coordinates if the postcode was actually found.
-            if data["status"] == 200 and data["result"]:
-                result = data["result"]
-                return result["latitude"], result["longitude"]
+    url = f"{POSTCODES_IO_URL}/{clean_postcode}"
+    # Goes through the postcodes.io resilience policy (timeout, retries, circuit breaker).
+    try:
+        async with track_upstream("postcodes_io", "lookup") as call:
+            resp = await POSTCODES_IO.request("GET", url)
+            call.outcome = "ok" if resp.status_code == 200 else str(resp.status_code)
+    except UpstreamUnavailable as e:
+        logger.warning("postcodes.io unavailable", extra={"error": str(e)})
+        return None, None
+    # Log debug info (useful for testing/diagnosing failures)
+    logger.debug("postcodes.io lookup", extra={"status": resp.status_code, "url": url})
+    if resp.status_code == 200:
+        data = resp.json()
+        # Only return coordinates if the postcode was actually found.
+        if data["status"] == 200 and data["result"]:
+            result = data["result"]
+            return result["latitude"], result["longitude"]
     # If postcode is not valid or something went wrong, return None
     return None, None
+
+
+async def _bulk_lookup(chunk: list, semaphore: asyncio.Semaphore) -> dict:
+    """
+    Look up one chunk (<= 100 postcodes) with a single POST to postcodes.io.
+    Returns {normalised_postcode: (lat, lon)} for the postcodes that were found.
+    If the whole request fails, returns an empty dict so the caller marks them as failed.
+    """
+    async with semaphore:
+        try:
+            async with track_upstream("postcodes_io", "bulk_lookup") as call:
+                resp = await POSTCODES_IO.request("POST", POSTCODES_IO_URL, json={"postcodes": chunk})
+                call.outcome = "ok" if resp.status_code == 200 else str(resp.status_code)
+        except UpstreamUnavailable as e:
+            logger.warning("postcodes.io bulk lookup failed", extra={"error": str(e), "size": len(chunk)})
+            return {}
+    if resp.status_code != 200:
+        logger.warning("postcodes.io bulk lookup failed", extra={"status": resp.status_code, "size": len(chunk)})
+        return {}
+    found = {}
+    for item in resp.json().get("result") or []:
+        result = item.get("result")
+        if result:
+            found[normalise_postcode(item["query"])] = (result["latitude"], result["longitude"])
+    return found
+
+
+async def postcodes_to_coords(postcodes: list) -> dict:
+    """
+    Batch version of postcode_to_coords.
+    Normalises and de-duplicates the postcodes, answers what it can from the local
+    gazetteer, then resolves the rest through the postcodes.io bulk endpoint in
+    chunks of 100, a few chunks at a time.
+
+    Args:
+        postcodes (list): UK postcodes to look up (any spacing/case).
+
+    Returns:
+        dict: {normalised_postcode: (latitude, longitude)}, with (None, None)
+        for postcodes that weren't found or whose lookup failed.
+    """
+    unique = list(dict.fromkeys(normalise_postcode(p) for p in postcodes if p.strip()))
+    found = {}
+    remaining = []
+    for postcode in unique:
+        coords = local_lookup(postcode)
+        if coords is not None:
+            found[postcode] = coords
+        else:
+            remaining.append(postcode)
+    geocode_local_lookups_total.inc(len(found), outcome="hit")
+    geocode_local_lookups_total.inc(len(remaining), outcome="miss")
+
+    chunks = [remaining[i:i + BULK_CHUNK_SIZE] for i in range(0, len(remaining), BULK_CHUNK_SIZE)]
+    semaphore = asyncio.Semaphore(BULK_CONCURRENCY)
+    for chunk_result in await asyncio.gather(*(_bulk_lookup(chunk, semaphore) for chunk in chunks)):
+        found.update(chunk_result)
+    return {postcode: found.get(postcode, (None, None)) for postcode in unique}
+
+
+async def cached_postcodes_to_coords(postcodes: list) -> dict:
+    """
+    postcodes_to_coords, but answering from the geocode cache first (one lookup for
+    all of them) and caching what it resolves, so a postcode is only ever sent to
+    postcodes.io once, whichever batch or request asks for it.
+    Same return value as postcodes_to_coords.
+    """
+    unique = list(dict.fromkeys(normalise_postcode(p) for p in postcodes if p.strip()))
+    cached = await get_many_cache([f"geocode:{p}" for p in unique])
+    coords = {}
+    for p in unique:
+        value = cached.get(f"geocode:{p}")
+        if value is not None:
+            coords[p] = (value["latitude"], value["longitude"])
+    missing = [p for p in unique if p not in coords]
+    if missing:
+        resolved = await postcodes_to_coords(missing)
+        coords.update(resolved)
+        await set_many_with_stale({
+            f"geocode:{p}": {"latitude": lat, "longitude": lon}
+            for p, (lat, lon) in resolved.items() if lat is not None and lon is not None
+        })
+    return {p: coords.get(p, (None, None)) for p in unique}
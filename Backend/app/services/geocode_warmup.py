@@ -0,0 +1,82 @@
+import json
+import os
+from collections import Counter
+
+from app.services.cache import get_many_cache
+from app.services.fallback import set_many_with_stale
+from app.services.geocode_service import normalise_postcode
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Where the hot-postcode snapshot is written on shutdown and read back on startup,
+# so a restarted instance doesn't start with a cold geocode cache. Leave empty to disable.
+GEOCODE_SNAPSHOT_PATH = os.getenv("GEOCODE_SNAPSHOT_PATH", "data/geocode_snapshot.json")
+# How many of the most-requested postcodes go into the snapshot.
+GEOCODE_SNAPSHOT_SIZE = int(os.getenv("GEOCODE_SNAPSHOT_SIZE", "5000"))
+# Most postcodes we keep request counts for; the least requested are dropped past this.
+POSTCODE_STATS_MAX = int(os.getenv("POSTCODE_STATS_MAX", "50000"))
+
+# Normalised postcode -> how many times it was asked for.
+_requests = Counter()
+
+
+def record_postcode_requests(postcodes):
+    """Count geocode requests per postcode, to know which ones are worth warming up."""
+    for postcode in postcodes:
+        if postcode:
+            _requests[postcode] += 1
+    if len(_requests) > POSTCODE_STATS_MAX:
+        # Keep the busiest half; the long tail isn't worth the memory.
+        keep = _requests.most_common(POSTCODE_STATS_MAX // 2)
+        _requests.clear()
+        _requests.update(dict(keep))
+
+
+async def save_geocode_snapshot(path: str = GEOCODE_SNAPSHOT_PATH, size: int = GEOCODE_SNAPSHOT_SIZE) -> int:
+    """
+    Write the most-requested postcodes and their cached coordinates to `path`.
+    Called on app shutdown. Returns how many postcodes were written.
+    """
+    if not path:
+        return 0
+    top = _requests.most_common(size)
+    cached = await get_many_cache([f"geocode:{postcode}" for postcode, _ in top])
+    entries = []
+    for postcode, count in top:
+        value = cached.get(f"geocode:{postcode}")
+        if value is not None:
+            entries.append({"postcode": postcode, "count": count,
+                            "latitude": value["latitude"], "longitude": value["longitude"]})
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"postcodes": entries}, f)
+    # Swap the new file in at once so a crash never leaves a half-written snapshot.
+    os.replace(tmp_path, path)
+    return len(entries)
+
+
+async def warm_geocode_cache(path: str = GEOCODE_SNAPSHOT_PATH) -> int:
+    """
+    Preload the geocode cache from the snapshot written on the last shutdown.
+    The request counts are carried over (halved, so old favourites fade out).
+    Called on app startup. Returns how many postcodes were loaded.
+    """
+    if not path or not os.path.exists(path):
+        return 0
+    try:
+        with open(path, encoding="utf-8") as f:
+            entries = json.load(f)["postcodes"]
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning("could not read geocode snapshot", extra={"path": path, "error": str(e)})
+        return 0
+    values = {}
+    for entry in entries:
+        postcode = normalise_postcode(entry["postcode"])
+        values[f"geocode:{postcode}"] = {"latitude": entry["latitude"], "longitude": entry["longitude"]}
+        _requests[postcode] += max(1, entry.get("count", 1) // 2)
+    await set_many_with_stale(values)
+    return len(values)
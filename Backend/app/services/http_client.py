@@ -0,0 +1,79 @@
+import os
+
+import httpx
+
+# Settings for the shared HTTP client used to talk to postcodes.io and OSRM.
+# - HTTP_MAX_CONNECTIONS: total open connections across all upstream hosts
+# - HTTP_MAX_KEEPALIVE: idle connections kept around for reuse (saves the TCP+TLS handshake)
+# - HTTP_CONNECT_TIMEOUT / HTTP_READ_TIMEOUT: seconds before we give up on an upstream
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "3"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "10"))
+HTTP_POOL_TIMEOUT = float(os.getenv("HTTP_POOL_TIMEOUT", "5"))
+
+# HTTP/2 needs the optional "h2" package (pip install httpx[http2]).
+# httpx only uses it when the upstream agrees to it, otherwise it falls back to HTTP/1.1.
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# The one client shared by the whole app. Created on startup, closed on shutdown.
+_client = None
+
+
+def create_http_client(transport: httpx.AsyncBaseTransport = None) -> httpx.AsyncClient:
+    """
+    Build an AsyncClient with connection pooling, keep-alive and explicit timeouts.
+    Pass a transport (e.g. httpx.MockTransport) to fake the upstream APIs in tests.
+    """
+    limits = httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+    )
+    timeout = httpx.Timeout(
+        connect=HTTP_CONNECT_TIMEOUT,
+        read=HTTP_READ_TIMEOUT,
+        write=HTTP_READ_TIMEOUT,
+        pool=HTTP_POOL_TIMEOUT,
+    )
+    return httpx.AsyncClient(
+        limits=limits,
+        timeout=timeout,
+        http2=HTTP2_AVAILABLE and transport is None,
+        transport=transport,
+    )
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Return the shared HTTP client.
+    If the app lifespan hasn't created one yet (e.g. a one-off script), make it now.
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = create_http_client()
+    return _client
+
+
+def set_http_client(client: httpx.AsyncClient):
+    """Swap in a different client, e.g. one built with httpx.MockTransport for tests."""
+    global _client
+    _client = client
+
+
+async def start_http_client():
+    """Create the shared client. Called on app startup."""
+    get_http_client()
+
+
+async def close_http_client():
+    """Close every pooled connection. Called on app shutdown."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
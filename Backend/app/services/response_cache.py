@@ -0,0 +1,260 @@
+import hashlib
+import os
+import time
+
+import redis.asyncio as redis
+from fastapi import Request, Response
+from redis.exceptions import RedisError
+
+from app.services.cache import CACHE_KEY_PREFIX, REDIS_URL, TTLCache
+from app.utils.logger import get_logger
+from app.utils.metrics import Counter
+from app.utils.responses import dumps
+
+logger = get_logger(__name__)
+
+# Read-through cache of serialized room responses, with ETags for conditional GETs.
+#
+# Every room has a version and the room collection has a generation. Both are taken
+# from one clock that only moves forward (at least the current time in milliseconds,
+# and always above the last number handed out), so a number is never handed out twice,
+# not even after a restart or after a room's version expired. The ETag of a response is
+# built from them, and cached bodies are stored under their ETag:
+#   - room detail:  the room's version
+#   - room listing: the collection generation plus the query
+# update_room/delete_room give the room a new version and bump the generation,
+# create_room only bumps the generation. Old entries are then never looked up again
+# and age out of the LRU.
+#
+# With a version store (REDIS_URL), the clock, the versions and the generation are
+# Redis keys, so a write on one worker changes the ETags every worker hands out. If
+# Redis can't be reached, responses are served uncached (no ETag) until it's back.
+# Without one they live in this process only, so they are renewed every
+# RESPONSE_CACHE_TTL seconds: with several instances, one that didn't handle a write
+# keeps serving its copy (or answering 304) for at most that long.
+# - RESPONSE_CACHE_TTL: how long (seconds) a cached response stays valid
+# - RESPONSE_CACHE_MAX_BYTES: memory budget for cached responses
+# - ROOM_VERSIONS_MAX: how many room versions we remember (without a version store)
+# - ROOM_VERSION_TTL: how long (seconds) the version store keeps a room's version
+#   after it was last assigned; a room seen again later just gets a new one
+# - ROOMS_CACHE_CONTROL: Cache-Control header sent with room responses
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", "30"))
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+ROOM_VERSIONS_MAX = int(os.getenv("ROOM_VERSIONS_MAX", "100000"))
+ROOM_VERSION_TTL = int(os.getenv("ROOM_VERSION_TTL", str(24 * 3600)))
+ROOMS_CACHE_CONTROL = os.getenv("ROOMS_CACHE_CONTROL", "public, max-age=0, must-revalidate")
+VERSION_KEY_PREFIX = CACHE_KEY_PREFIX + "rooms:"
+_CLOCK_KEY = VERSION_KEY_PREFIX + "clock"
+_GENERATION_KEY = VERSION_KEY_PREFIX + "generation"
+
+# Without a version store:
+_clock = 0
+_generation = None
+_generation_at = 0.0
+# room_id -> version. Rooms we haven't seen yet get a new version on first read.
+_room_versions = TTLCache(max_entries=ROOM_VERSIONS_MAX, max_bytes=RESPONSE_CACHE_MAX_BYTES,
+                          default_ttl=RESPONSE_CACHE_TTL)
+# ETag -> serialized JSON body (always in this process: only the versions are shared).
+_bodies = TTLCache(max_entries=ROOM_VERSIONS_MAX, max_bytes=RESPONSE_CACHE_MAX_BYTES,
+                   default_ttl=RESPONSE_CACHE_TTL)
+_version_store = None
+
+# The shared clock: INCR, but never behind the caller's current time (ARGV[1], in ms).
+_NEXT_VERSION = """
+local v = redis.call('INCR', KEYS[1])
+if v < tonumber(ARGV[1]) then
+    v = tonumber(ARGV[1])
+    redis.call('SET', KEYS[1], ARGV[1])
+end
+"""
+
+# KEYS: clock, version key. ARGV: now (ms), TTL of the version key (s, 0 for none).
+# Returns the version, assigning a new one if the key doesn't exist.
+_GET_VERSION_SCRIPT = """
+local current = redis.call('GET', KEYS[2])
+if current then
+    return tonumber(current)
+end
+""" + _NEXT_VERSION + """
+if tonumber(ARGV[2]) > 0 then
+    redis.call('SET', KEYS[2], v, 'EX', ARGV[2])
+else
+    redis.call('SET', KEYS[2], v)
+end
+return v
+"""
+
+# KEYS: clock, generation, then any room version keys. ARGV: now (ms), room version TTL (s).
+# Gives the generation and the rooms one new version.
+_BUMP_SCRIPT = _NEXT_VERSION + """
+redis.call('SET', KEYS[2], v)
+for i = 3, #KEYS do
+    redis.call('SET', KEYS[i], v, 'EX', ARGV[2])
+end
+return v
+"""
+
+response_cache_total = Counter(
+    "response_cache_total", "Room responses by cache outcome (hit, miss, not_modified).", ("route", "outcome"))
+
+
+def _now_ms() -> int:
+    return time.time_ns() // 1_000_000
+
+
+def _next_version() -> int:
+    global _clock
+    _clock = max(_clock + 1, _now_ms())
+    return _clock
+
+
+async def room_etag(room_id: str, create: bool = True):
+    """
+    Current ETag of a room's detail response. If we don't know the room's version yet,
+    a new one is assigned (or None is returned when create is False). None as well
+    when the version store can't be reached.
+    """
+    if _version_store is not None:
+        if not create:
+            version = await _version_store.get(VERSION_KEY_PREFIX + room_id)
+        else:
+            version = await _version_store.get_version(VERSION_KEY_PREFIX + room_id, ROOM_VERSION_TTL)
+        return f'"r{int(version)}"' if version is not None else None
+    version = _room_versions.get(room_id)
+    if version is None:
+        if not create:
+            return None
+        version = _next_version()
+        _room_versions.set(room_id, version)
+    return f'"r{version}"'
+
+
+async def rooms_list_etag(*params):
+    """Current ETag of a listing page, given everything that selects the page (None without a version store to read)."""
+    if _version_store is not None:
+        generation = await _version_store.get_version(_GENERATION_KEY, 0)
+        if generation is None:
+            return None
+    else:
+        if _generation is None or time.monotonic() - _generation_at >= RESPONSE_CACHE_TTL:
+            _bump_local()
+        generation = _generation
+    query = hashlib.sha1(repr(params).encode()).hexdigest()[:16]
+    return f'"g{generation}-{query}"'
+
+
+async def room_changed(*room_ids: str):
+    """Rooms were updated or deleted: a new version for each, a new generation for listings."""
+    if _version_store is not None:
+        # Bodies cached under the old versions are never looked up again and age out.
+        await _version_store.bump([VERSION_KEY_PREFIX + room_id for room_id in room_ids])
+        return
+    for room_id in room_ids:
+        old_etag = await room_etag(room_id, create=False)
+        if old_etag is not None:
+            _bodies.delete(old_etag)
+        _room_versions.set(room_id, _next_version())
+    _bump_local()
+
+
+async def rooms_changed():
+    """Rooms were added: listings change, existing rooms don't."""
+    await room_changed()
+
+
+def _bump_local():
+    global _generation, _generation_at
+    _generation = _next_version()
+    _generation_at = time.monotonic()
+
+
+class RedisVersionStore:
+    """
+    Room versions and the listing generation, shared by every worker and replica.
+    Redis errors are logged and reported as "no version" (None), so callers skip
+    the cache rather than fail the request.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self._get_version = client.register_script(_GET_VERSION_SCRIPT)
+        self._bump = client.register_script(_BUMP_SCRIPT)
+
+    async def get(self, key: str):
+        try:
+            return await self.client.get(key)
+        except RedisError as e:
+            logger.warning("response cache version store unavailable", extra={"error": str(e)})
+            return None
+
+    async def get_version(self, key: str, ttl: int):
+        try:
+            return await self._get_version(keys=[_CLOCK_KEY, key], args=[_now_ms(), ttl])
+        except RedisError as e:
+            logger.warning("response cache version store unavailable", extra={"error": str(e)})
+            return None
+
+    async def bump(self, keys: list):
+        try:
+            await self._bump(keys=[_CLOCK_KEY, _GENERATION_KEY, *keys], args=[_now_ms(), ROOM_VERSION_TTL])
+        except RedisError as e:
+            # Other workers keep their ETags until the entries expire (RESPONSE_CACHE_TTL at most).
+            logger.warning("response cache versions not shared", extra={"error": str(e)})
+
+
+def use_version_store(client):
+    """Share room versions through this Redis client (or None for this worker only), e.g. a fakeredis one in tests."""
+    global _version_store
+    _version_store = RedisVersionStore(client) if client is not None else None
+
+
+async def connect_version_store(url: str = REDIS_URL):
+    """Connect the shared version store on startup, if a REDIS_URL is configured."""
+    if url:
+        use_version_store(redis.from_url(url))
+
+
+async def close_version_store():
+    """Close the Redis connection pool on shutdown."""
+    if _version_store is not None:
+        await _version_store.client.aclose()
+        use_version_store(None)
+
+
+def is_not_modified(request: Request, etag: str) -> bool:
+    """Does the client's If-None-Match already name this ETag? (weak comparison, as HTTP requires)"""
+    header = request.headers.get("if-none-match")
+    if not header or etag is None:
+        return False
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+
+def _headers(etag: str) -> dict:
+    return {"ETag": etag, "Cache-Control": ROOMS_CACHE_CONTROL}
+
+
+def not_modified_response(etag: str) -> Response:
+    return Response(status_code=304, headers=_headers(etag))
+
+
+def get_cached_body(etag: str):
+    return _bodies.get(etag) if etag is not None else None
+
+
+def json_response(etag: str, content, body: bytes = None) -> Response:
+    """
+    JSON response with the ETag and Cache-Control headers. The serialized body is
+    cached under the ETag (pass `body` when it came from the cache already).
+    With no ETag (the version store is down) nothing is cached.
+    """
+    if etag is None:
+        return Response(content=dumps(content), media_type="application/json")
+    if body is None:
+        body = dumps(content)
+        _bodies.set(etag, body)
+    return Response(content=body, media_type="application/json", headers=_headers(etag))
+
+
+def response_cache_stats() -> dict:
+    """Hit/miss counters and size of the cached response bodies."""
+    return _bodies.stats()
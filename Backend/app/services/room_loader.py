@@ -0,0 +1,75 @@
+import asyncio
+
+from bson.objectid import ObjectId
+
+from app.db.mongodb import read_db
+
+# The room fields embedded in other resources (e.g. GET /applications/?expand=room).
+ROOM_SUMMARY_FIELDS = {"title": 1, "address": 1, "postcode": 1, "price_per_month": 1}
+
+
+def room_summary_serializer(room):
+    return {
+        "id": str(room["_id"]),
+        "title": room["title"],
+        "address": room["address"],
+        "postcode": room["postcode"],
+        "price_per_month": float(room["price_per_month"]),
+    }
+
+
+class RoomLoader:
+    """
+    Looks up room summaries for one request, batching and deduplicating the lookups.
+
+    Every load() made in the same event loop tick is answered by a single
+    `_id: {$in: [...]}` query, and each room is fetched at most once per loader,
+    however many times it is asked for. Create one per request (see get_room_loader),
+    so a room changed by another request is never served from here.
+    """
+
+    def __init__(self, collection=None):
+        self._collection = collection
+        self._futures = {}  # room_id -> future with the summary (None if there is no such room)
+        self._pending = []  # room_ids asked for since the last query
+        # The event loop only keeps weak references to tasks, so hold on to the
+        # queries in flight until they finish.
+        self._dispatches = set()
+
+    def load(self, room_id: str) -> asyncio.Future:
+        future = self._futures.get(room_id)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = self._futures[room_id] = loop.create_future()
+            self._pending.append(room_id)
+            if len(self._pending) == 1:
+                # Wait for the rest of this tick's load() calls, then query them all at once.
+                loop.call_soon(self._start_dispatch)
+        return future
+
+    def _start_dispatch(self):
+        task = asyncio.ensure_future(self._dispatch())
+        self._dispatches.add(task)
+        task.add_done_callback(self._dispatches.discard)
+
+    async def load_many(self, room_ids) -> list:
+        return list(await asyncio.gather(*(self.load(room_id) for room_id in room_ids)))
+
+    async def _dispatch(self):
+        room_ids, self._pending = self._pending, []
+        collection = self._collection if self._collection is not None else read_db.rooms
+        object_ids = [ObjectId(room_id) for room_id in room_ids if ObjectId.is_valid(room_id)]
+        try:
+            docs = await collection.find({"_id": {"$in": object_ids}}, ROOM_SUMMARY_FIELDS).to_list(None)
+        except Exception as e:
+            for room_id in room_ids:
+                self._futures.pop(room_id).set_exception(e)
+            return
+        found = {str(doc["_id"]): room_summary_serializer(doc) for doc in docs}
+        for room_id in room_ids:
+            self._futures[room_id].set_result(found.get(room_id))
+
+
+def get_room_loader() -> RoomLoader:
+    """FastAPI dependency: a fresh loader for each request."""
+    return RoomLoader()
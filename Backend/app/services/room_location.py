@@ -0,0 +1,257 @@
+import asyncio
+import os
+from datetime import datetime
+
+from bson.objectid import ObjectId
+from pymongo import UpdateOne
+
+from app.db.mongodb import db
+from app.services.campus import CAMPUS_POSTCODES, DEFAULT_CAMPUS, get_campus_coords
+from app.services.distance_service import calculate_osrm_distances
+from app.services.geo_index import geo_point, index_room_point
+from app.services.geocode_service import cached_postcodes_to_coords, normalise_postcode
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Stored locations are measured to the default campus (see app/services/campus.py).
+CAMPUS_POSTCODE = normalise_postcode(CAMPUS_POSTCODES[DEFAULT_CAMPUS])
+
+# Bump this whenever the way we compute locations changes,
+# so every stored location is treated as stale and gets recomputed.
+# Version 2 added the GeoJSON "geo" field used by /rooms/nearby.
+# Version 3 records which campus postcode the distance was measured to.
+LOCATION_VERSION = 3
+
+# Background queue settings.
+# - LOCATION_WORKERS: how many rooms we geocode/route at the same time
+# - LOCATION_QUEUE_SIZE: how many rooms can wait in the queue before new ones are dropped
+#   (dropped rooms are still picked up by the backfill command or the next read)
+# - LOCATION_RETRY_INTERVAL: how often (seconds) rooms whose routing failed are queued again
+LOCATION_WORKERS = int(os.getenv("LOCATION_WORKERS", "4"))
+LOCATION_QUEUE_SIZE = int(os.getenv("LOCATION_QUEUE_SIZE", "1000"))
+LOCATION_RETRY_INTERVAL = int(os.getenv("LOCATION_RETRY_INTERVAL", "300"))
+# Most pending rooms queued again per retry round.
+LOCATION_RETRY_BATCH = 500
+
+_queue = None
+_queued_ids = set()
+_workers = []
+
+
+def is_location_fresh(room: dict) -> bool:
+    """
+    A stored location is fresh if it was computed with the current LOCATION_VERSION,
+    for the postcode the room has right now and to the current default campus,
+    and isn't still waiting for its campus distance (see compute_locations).
+    """
+    location = room.get("location")
+    return bool(
+        location
+        and not location.get("pending")
+        and location.get("version") == LOCATION_VERSION
+        and location.get("postcode") == normalise_postcode(room["postcode"])
+        and location.get("campus_postcode") == CAMPUS_POSTCODE
+    )
+
+
+async def compute_locations(rooms: list, concurrency: int = LOCATION_WORKERS) -> dict:
+    """
+    Work out coordinates and distance to the default campus for a batch of room documents.
+    All postcodes are geocoded in one deduplicated bulk lookup (skipping the ones
+    already in the geocode cache), then every room is
+    routed to campus through OSRM /table requests (at most `concurrency` in flight).
+
+    Rooms that were geocoded but couldn't be routed (OSRM down or no route) still get
+    their coordinates, so they show up in /rooms/nearby, with no distance and
+    "pending": True, which marks them to be tried again.
+
+    Returns:
+        dict: {room _id: location dict} for the rooms we could geocode.
+    """
+    campus_lat, campus_lon = await get_campus_coords()
+    if campus_lat is None:
+        return {}
+    coords = await cached_postcodes_to_coords([room["postcode"] for room in rooms])
+    # Only rooms whose postcode was found can be routed.
+    located = [(room, coords[normalise_postcode(room["postcode"])]) for room in rooms
+               if coords.get(normalise_postcode(room["postcode"]), (None, None))[0] is not None]
+    distances = await calculate_osrm_distances([point for _, point in located], campus_lat, campus_lon, concurrency)
+
+    locations = {}
+    for (room, (lat, lon)), (meters, duration) in zip(located, distances):
+        locations[room["_id"]] = {
+            "postcode": normalise_postcode(room["postcode"]),
+            "latitude": lat,
+            "longitude": lon,
+            "distance_meters": meters,
+            "duration_seconds": duration,
+            "campus_postcode": CAMPUS_POSTCODE,
+            "version": LOCATION_VERSION,
+            "computed_at": datetime.utcnow(),
+        }
+        if meters is None:
+            locations[room["_id"]]["pending"] = True
+    return locations
+
+
+async def save_locations(rooms: list, locations: dict):
+    """
+    Store computed locations on the room documents, plus a GeoJSON point ("geo")
+    for the 2dsphere index behind /rooms/nearby, in one unordered bulk_write.
+    We only write if the postcode hasn't changed in the meantime, so a slow
+    computation can't overwrite the location of a room that was just edited.
+    """
+    saved = [room for room in rooms if room["_id"] in locations]
+    if not saved:
+        return
+    operations = [
+        UpdateOne(
+            {"_id": room["_id"], "postcode": room["postcode"]},
+            {"$set": {"location": locations[room["_id"]],
+                      "geo": geo_point(locations[room["_id"]]["latitude"], locations[room["_id"]]["longitude"])}},
+        )
+        for room in saved
+    ]
+    result = await db.rooms.bulk_write(operations, ordered=False)
+    if result.matched_count < len(saved):
+        # Some postcodes changed while we worked: only index the rooms that were written.
+        cursor = db.rooms.find({"_id": {"$in": [room["_id"] for room in saved]}}, {"postcode": 1})
+        current = {room["_id"]: room["postcode"] async for room in cursor}
+        saved = [room for room in saved if current.get(room["_id"]) == room["postcode"]]
+    for room in saved:
+        location = locations[room["_id"]]
+        index_room_point(str(room["_id"]), location["latitude"], location["longitude"])
+
+
+async def refresh_room_location(room_id: str):
+    """Recompute and store the location for a single room."""
+    room = await db.rooms.find_one({"_id": ObjectId(room_id)}, {"postcode": 1, "location": 1})
+    if not room or is_location_fresh(room):
+        return
+    await save_locations([room], await compute_locations([room]))
+
+
+async def refresh_room_locations(room_ids: list):
+    """Recompute and store the locations of a batch of rooms, with one bulk geocode for all of them."""
+    cursor = db.rooms.find({"_id": {"$in": [ObjectId(room_id) for room_id in room_ids]}}, {"postcode": 1, "location": 1})
+    rooms = [room async for room in cursor if not is_location_fresh(room)]
+    if rooms:
+        await save_locations(rooms, await compute_locations(rooms))
+
+
+def enqueue_room_location(room_id: str) -> bool:
+    """
+    Ask the background workers to (re)compute a room's location.
+    Returns False if the queue isn't running or is full.
+    """
+    if _queue is None or room_id in _queued_ids:
+        return False
+    try:
+        _queue.put_nowait(room_id)
+    except asyncio.QueueFull:
+        logger.warning("location queue full, skipping room", extra={"room_id": room_id})
+        return False
+    _queued_ids.add(room_id)
+    return True
+
+
+def enqueue_room_locations(room_ids: list) -> bool:
+    """
+    Like enqueue_room_location, for many new rooms at once (e.g. a bulk import):
+    they go into the queue as one item and are geocoded and routed together.
+    """
+    if _queue is None or not room_ids:
+        return False
+    try:
+        _queue.put_nowait(tuple(room_ids))
+    except asyncio.QueueFull:
+        logger.warning("location queue full, skipping rooms", extra={"rooms": len(room_ids)})
+        return False
+    return True
+
+
+async def _worker():
+    while True:
+        item = await _queue.get()
+        try:
+            if isinstance(item, tuple):
+                await refresh_room_locations(item)
+            else:
+                _queued_ids.discard(item)
+                await refresh_room_location(item)
+        except Exception:
+            # One bad room shouldn't kill the worker.
+            extra = {"rooms": len(item)} if isinstance(item, tuple) else {"room_id": item}
+            logger.exception("failed to compute room location", extra=extra)
+        finally:
+            _queue.task_done()
+
+
+async def retry_pending_locations(limit: int = LOCATION_RETRY_BATCH) -> int:
+    """Queue rooms whose routing failed (location.pending) to be computed again. Returns how many."""
+    cursor = db.rooms.find({"location.pending": True}, {"_id": 1}).limit(limit)
+    room_ids = [str(room["_id"]) async for room in cursor]
+    return len(room_ids) if enqueue_room_locations(room_ids) else 0
+
+
+async def _retry_forever(interval: int):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await retry_pending_locations()
+        except Exception:
+            logger.exception("failed to queue pending room locations")
+
+
+async def start_location_workers(count: int = LOCATION_WORKERS, retry_interval: int = LOCATION_RETRY_INTERVAL):
+    """Start the background workers, and the task retrying pending locations. Called on app startup."""
+    global _queue
+    _queue = asyncio.Queue(maxsize=LOCATION_QUEUE_SIZE)
+    for _ in range(count):
+        _workers.append(asyncio.get_running_loop().create_task(_worker()))
+    _workers.append(asyncio.get_running_loop().create_task(_retry_forever(retry_interval)))
+
+
+async def stop_location_workers():
+    """Stop the background workers. Called on app shutdown (unfinished rooms are left for backfill)."""
+    global _queue
+    for task in _workers:
+        task.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+    _queued_ids.clear()
+    _queue = None
+
+
+async def backfill_locations(batch_size: int = 100, concurrency: int = LOCATION_WORKERS,
+                             recompute_all: bool = False) -> int:
+    """
+    Compute locations for existing rooms that don't have a current one.
+    Rooms are processed in batches of `batch_size`, each batch geocoded in bulk.
+    Returns how many rooms were updated (rooms still waiting for a distance included).
+    """
+    query = {} if recompute_all else {
+        "$or": [
+            {"location": {"$exists": False}},
+            {"location.version": {"$ne": LOCATION_VERSION}},
+            {"location.campus_postcode": {"$ne": CAMPUS_POSTCODE}},
+            {"location.pending": True},
+        ]
+    }
+    updated = 0
+    batch = []
+    async for room in db.rooms.find(query, {"postcode": 1, "location": 1}):
+        if not recompute_all and is_location_fresh(room):
+            continue
+        batch.append(room)
+        if len(batch) >= batch_size:
+            locations = await compute_locations(batch, concurrency)
+            await save_locations(batch, locations)
+            updated += len(locations)
+            batch = []
+    if batch:
+        locations = await compute_locations(batch, concurrency)
+        await save_locations(batch, locations)
+        updated += len(locations)
+    return updated
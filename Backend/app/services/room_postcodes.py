@@ -0,0 +1,42 @@
+from pymongo import UpdateOne
+
+from app.db.mongodb import db
+from app.services.geocode_service import normalise_postcode
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Rooms keep their postcode as it was entered ("e1 4ns") for display, plus this
+# normalised copy ("E14NS") that the listing's postcode filter matches on, so a
+# prefix search finds a room however its postcode was typed.
+POSTCODE_KEY = "postcode_key"
+
+
+def with_postcode_key(room: dict) -> dict:
+    """Add the normalised postcode to a room document (or $set dict) that has a postcode."""
+    if room.get("postcode") is not None:
+        room[POSTCODE_KEY] = normalise_postcode(room["postcode"])
+    return room
+
+
+async def backfill_postcode_keys(batch_size: int = 1000) -> int:
+    """
+    Give every room stored without a normalised postcode one, in bulk_write batches.
+    Returns how many rooms were updated. Safe to run any number of times; once every
+    room has its key this is a single index lookup, so it also runs on startup.
+    """
+    updated = 0
+    # {POSTCODE_KEY: None} matches missing keys and can use the postcode_key index.
+    cursor = db.rooms.find({POSTCODE_KEY: None, "postcode": {"$type": "string"}}, {"postcode": 1})
+    operations = []
+    async for room in cursor:
+        operations.append(UpdateOne({"_id": room["_id"]},
+                                    {"$set": {POSTCODE_KEY: normalise_postcode(room["postcode"])}}))
+        if len(operations) >= batch_size:
+            updated += (await db.rooms.bulk_write(operations, ordered=False)).modified_count
+            operations = []
+    if operations:
+        updated += (await db.rooms.bulk_write(operations, ordered=False)).modified_count
+    if updated:
+        logger.info("room postcode keys backfilled", extra={"rooms": updated})
+    return updated
@@ -0,0 +1,103 @@
+from bson.objectid import ObjectId
+from pymongo import DeleteOne, ReplaceOne
+
+from app.db.mongodb import db
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Application statuses every stats response reports (0 if a room has none).
+APPLICATION_STATUSES = ("applied", "cancelled", "approved")
+
+# Per-room application counters live in their own collection, one document per room:
+#   {"_id": <room ObjectId>, "counts": {"applied": 3, "cancelled": 1}}
+# so reading a room's stats is a single _id lookup instead of scanning db.applications.
+# apply_for_room and cancel_application keep them up to date with $inc;
+# reconcile_room_stats() rebuilds them from the applications themselves.
+STATS_COLLECTION = "room_stats"
+
+
+async def count_application(room_id: str, status: str, amount: int = 1):
+    """Add `amount` to a room's counter for `status` (creates the room's counters on first use)."""
+    await db[STATS_COLLECTION].update_one(
+        {"_id": ObjectId(room_id)}, {"$inc": {f"counts.{status}": amount}}, upsert=True,
+    )
+
+
+async def move_application(room_id: str, old_status: str, new_status: str):
+    """Move one application of a room from one status counter to another, in one atomic update."""
+    if old_status == new_status:
+        return
+    await db[STATS_COLLECTION].update_one(
+        {"_id": ObjectId(room_id)},
+        {"$inc": {f"counts.{old_status}": -1, f"counts.{new_status}": 1}},
+        upsert=True,
+    )
+
+
+def stats_serializer(room_id: str, doc) -> dict:
+    counts = (doc or {}).get("counts", {})
+    stats = {status: counts.get(status, 0) for status in APPLICATION_STATUSES}
+    stats["total"] = sum(counts.values())
+    return {"room_id": room_id, **stats}
+
+
+async def get_room_stats(room_ids: list) -> dict:
+    """Counters for each of `room_ids` (valid ObjectId strings), read in one query. Missing rooms are absent."""
+    cursor = db[STATS_COLLECTION].find({"_id": {"$in": [ObjectId(room_id) for room_id in room_ids]}})
+    return {str(doc["_id"]): doc async for doc in cursor}
+
+
+def _nonzero(counts: dict) -> dict:
+    # A counter that went back to 0 (e.g. applied after a cancel) counts the same as a missing one.
+    return {status: n for status, n in counts.items() if n}
+
+
+async def reconcile_room_stats(batch_size: int = 1000) -> dict:
+    """
+    Rebuild every room's counters from db.applications and fix the ones that drifted
+    (e.g. a request that died between writing an application and bumping its counter).
+
+    Counters bumped while this runs can be overwritten by the recount, so run it
+    when applications are quiet (or just run it again).
+    """
+    pipeline = [
+        {"$group": {"_id": {"room_id": "$room_id", "status": "$status"}, "n": {"$sum": 1}}},
+        {"$group": {"_id": "$_id.room_id", "counts": {"$push": {"k": "$_id.status", "v": "$n"}}}},
+    ]
+    report = {"rooms": 0, "corrected": 0, "removed": 0}
+    seen = set()
+    batch = {}
+
+    async def fix(batch):
+        existing = await get_room_stats(list(batch))
+        operations = [
+            ReplaceOne({"_id": ObjectId(room_id)}, {"counts": counts}, upsert=True)
+            for room_id, counts in batch.items()
+            if _nonzero(existing.get(room_id, {}).get("counts", {})) != counts
+        ]
+        if operations:
+            await db[STATS_COLLECTION].bulk_write(operations, ordered=False)
+        report["corrected"] += len(operations)
+
+    async for group in db.applications.aggregate(pipeline, allowDiskUse=True):
+        room_id = group["_id"]
+        if not isinstance(room_id, str) or not ObjectId.is_valid(room_id):
+            continue
+        seen.add(room_id)
+        batch[room_id] = {item["k"]: item["v"] for item in group["counts"]}
+        if len(batch) >= batch_size:
+            await fix(batch)
+            batch = {}
+    if batch:
+        await fix(batch)
+    report["rooms"] = len(seen)
+
+    # Counters for rooms that no longer have any application.
+    stale = [DeleteOne({"_id": doc["_id"]})
+             async for doc in db[STATS_COLLECTION].find({}, {"_id": 1}) if str(doc["_id"]) not in seen]
+    if stale:
+        await db[STATS_COLLECTION].bulk_write(stale, ordered=False)
+    report["removed"] = len(stale)
+    logger.info("room stats reconciled", extra=report)
+    return report
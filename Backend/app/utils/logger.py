@@ -0,0 +1,48 @@
+import json
+import logging
+import os
+import sys
+from datetime import datetime, timezone
+
+# Log level for the whole app, e.g. LOG_LEVEL=DEBUG while developing.
+# Messages below this level are skipped before they're even formatted.
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+
+# Attributes every LogRecord has. Anything else was passed with extra={...}
+# and gets written out as its own field.
+_STANDARD_ATTRS = set(logging.makeLogRecord({}).__dict__) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """Writes each log record as one JSON object per line, including any extra={...} fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _STANDARD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+_handler = logging.StreamHandler(sys.stdout)
+_handler.setFormatter(JsonFormatter())
+_app_logger = logging.getLogger("app")
+_app_logger.addHandler(_handler)
+_app_logger.setLevel(LOG_LEVEL)
+_app_logger.propagate = False
+
+
+def get_logger(name: str) -> logging.Logger:
+    """
+    Get a structured logger for a module, e.g. logger = get_logger(__name__).
+    Pass details as fields instead of building strings:
+        logger.debug("postcode lookup", extra={"postcode": pc, "status": 200})
+    """
+    return logging.getLogger(name if name.startswith("app") else f"app.{name}")
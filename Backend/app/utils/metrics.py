@@ -0,0 +1,257 @@
+import threading
+import time
+from contextlib import asynccontextmanager
+
+from pymongo import monitoring
+
+# Default latency buckets in seconds (5ms .. 10s).
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Every metric registers itself here so /metrics can render them all.
+_registry = []
+# Functions called at scrape time that return extra samples,
+# e.g. cache counters that are kept elsewhere: [(name, type, help, {labels}, value), ...]
+_collectors = []
+_lock = threading.Lock()
+
+
+def _format_labels(labelnames, values) -> str:
+    if not labelnames:
+        return ""
+    pairs = []
+    for name, value in zip(labelnames, values):
+        escaped = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{name}="{escaped}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class Counter:
+    """A value that only goes up (requests served, errors seen...)."""
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values = {}
+        _registry.append(self)
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        for key, value in self._values.items():
+            yield self.name, key, value
+
+
+class Gauge(Counter):
+    """A value that goes up and down (requests in flight, pool size...)."""
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with _lock:
+            self._values[key] = value
+
+
+class Histogram:
+    """Counts observations (e.g. latencies) into buckets, plus their sum and count."""
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # labels -> [bucket counts..., sum, count]
+        self._values = {}
+        _registry.append(self)
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with _lock:
+            data = self._values.get(key)
+            if data is None:
+                data = self._values[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    data[i] += 1
+            data[-2] += value
+            data[-1] += 1
+
+    def samples(self):
+        labelnames = self.labelnames + ("le",)
+        for key, data in self._values.items():
+            for bound, count in zip(self.buckets, data):
+                yield self.name + "_bucket", key + (repr(float(bound)),), count, labelnames
+            yield self.name + "_bucket", key + ("+Inf",), data[-1], labelnames
+            yield self.name + "_sum", key, data[-2]
+            yield self.name + "_count", key, data[-1]
+
+
+def add_collector(collector):
+    """
+    Register a function that returns extra samples at scrape time, as a list of
+    (name, type, help, {label: value}, value) tuples.
+    """
+    _collectors.append(collector)
+
+
+def render_metrics() -> str:
+    """Render every metric in the Prometheus text exposition format."""
+    lines = []
+    with _lock:
+        for metric in _registry:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for sample in list(metric.samples()):
+                name, key, value = sample[:3]
+                labelnames = sample[3] if len(sample) > 3 else metric.labelnames
+                lines.append(f"{name}{_format_labels(labelnames, key)} {value}")
+    # Group collector samples by metric name: the format needs each metric's lines together.
+    families = {}
+    for collector in _collectors:
+        for name, kind, help, labels, value in collector():
+            family = families.setdefault(name, [f"# HELP {name} {help}", f"# TYPE {name} {kind}"])
+            family.append(f"{name}{_format_labels(tuple(labels), tuple(labels.values()))} {value}")
+    for family in families.values():
+        lines.extend(family)
+    return "\n".join(lines) + "\n"
+
+
+# --- Metrics used across the app ---
+
+http_requests_total = Counter(
+    "http_requests_total", "HTTP requests handled, by route and status code.", ("method", "route", "status"))
+http_request_duration_seconds = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route.", ("method", "route"))
+http_requests_in_flight = Gauge(
+    "http_requests_in_flight", "HTTP requests currently being handled.", ("method",))
+
+upstream_requests_total = Counter(
+    "upstream_requests_total", "Calls to external services (postcodes.io, OSRM) by outcome.",
+    ("service", "operation", "outcome"))
+upstream_request_duration_seconds = Histogram(
+    "upstream_request_duration_seconds", "Latency of calls to external services.", ("service", "operation"))
+
+geocode_local_lookups_total = Counter(
+    "geocode_local_lookups_total", "Postcode lookups in the local gazetteer (hit/miss).", ("outcome",))
+
+mongo_commands_total = Counter(
+    "mongo_commands_total", "MongoDB commands by command name and outcome.", ("command", "outcome"))
+mongo_command_duration_seconds = Histogram(
+    "mongo_command_duration_seconds", "MongoDB command latency.", ("command",))
+mongo_pool_checkout_wait_seconds = Histogram(
+    "mongo_pool_checkout_wait_seconds", "Time spent waiting for a pooled MongoDB connection.", ("address",),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0))
+mongo_pool_checkout_failures_total = Counter(
+    "mongo_pool_checkout_failures_total", "MongoDB connection checkouts that failed, by reason.", ("address", "reason"))
+mongo_pool_connections = Gauge(
+    "mongo_pool_connections", "Open MongoDB connections in the pool.", ("address",))
+mongo_pool_checked_out = Gauge(
+    "mongo_pool_checked_out", "MongoDB connections currently in use.", ("address",))
+
+
+class UpstreamCall:
+    """Handle returned by track_upstream(). Set .outcome to record something other than "ok"."""
+
+    def __init__(self):
+        self.outcome = "ok"
+
+
+@asynccontextmanager
+async def track_upstream(service: str, operation: str):
+    """
+    Time a call to an external service and count its outcome:
+
+        async with track_upstream("postcodes_io", "lookup") as call:
+            resp = await client.get(url)
+            if resp.status_code == 404:
+                call.outcome = "not_found"
+
+    Exceptions are recorded with outcome "error" (or "timeout") and re-raised.
+    """
+    call = UpstreamCall()
+    start = time.perf_counter()
+    try:
+        yield call
+    except Exception as e:
+        call.outcome = "timeout" if "Timeout" in type(e).__name__ else "error"
+        raise
+    finally:
+        upstream_request_duration_seconds.observe(time.perf_counter() - start, service=service, operation=operation)
+        upstream_requests_total.inc(service=service, operation=operation, outcome=call.outcome)
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """
+    Records the duration and outcome of every MongoDB command, without having
+    to wrap each db call. Registered on the Motor client in app/db/mongodb.py.
+    """
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        mongo_command_duration_seconds.observe(event.duration_micros / 1e6, command=event.command_name)
+        mongo_commands_total.inc(command=event.command_name, outcome="ok")
+
+    def failed(self, event):
+        mongo_command_duration_seconds.observe(event.duration_micros / 1e6, command=event.command_name)
+        mongo_commands_total.inc(command=event.command_name, outcome="error")
+
+
+def _address(event) -> str:
+    host, port = event.address
+    return f"{host}:{port}"
+
+
+class MongoPoolMetrics(monitoring.ConnectionPoolListener):
+    """
+    Records how long requests wait to check a connection out of the Motor pool,
+    and how many connections are open and in use, to size maxPoolSize against real load.
+    """
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        mongo_pool_connections.inc(address=_address(event))
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        mongo_pool_connections.dec(address=_address(event))
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        address = _address(event)
+        if event.duration is not None:
+            mongo_pool_checkout_wait_seconds.observe(event.duration, address=address)
+        mongo_pool_checkout_failures_total.inc(address=address, reason=str(event.reason))
+
+    def connection_checked_out(self, event):
+        address = _address(event)
+        if event.duration is not None:
+            mongo_pool_checkout_wait_seconds.observe(event.duration, address=address)
+        mongo_pool_checked_out.inc(address=address)
+
+    def connection_checked_in(self, event):
+        mongo_pool_checked_out.dec(address=_address(event))
@@ -0,0 +1,46 @@
+import base64
+import json
+
+from bson.errors import InvalidId
+from bson.objectid import ObjectId
+
+
+def encode_cursor(sort: str, sort_fields: list, doc: dict) -> str:
+    """
+    Build an opaque "next page" token from the last document of a page.
+    It remembers the sort option and the values of the sort fields, so the next
+    query can carry on right after this document (keyset pagination).
+    """
+    values = [str(doc[field]) if field == "_id" else doc[field] for field, _ in sort_fields]
+    raw = json.dumps({"s": sort, "v": values}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str, sort_fields: list):
+    """
+    Turn a token from encode_cursor back into the list of sort field values.
+    Returns None if the token is broken or was made for a different sort option.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        data = json.loads(raw)
+        if data["s"] != sort or len(data["v"]) != len(sort_fields):
+            return None
+        return [ObjectId(v) if field == "_id" else v for (field, _), v in zip(sort_fields, data["v"])]
+    except (ValueError, KeyError, TypeError, InvalidId):
+        return None
+
+
+def keyset_filter(sort_fields: list, values: list) -> dict:
+    """
+    MongoDB filter matching the documents that come after `values` in the given sort.
+    For a sort on (price asc, _id asc) this is:
+        price > p  OR  (price == p AND _id > id)
+    which lets the index jump straight to the next page instead of skipping rows.
+    """
+    clauses = []
+    for i, (field, direction) in enumerate(sort_fields):
+        clause = {f: v for (f, _), v in zip(sort_fields[:i], values[:i])}
+        clause[field] = {"$gt" if direction == 1 else "$lt": values[i]}
+        clauses.append(clause)
+    return clauses[0] if len(clauses) == 1 else {"$or": clauses}
@@ -0,0 +1,29 @@
+import orjson
+from bson.objectid import ObjectId
+from fastapi.responses import JSONResponse
+
+
+def _default(value):
+    # orjson handles datetime (ISO 8601, like Pydantic) and the basic types itself;
+    # this covers what can come straight out of a Mongo document.
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def dumps(content) -> bytes:
+    """Serialize JSON-ready content (dicts/lists from our serializers) with orjson."""
+    return orjson.dumps(content, default=_default)
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSON response encoded with orjson. It is the app's default response class.
+
+    A route that returns one directly skips FastAPI's response_model validation, so the
+    content must already match the route's response_model (that's what the *_serializer
+    helpers are for). The response_model is still what the OpenAPI docs describe.
+    """
+
+    def render(self, content) -> bytes:
+        return dumps(content)
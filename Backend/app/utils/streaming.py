@@ -0,0 +1,55 @@
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+
+from app.utils.responses import dumps
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+# How many documents MongoDB sends per round trip while streaming.
+STREAM_BATCH_SIZE = 500
+# How many serialized documents we group into one chunk written to the client.
+STREAM_FLUSH_EVERY = 100
+
+
+def wants_stream(request: Request, stream: bool) -> bool:
+    """A client opts in to streaming with ?stream=true or an Accept: application/x-ndjson header."""
+    return stream or NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+
+
+async def _stream_documents(cursor, serializer, ndjson: bool):
+    """
+    Serialize documents from a Motor cursor straight to bytes as they arrive,
+    so we never hold the whole result set in memory.
+    NDJSON writes one JSON object per line; otherwise we write a JSON array.
+    """
+    separator = b"\n" if ndjson else b","
+    chunk = []
+    first = True
+    if not ndjson:
+        yield b"["
+    async for doc in cursor:
+        data = dumps(serializer(doc))
+        if ndjson:
+            chunk.append(data + separator)
+        else:
+            chunk.append(data if first else separator + data)
+        first = False
+        if len(chunk) >= STREAM_FLUSH_EVERY:
+            yield b"".join(chunk)
+            chunk = []
+    if chunk:
+        yield b"".join(chunk)
+    if not ndjson:
+        yield b"]"
+
+
+def stream_response(request: Request, cursor, serializer) -> StreamingResponse:
+    """
+    Build a StreamingResponse from a Motor cursor.
+    NDJSON if the client asked for it in the Accept header, a JSON array otherwise.
+    """
+    ndjson = NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+    media_type = NDJSON_MEDIA_TYPE if ndjson else "application/json"
+    return StreamingResponse(
+        _stream_documents(cursor.batch_size(STREAM_BATCH_SIZE), serializer, ndjson),
+        media_type=media_type,
+    )
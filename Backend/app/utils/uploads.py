@@ -0,0 +1,94 @@
+import csv
+
+import orjson
+
+
+class RowTooLarge(ValueError):
+    """A single line/record of an upload is bigger than we're willing to buffer."""
+
+
+async def iter_lines(chunks, max_line_bytes: int):
+    """
+    Split an async stream of byte chunks (e.g. request.stream()) into lines,
+    without holding more than one chunk plus one partial line in memory.
+    Splitting the raw bytes on newlines is safe for UTF-8: a newline byte never
+    appears inside a multi-byte character.
+    """
+    buffer = b""
+    async for chunk in chunks:
+        if not chunk:
+            continue
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if len(line) > max_line_bytes:
+                raise RowTooLarge(f"line longer than {max_line_bytes} bytes")
+            yield line.rstrip(b"\r")
+        if len(buffer) > max_line_bytes:
+            raise RowTooLarge(f"line longer than {max_line_bytes} bytes")
+    if buffer:
+        yield buffer.rstrip(b"\r")
+
+
+async def iter_ndjson_rows(chunks, max_row_bytes: int):
+    """
+    Yield (row_number, row, error) for every non-blank line of an NDJSON upload.
+    `row` is the parsed object, or None with an `error` message if the line isn't one.
+    """
+    number = 0
+    async for line in iter_lines(chunks, max_row_bytes):
+        number += 1
+        if not line.strip():
+            continue
+        try:
+            row = orjson.loads(line)
+        except orjson.JSONDecodeError:
+            yield number, None, "Invalid JSON"
+            continue
+        if not isinstance(row, dict):
+            yield number, None, "Expected a JSON object"
+            continue
+        yield number, row, None
+
+
+async def iter_csv_rows(chunks, max_row_bytes: int):
+    """
+    Yield (row_number, row, error) for every data row of a CSV upload with a header line.
+    `row` maps the (lower-cased) header names to the row's values; empty values are left out.
+    Quoted values may span several lines; row numbers count records, not lines.
+    """
+    header = None
+    pending = []
+    pending_bytes = 0
+    number = 0
+    async for line in iter_lines(chunks, max_row_bytes):
+        try:
+            text = line.decode("utf-8-sig" if header is None and not pending else "utf-8")
+        except UnicodeDecodeError:
+            number += 1
+            yield number, None, "Not valid UTF-8"
+            continue
+        pending.append(text)
+        pending_bytes += len(line)
+        if pending_bytes > max_row_bytes:
+            raise RowTooLarge(f"row longer than {max_row_bytes} bytes")
+        record = "\n".join(pending)
+        # An odd number of quotes means a quoted value carries on to the next line.
+        if record.count('"') % 2:
+            continue
+        pending = []
+        pending_bytes = 0
+        if not record.strip():
+            continue
+        values = next(csv.reader([record]))
+        if header is None:
+            header = [name.strip().lower() for name in values]
+            continue
+        number += 1
+        if len(values) != len(header):
+            yield number, None, f"Expected {len(header)} columns, got {len(values)}"
+            continue
+        yield number, {name: value for name, value in zip(header, values) if value != ""}, None
+    if pending:
+        number += 1
+        yield number, None, "Unterminated quoted value"
@@ -0,0 +1,478 @@
+"""
+End-to-end API benchmark: drives the FastAPI app in-process over ASGI, against a
+seeded in-memory MongoDB stand-in (mongomock) and mocked postcodes.io/OSRM
+transports with a configurable latency. No server, database or network needed.
+
+For every route it measures throughput and p50/p95/p99 latency, writes the
+results as JSON and compares them with the budgets in benchmarks/budgets.json.
+Exits with status 1 if a route is over budget or returned a server error.
+
+mongomock scans every document on each query, so it's fine for 10k-100k rooms and
+for catching regressions like an extra query per request. For bigger datasets, or
+absolute numbers, point --mongo-uri at a local mongod (its "global_dorm_bench"
+database is dropped and reseeded; add GEO_BACKEND=mongo to use $geoNear).
+The stored budgets were measured with mongomock and the default options.
+
+Usage (from the Backend/ folder, after `pip install -r requirements-dev.txt`):
+    python -m benchmarks.bench_api
+    python -m benchmarks.bench_api --rooms 100000 --applications 200000 --upstream-latency-ms 80
+    python -m benchmarks.bench_api --rooms 1000000 --mongo-uri mongodb://localhost:27017
+    python -m benchmarks.bench_api --update-budgets   # store the current numbers (with headroom) as the budget
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sys
+import time
+from datetime import datetime
+
+# The app reads its configuration at import time, so set it up first.
+os.environ.setdefault("MONGO_URI", "mongodb://benchmark.invalid:27017")
+# Always a dedicated database: it gets dropped and reseeded.
+os.environ["DATABASE_NAME"] = "global_dorm_bench"
+os.environ.setdefault("SECRET_KEY", "benchmark-secret")
+# bcrypt at production cost would make the login/register numbers all about hashing.
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+# mongomock has no $geoNear, so /rooms/nearby uses the in-memory index.
+os.environ.setdefault("GEO_BACKEND", "memory")
+os.environ.setdefault("GEOCODE_SNAPSHOT_PATH", "")
+# Every simulated client shares one IP, so rate limits would measure the limiter instead of the route.
+os.environ.setdefault("ADMISSION_CONTROL", "off")
+os.environ.setdefault("LOG_LEVEL", "ERROR")
+
+import httpx  # noqa: E402
+import numpy as np  # noqa: E402
+from bson.objectid import ObjectId  # noqa: E402
+from motor.motor_asyncio import AsyncIOMotorClient  # noqa: E402
+
+from app.auth.dependencies import hash_password  # noqa: E402
+from app.auth.jwt_handler import create_access_token  # noqa: E402
+from app.db import mongodb  # noqa: E402
+from app.main import app  # noqa: E402
+from app.services.geo_index import geo_point  # noqa: E402
+from app.services.http_client import create_http_client, set_http_client  # noqa: E402
+from app.services.room_location import CAMPUS_POSTCODE, LOCATION_VERSION  # noqa: E402
+
+BUDGETS_PATH = os.path.join(os.path.dirname(__file__), "budgets.json")
+# Seeded rooms are spread over this box around east London.
+AREA = (51.48, 51.56, -0.15, 0.0)
+POSTCODE_AREAS = ("E1", "E2", "E3", "E14", "N1", "SE1", "EC1", "WC1")
+PASSWORD = "benchmark-password"
+# Rows per POST /rooms/bulk upload and price updates per PATCH /rooms/bulk. The
+# updates are kept few because mongomock scans every room for each one.
+BULK_ROWS = 100
+BULK_UPDATES = 20
+
+
+class Dataset:
+    """What was seeded, so scenarios can pick realistic IDs and users."""
+
+    def __init__(self, rng: random.Random):
+        self.rng = rng
+        self.room_ids = []
+        self.users = []              # [(email, Authorization header)]
+        self.applications = {}       # email -> [application ids]
+        self.postcodes = []
+        self.created_rooms = []      # rooms added by POST /rooms/, deleted by DELETE /rooms/{id}
+        self.counter = 0
+
+    def room_id(self):
+        return str(self.rng.choice(self.room_ids))
+
+    def user(self):
+        return self.rng.choice(self.users)
+
+    def next_number(self):
+        self.counter += 1
+        return self.counter
+
+
+def _mongomock_bulk_compat():
+    """
+    pymongo 4.x passes sort= to the update/replace operations of bulk_write, which
+    mongomock's bulk builder doesn't take yet. Drop it (the app never sets one).
+    """
+    import inspect
+    from mongomock.collection import BulkOperationBuilder
+
+    for name in ("add_update", "add_replace"):
+        add = getattr(BulkOperationBuilder, name)
+        if "sort" in inspect.signature(add).parameters:
+            continue
+
+        def without_sort(self, *args, _add=add, sort=None, **kwargs):
+            return _add(self, *args, **kwargs)
+
+        setattr(BulkOperationBuilder, name, without_sort)
+
+
+def _postcode(rng: random.Random) -> str:
+    return f"{rng.choice(POSTCODE_AREAS)} {rng.randint(1, 9)}{rng.choice('ABDEFGHJLNPQRSTUWXYZ')}{rng.choice('ABDEFGHJLNPQRSTUWXYZ')}"
+
+
+async def seed(db, rooms: int, applications: int, users: int, rng: random.Random, batch_size: int = 5000) -> Dataset:
+    """Fill the stand-in database with rooms (with stored locations), users and applications."""
+    data = Dataset(rng)
+    data.postcodes = list({_postcode(rng) for _ in range(min(rooms, 5000))})
+    password_hash = hash_password(PASSWORD)
+    user_docs = []
+    for i in range(users):
+        email = f"student{i}@example.com"
+        user_docs.append({"email": email, "hashed_password": password_hash})
+        data.users.append((email, {"Authorization": "Bearer " + create_access_token({"sub": email})}))
+    await db.users.insert_many(user_docs)
+
+    batch = []
+    for _ in range(rooms):
+        room_id = ObjectId()
+        postcode = rng.choice(data.postcodes)
+        lat, lon = rng.uniform(AREA[0], AREA[1]), rng.uniform(AREA[2], AREA[3])
+        batch.append({
+            "_id": room_id,
+            "title": "Double room near campus",
+            "description": "Furnished, bills included",
+            "address": f"{rng.randint(1, 300)} Benchmark Road",
+            "price_per_month": float(rng.randint(400, 1800)),
+            "postcode": postcode,
+            "postcode_key": postcode.replace(" ", "").upper(),
+            "location": {
+                "postcode": postcode.replace(" ", "").upper(),
+                "latitude": lat,
+                "longitude": lon,
+                "distance_meters": rng.uniform(300, 12000),
+                "duration_seconds": rng.uniform(60, 1800),
+                "campus_postcode": CAMPUS_POSTCODE,
+                "version": LOCATION_VERSION,
+                "computed_at": datetime.utcnow(),
+            },
+            "geo": geo_point(lat, lon),
+        })
+        data.room_ids.append(room_id)
+        if len(batch) >= batch_size:
+            await db.rooms.insert_many(batch)
+            batch = []
+    if batch:
+        await db.rooms.insert_many(batch)
+
+    batch = []
+    for _ in range(applications):
+        email, _ = rng.choice(data.users)
+        application_id = ObjectId()
+        batch.append({
+            "_id": application_id,
+            "user_email": email,
+            "room_id": str(rng.choice(data.room_ids)),
+            "status": rng.choice(("applied", "applied", "applied", "cancelled")),
+            "applied_at": datetime.utcnow(),
+        })
+        data.applications.setdefault(email, []).append(str(application_id))
+        if len(batch) >= batch_size:
+            await db.applications.insert_many(batch)
+            batch = []
+    if batch:
+        await db.applications.insert_many(batch)
+    return data
+
+
+def mock_upstreams(latency_ms: float, jitter_ms: float, rng: random.Random) -> httpx.MockTransport:
+    """postcodes.io and OSRM stand-ins that answer after a configurable delay."""
+
+    def coords():
+        return rng.uniform(AREA[0], AREA[1]), rng.uniform(AREA[2], AREA[3])
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(max(0.0, latency_ms + rng.uniform(-jitter_ms, jitter_ms)) / 1000)
+        path = request.url.path
+        if path.startswith("/postcodes") and request.method == "POST":
+            postcodes = json.loads(request.content)["postcodes"]
+            results = []
+            for postcode in postcodes:
+                lat, lon = coords()
+                results.append({"query": postcode, "result": {"latitude": lat, "longitude": lon}})
+            return httpx.Response(200, json={"status": 200, "result": results})
+        if path.startswith("/postcodes/"):
+            lat, lon = coords()
+            return httpx.Response(200, json={"status": 200, "result": {"latitude": lat, "longitude": lon}})
+        if path.startswith("/table/"):
+            sources = request.url.params["sources"].split(";")
+            return httpx.Response(200, json={
+                "code": "Ok",
+                "distances": [[rng.uniform(300, 12000)] for _ in sources],
+                "durations": [[rng.uniform(60, 1800)] for _ in sources],
+            })
+        if path.startswith("/route/"):
+            return httpx.Response(200, json={
+                "code": "Ok", "routes": [{"distance": rng.uniform(300, 12000), "duration": rng.uniform(60, 1800)}]
+            })
+        return httpx.Response(404)
+
+    return httpx.MockTransport(handler)
+
+
+# --- Scenarios: one per route, each returns (method, url, request kwargs) ---
+
+def _create_room(d: Dataset):
+    return "POST", "/rooms/", {"headers": d.user()[1], "json": {
+        "title": "New listing", "description": "Added by the benchmark", "address": "1 Bench Street",
+        "price_per_month": float(d.rng.randint(400, 1800)), "postcode": d.rng.choice(d.postcodes)}}
+
+
+def _bulk_import(d: Dataset):
+    """An upload of BULK_ROWS rooms, as CSV or NDJSON (half of the requests each)."""
+    rows = [{"title": "Imported listing", "address": f"{d.next_number()} Bulk Street",
+             "price_per_month": float(d.rng.randint(400, 1800)), "postcode": d.rng.choice(d.postcodes)}
+            for _ in range(BULK_ROWS)]
+    if d.rng.random() < 0.5:
+        body = "title,address,price_per_month,postcode\n" + "".join(
+            f"{row['title']},{row['address']},{row['price_per_month']},{row['postcode']}\n" for row in rows)
+        content_type = "text/csv"
+    else:
+        body = "".join(json.dumps(row) + "\n" for row in rows)
+        content_type = "application/x-ndjson"
+    return "POST", "/rooms/bulk", {"headers": {**d.user()[1], "Content-Type": content_type},
+                                   "content": body.encode()}
+
+
+def _bulk_update_prices(d: Dataset):
+    updates = [{"id": d.room_id(), "price_per_month": float(d.rng.randint(400, 1800))}
+               for _ in range(BULK_UPDATES)]
+    return "PATCH", "/rooms/bulk", {"headers": d.user()[1], "json": {"updates": updates}}
+
+
+def _delete_room(d: Dataset):
+    room_id = d.created_rooms.pop() if d.created_rooms else d.room_id()
+    return "DELETE", f"/rooms/{room_id}", {"headers": d.user()[1]}
+
+
+def _application(d: Dataset):
+    email, headers = d.user()
+    ids = d.applications.get(email)
+    application_id = d.rng.choice(ids) if ids else str(ObjectId())
+    return application_id, headers
+
+
+SCENARIOS = {
+    "GET /": lambda d: ("GET", "/", {}),
+    "GET /db-status": lambda d: ("GET", "/db-status", {}),
+    "GET /protected": lambda d: ("GET", "/protected", {"headers": d.user()[1]}),
+    "POST /users/register": lambda d: ("POST", "/users/register", {
+        "json": {"email": f"new{d.next_number()}@example.com", "password": PASSWORD}}),
+    "POST /users/login": lambda d: ("POST", "/users/login", {"json": {"email": d.user()[0], "password": PASSWORD}}),
+    "GET /rooms/": lambda d: ("GET", "/rooms/", {"params": {
+        "sort": d.rng.choice(("newest", "price_asc", "price_desc")),
+        **({"max_price": d.rng.choice((600, 900, 1200))} if d.rng.random() < 0.5 else {})}}),
+    "GET /rooms/nearby": lambda d: ("GET", "/rooms/nearby", {"params": {
+        "lat": d.rng.uniform(AREA[0], AREA[1]), "lon": d.rng.uniform(AREA[2], AREA[3]), "radius_m": 1500}}),
+    "GET /rooms/{room_id}": lambda d: ("GET", f"/rooms/{d.room_id()}", {}),
+    "GET /rooms/{room_id}/stats": lambda d: ("GET", f"/rooms/{d.room_id()}/stats", {"headers": d.user()[1]}),
+    "GET /rooms/stats": lambda d: ("GET", "/rooms/stats", {
+        "headers": d.user()[1], "params": {"ids": ",".join(d.room_id() for _ in range(20))}}),
+    "POST /rooms/": _create_room,
+    "PUT /rooms/{room_id}": lambda d: ("PUT", f"/rooms/{d.room_id()}", {
+        "headers": d.user()[1], "json": {"price_per_month": float(d.rng.randint(400, 1800))}}),
+    "DELETE /rooms/{room_id}": _delete_room,
+    "POST /rooms/bulk": _bulk_import,
+    "PATCH /rooms/bulk": _bulk_update_prices,
+    "POST /applications/": lambda d: ("POST", "/applications/", {
+        "headers": d.user()[1], "json": {"room_id": d.room_id()}}),
+    "GET /applications/": lambda d: ("GET", "/applications/", {
+        "headers": d.user()[1], "params": {"expand": "room"} if d.rng.random() < 0.5 else {}}),
+    "GET /applications/{application_id}": lambda d: (
+        lambda application_id, headers: ("GET", f"/applications/{application_id}", {"headers": headers}))(
+        *_application(d)),
+    "PATCH /applications/{application_id}/cancel": lambda d: (
+        lambda application_id, headers: ("PATCH", f"/applications/{application_id}/cancel", {"headers": headers}))(
+        *_application(d)),
+    "GET /external/geocode": lambda d: ("GET", "/external/geocode", {"params": {"postcode": d.rng.choice(d.postcodes)}}),
+    "POST /external/geocode/bulk": lambda d: ("POST", "/external/geocode/bulk", {
+        "json": {"postcodes": d.rng.sample(d.postcodes, min(50, len(d.postcodes)))}}),
+    "GET /external/room-distance": lambda d: ("GET", "/external/room-distance", {"params": {"room_id": d.room_id()}}),
+}
+
+
+async def run_scenario(client: httpx.AsyncClient, data: Dataset, name: str, requests: int,
+                       concurrency: int, warmup: int) -> dict:
+    """Send `requests` requests for one scenario, `concurrency` at a time, and summarise the latencies."""
+    build = SCENARIOS[name]
+    latencies = []
+    errors = 0
+    server_errors = 0
+
+    async def send(record: bool):
+        nonlocal errors, server_errors
+        method, url, kwargs = build(data)
+        start = time.perf_counter()
+        resp = await client.request(method, url, **kwargs)
+        elapsed = time.perf_counter() - start
+        if name == "POST /rooms/" and resp.status_code == 201:
+            data.created_rooms.append(resp.json()["id"])
+        if not record:
+            return
+        latencies.append(elapsed)
+        # 4xx answers (already applied, already cancelled...) are normal traffic; 5xx are not.
+        if resp.status_code >= 400:
+            errors += 1
+        if resp.status_code >= 500:
+            server_errors += 1
+
+    for _ in range(warmup):
+        await send(record=False)
+
+    remaining = iter(range(requests))
+
+    async def worker():
+        for _ in remaining:
+            await send(record=True)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - start
+    ms = np.asarray(latencies) * 1000
+    return {
+        "requests": requests,
+        "errors": errors,
+        "server_errors": server_errors,
+        "rps": round(requests / wall, 1),
+        "mean_ms": round(float(ms.mean()), 3),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+    }
+
+
+def check_budgets(results: dict, budgets: dict) -> list:
+    """Return a message for every route that is over its budget or had server errors."""
+    problems = []
+    for name, result in results.items():
+        if result["server_errors"]:
+            problems.append(f"{name}: {result['server_errors']} server errors")
+        budget = budgets.get(name)
+        if not budget:
+            continue
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            if key in budget and result[key] > budget[key]:
+                problems.append(f"{name}: {key} {result[key]} > budget {budget[key]}")
+        if "min_rps" in budget and result["rps"] < budget["min_rps"]:
+            problems.append(f"{name}: rps {result['rps']} < budget {budget['min_rps']}")
+    return problems
+
+
+def budgets_from(results: dict, headroom: float) -> dict:
+    return {
+        name: {
+            "p95_ms": round(result["p95_ms"] * headroom, 1),
+            "p99_ms": round(result["p99_ms"] * headroom, 1),
+            "min_rps": round(result["rps"] / headroom, 1),
+        }
+        for name, result in results.items()
+    }
+
+
+def uncovered_routes() -> list:
+    """Routes in the OpenAPI schema that have no scenario yet, so new routes don't go unmeasured."""
+    routes = []
+    for path, methods in app.openapi()["paths"].items():
+        for method in methods:
+            name = f"{method.upper()} {path}"
+            if name not in SCENARIOS:
+                routes.append(name)
+    return routes
+
+
+async def main(args):
+    rng = random.Random(args.seed)
+    if args.mongo_uri:
+        stand_in = AsyncIOMotorClient(args.mongo_uri)
+        await stand_in.drop_database(mongodb.DATABASE_NAME)
+    else:
+        try:
+            from mongomock_motor import AsyncMongoMockClient
+        except ImportError:
+            sys.exit("bench_api needs the MongoDB stand-in (pip install -r requirements-dev.txt) or --mongo-uri")
+        _mongomock_bulk_compat()
+        stand_in = AsyncMongoMockClient()
+    mongodb.set_client(stand_in)
+    set_http_client(create_http_client(mock_upstreams(args.upstream_latency_ms, args.upstream_jitter_ms, rng)))
+
+    start = time.perf_counter()
+    data = await seed(stand_in[mongodb.DATABASE_NAME], args.rooms, args.applications, args.users, rng)
+    print(f"Seeded {args.rooms} rooms, {args.applications} applications, {args.users} users "
+          f"in {time.perf_counter() - start:.1f}s")
+
+    names = [name for name in SCENARIOS if not args.only or any(part in name for part in args.only)]
+    missing = uncovered_routes()
+    if missing:
+        print("No scenario for:", ", ".join(missing))
+
+    results = {}
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for name in names:
+                results[name] = await run_scenario(client, data, name, args.requests, args.concurrency, args.warmup)
+                r = results[name]
+                print(f"{name:<46} {r['rps']:9.1f} req/s  p50 {r['p50_ms']:8.2f}  p95 {r['p95_ms']:8.2f}  "
+                      f"p99 {r['p99_ms']:8.2f} ms  errors {r['errors']}")
+
+    report = {
+        "meta": {
+            "timestamp": datetime.utcnow().isoformat() + "Z",
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "rooms": args.rooms,
+            "applications": args.applications,
+            "users": args.users,
+            "requests_per_route": args.requests,
+            "concurrency": args.concurrency,
+            "upstream_latency_ms": args.upstream_latency_ms,
+            "datastore": "mongodb" if args.mongo_uri else "mongomock",
+            "seed": args.seed,
+        },
+        "routes": results,
+    }
+    if args.output:
+        directory = os.path.dirname(args.output)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.update_budgets:
+        with open(args.budgets, "w", encoding="utf-8") as f:
+            json.dump({"routes": budgets_from(results, args.headroom)}, f, indent=2)
+            f.write("\n")
+        print(f"Budgets written to {args.budgets}")
+        return 0
+
+    budgets = {}
+    if os.path.exists(args.budgets):
+        with open(args.budgets, encoding="utf-8") as f:
+            budgets = json.load(f)["routes"]
+    problems = check_budgets(results, budgets)
+    for problem in problems:
+        print("OVER BUDGET:", problem)
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark every API route in-process.")
+    parser.add_argument("--rooms", type=int, default=10_000, help="Rooms to seed (10k-1M)")
+    parser.add_argument("--applications", type=int, default=20_000, help="Applications to seed")
+    parser.add_argument("--users", type=int, default=200, help="Users to seed")
+    parser.add_argument("--requests", type=int, default=100, help="Measured requests per route")
+    parser.add_argument("--concurrency", type=int, default=16, help="Requests in flight at once")
+    parser.add_argument("--warmup", type=int, default=20, help="Unmeasured requests per route first")
+    parser.add_argument("--upstream-latency-ms", type=float, default=50, help="Delay of the mocked postcodes.io/OSRM")
+    parser.add_argument("--upstream-jitter-ms", type=float, default=10, help="+/- random variation of that delay")
+    parser.add_argument("--mongo-uri", help="Use this local mongod instead of the in-memory stand-in")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed, for repeatable datasets")
+    parser.add_argument("--only", nargs="*", help="Only run scenarios whose name contains one of these")
+    parser.add_argument("--output", default="data/benchmarks/api.json", help="Where to write the JSON results")
+    parser.add_argument("--budgets", default=BUDGETS_PATH, help="Budget file to check against")
+    parser.add_argument("--update-budgets", action="store_true", help="Write the results as the new budgets")
+    parser.add_argument("--headroom", type=float, default=3.0, help="Slack applied by --update-budgets")
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,101 @@
+"""
+Microbenchmark for response serialization: what a page of rooms or applications
+costs to turn from Mongo documents into response bytes, per 1k documents.
+
+  - jsonable_encoder + json: the classic FastAPI path (response_model validation,
+    jsonable_encoder, stdlib json) that every route went through before
+  - response_model + dump_json: FastAPI's current path for dicts returned with a
+    response_model (validation, then Pydantic writes the JSON)
+  - serializer + orjson: what the routes do now (the *_serializer output is sent
+    as is with FastJSONResponse, no second validation)
+
+Usage (from the Backend/ folder):
+    python -m benchmarks.bench_serialization --number 200
+"""
+import argparse
+import json
+import os
+import random
+import timeit
+from datetime import datetime, timedelta
+
+os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017")
+os.environ.setdefault("DATABASE_NAME", "global_dorm_bench")
+os.environ.setdefault("SECRET_KEY", "benchmark-secret")
+
+from bson.objectid import ObjectId  # noqa: E402
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from pydantic import TypeAdapter  # noqa: E402
+
+from app.api.applications import application_serializer  # noqa: E402
+from app.api.rooms import room_serializer  # noqa: E402
+from app.models.application import ApplicationPage  # noqa: E402
+from app.models.room import RoomPage  # noqa: E402
+from app.utils.responses import FastJSONResponse  # noqa: E402
+
+DOCUMENTS = 1000
+
+
+def make_rooms(rng: random.Random) -> list:
+    return [{
+        "_id": ObjectId(),
+        "title": f"Room {i}",
+        "description": rng.choice([None, "Bright double room, bills included, close to the station."]),
+        "address": f"{i} Mile End Road, London",
+        "price_per_month": float(rng.randint(400, 1800)),
+        "postcode": rng.choice(["E1 4NS", "E1 6AN", "E2 9PL", "E3 4AA"]),
+    } for i in range(DOCUMENTS)]
+
+
+def make_applications(rng: random.Random, rooms: list) -> list:
+    start = datetime(2025, 1, 1)
+    return [{
+        "_id": ObjectId(),
+        "user_email": f"student{rng.randint(0, 99)}@example.com",
+        "room_id": str(rng.choice(rooms)["_id"]),
+        "status": rng.choice(["applied", "cancelled"]),
+        "applied_at": start + timedelta(seconds=rng.randint(0, 10 ** 7), microseconds=rng.randint(0, 999) * 1000),
+    } for _ in range(DOCUMENTS)]
+
+
+def paths(model, serializer):
+    """The three ways of turning a page of documents into bytes, as {label: function(docs)}."""
+    adapter = TypeAdapter(model)
+
+    def classic(docs):
+        page = adapter.validate_python({"items": [serializer(doc) for doc in docs], "next_cursor": None})
+        return json.dumps(jsonable_encoder(page)).encode()
+
+    def dump_json(docs):
+        page = adapter.validate_python({"items": [serializer(doc) for doc in docs], "next_cursor": None})
+        return adapter.dump_json(page)
+
+    def fast(docs):
+        return FastJSONResponse({"items": [serializer(doc) for doc in docs], "next_cursor": None}).body
+
+    return {"jsonable_encoder + json": classic, "response_model + dump_json": dump_json, "serializer + orjson": fast}
+
+
+def main(number: int):
+    rng = random.Random(42)
+    rooms = make_rooms(rng)
+    applications = make_applications(rng, rooms)
+    for name, model, serializer, docs in (
+        ("rooms", RoomPage, room_serializer, rooms),
+        ("applications", ApplicationPage, application_serializer, applications),
+    ):
+        functions = paths(model, serializer)
+        # Every path has to produce the same JSON, or the comparison means nothing.
+        outputs = [json.loads(function(docs)) for function in functions.values()]
+        assert all(output == outputs[0] for output in outputs), f"{name}: paths disagree"
+        baseline = None
+        for label, function in functions.items():
+            seconds = timeit.timeit(lambda: function(docs), number=number) / number
+            baseline = baseline or seconds
+            print(f"{name:<13} {label:<28} {seconds * 1e3:8.3f} ms per 1k  ({baseline / seconds:5.1f}x)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare response serialization paths per 1k documents.")
+    parser.add_argument("--number", type=int, default=200, help="Iterations per measurement")
+    main(parser.parse_args().number)
@@ -1,31 +1,53 @@
-from locust import HttpUser, task, between
+"""
+Load test against a running server: `locust -f locust.py --host http://localhost:8000`
+
+Two kinds of simulated users, weighted like real traffic: many students browsing
+and applying, a few landlords managing listings. Accounts come from a fixed pool
+(LOCUST_ACCOUNTS, default 50) that is registered once and whose tokens are shared
+by every simulated user, so the test doesn't turn into a bcrypt/register benchmark.
+"""
+import os
 import random
-import string
+import threading
+
+from locust import HttpUser, task, between
+
+ACCOUNTS = int(os.getenv("LOCUST_ACCOUNTS", "50"))
+PASSWORD = os.getenv("LOCUST_PASSWORD", "testpassword123")
+POSTCODES = ["E1 4NS", "E1 6AN", "E2 9PL", "E3 4AA", "E14 5AB", "N1 9GU", "SE1 7PB", "EC1V 2NX"]
+
+# email -> access token, shared by all simulated users in this process.
+_tokens = {}
+_tokens_lock = threading.Lock()
+_next_account = iter(range(10 ** 9))
+
 
 class DormUser(HttpUser):
+    abstract = True
     wait_time = between(1, 3)
-    token = None
-    room_ids = []
 
     def on_start(self):
-        """Runs when a simulated user starts"""
-        # Random email for each simulated user
-        self.email = f"testuser_{''.join(random.choices(string.ascii_lowercase, k=5))}@example.com"
-        self.password = "testpassword123"
-
-        # Register
-        self.client.post("/users/register", json={
-            "email": self.email,
-            "password": self.password
-        })
-
-        # Login
-        res = self.client.post("/users/login", json={
-            "email": self.email,
-            "password": self.password
-        })
-        if res.status_code == 200:
-            self.token = res.json()["access_token"]
+        """Pick an account from the pool and reuse its token if another user already logged in."""
+        with _tokens_lock:
+            self.email = f"loadtest{next(_next_account) % ACCOUNTS}@example.com"
+            self.token = _tokens.get(self.email)
+        if self.token is None:
+            self.token = self.login()
+        self.room_ids = []
+        self.etags = {}
+
+    def login(self):
+        res = self.client.post("/users/login", json={"email": self.email, "password": PASSWORD})
+        if res.status_code != 200:
+            # First run against this database: create the account, then log in.
+            self.client.post("/users/register", json={"email": self.email, "password": PASSWORD})
+            res = self.client.post("/users/login", json={"email": self.email, "password": PASSWORD})
+        if res.status_code != 200:
+            return None
+        token = res.json()["access_token"]
+        with _tokens_lock:
+            _tokens[self.email] = token
+        return token
 
     def auth_headers(self):
         """Helper to return Authorization header"""
@@ -33,75 +55,104 @@ class DormUser(HttpUser):
             return {"Authorization": f"Bearer {self.token}"}
         return {}
 
-    @task
-    def get_root(self):
-        self.client.get("/")
+    def browse(self):
+        params = {"sort": random.choice(["newest", "price_asc", "price_desc"])}
+        if random.random() < 0.4:
+            params["max_price"] = random.choice([600, 800, 1000, 1200])
+        res = self.client.get("/rooms/", params=params, name="/rooms/")
+        if res.status_code != 200:
+            return
+        page = res.json()
+        self.room_ids = [room["id"] for room in page["items"]] or self.room_ids
+        # Some students look at the next page too.
+        if page["next_cursor"] and random.random() < 0.3:
+            self.client.get("/rooms/", params=dict(params, cursor=page["next_cursor"]), name="/rooms/?cursor")
+
 
-    @task
-    def db_status(self):
-        self.client.get("/db-status")
+class StudentUser(DormUser):
+    weight = 9
 
-    @task
+    @task(10)
     def list_rooms(self):
-        res = self.client.get("/rooms")
-        if res.status_code == 200:
-            rooms = res.json()
-            self.room_ids = [room["id"] for room in rooms]
+        self.browse()
+
+    @task(8)
+    def view_room(self):
+        if not self.room_ids:
+            return
+        room_id = random.choice(self.room_ids)
+        # Revisits send the ETag back, like a browser would.
+        headers = {"If-None-Match": self.etags[room_id]} if room_id in self.etags else {}
+        res = self.client.get(f"/rooms/{room_id}", headers=headers, name="/rooms/[id]")
+        if "etag" in res.headers:
+            self.etags[room_id] = res.headers["etag"]
+
+    @task(4)
+    def room_distance(self):
+        if self.room_ids:
+            self.client.get("/external/room-distance", params={"room_id": random.choice(self.room_ids)},
+                            name="/external/room-distance")
+
+    @task(3)
+    def nearby_rooms(self):
+        self.client.get("/rooms/nearby", params={
+            "lat": 51.5246 + random.uniform(-0.02, 0.02),
+            "lon": -0.0403 + random.uniform(-0.02, 0.02),
+            "radius_m": random.choice([1000, 2000, 5000]),
+        }, name="/rooms/nearby")
+
+    @task(2)
+    def geocode_postcode(self):
+        self.client.get("/external/geocode", params={"postcode": random.choice(POSTCODES)}, name="/external/geocode")
+
+    @task(2)
+    def list_applications(self):
+        if self.token:
+            self.client.get("/applications/", params={"expand": "room"}, headers=self.auth_headers())
+
+    @task(1)
+    def apply_for_room(self):
+        if self.room_ids and self.token:
+            with self.client.post("/applications/", json={"room_id": random.choice(self.room_ids)},
+                                  headers=self.auth_headers(), catch_response=True) as res:
+                # Applying twice to the same room is expected to be refused.
+                if res.status_code == 400:
+                    res.success()
 
-    @task
+
+class LandlordUser(DormUser):
+    weight = 1
+
+    def on_start(self):
+        super().on_start()
+        self.own_rooms = []
+
+    @task(3)
     def create_room(self):
-        # Only create if logged in
         if not self.token:
             return
-        res = self.client.post("/rooms", json={
+        res = self.client.post("/rooms/", json={
             "title": "Locust Test Room",
             "description": "Room created by load test",
             "address": "123 Test St",
-            "price_per_month": 500.0,
-            "postcode": "E1 4NS"
+            "price_per_month": float(random.randint(400, 1200)),
+            "postcode": random.choice(POSTCODES),
         }, headers=self.auth_headers())
         if res.status_code == 201:
-            self.room_ids.append(res.json()["id"])
-
-    @task
-    def get_room_by_id(self):
-        if self.room_ids:
-            room_id = random.choice(self.room_ids)
-            self.client.get(f"/rooms/{room_id}")
+            self.own_rooms.append(res.json()["id"])
 
-    @task
+    @task(2)
     def update_room(self):
-        if self.room_ids and self.token:
-            room_id = random.choice(self.room_ids)
-            self.client.put(f"/rooms/{room_id}", json={
+        if self.own_rooms and self.token:
+            self.client.put(f"/rooms/{random.choice(self.own_rooms)}", json={
                 "price_per_month": random.randint(400, 1000)
-            }, headers=self.auth_headers())
+            }, headers=self.auth_headers(), name="/rooms/[id]")
 
-    @task
+    @task(1)
     def delete_room(self):
-        if self.room_ids and self.token:
-            room_id = self.room_ids.pop()
-            self.client.delete(f"/rooms/{room_id}", headers=self.auth_headers())
-
-    @task
-    def geocode_postcode(self):
-        self.client.get("/external/geocode?postcode=E1 4NS")
+        if self.own_rooms and self.token:
+            self.client.delete(f"/rooms/{self.own_rooms.pop()}", headers=self.auth_headers(), name="/rooms/[id]")
 
-    @task
-    def room_distance(self):
-        if self.room_ids:
-            room_id = random.choice(self.room_ids)
-            self.client.get(f"/external/room-distance?room_id={room_id}")
-
-    @task
-    def apply_for_room(self):
-        if self.room_ids and self.token:
-            room_id = random.choice(self.room_ids)
-            self.client.post("/applications", json={
-                "room_id": room_id
-            }, headers=self.auth_headers())
-
-    @task
-    def list_applications(self):
-        if self.token:
-            self.client.get("/applications", headers=self.auth_headers())
+    @task(2)
+    def list_rooms(self):
+        self.browse()
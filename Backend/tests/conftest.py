@@ -0,0 +1,138 @@
+import asyncio
+import json
+import os
+import sys
+
+# The app reads these at import time; tests never talk to a real MongoDB or Redis.
+os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017")
+os.environ.setdefault("DATABASE_NAME", "global_dorm_test")
+os.environ.setdefault("SECRET_KEY", "test-secret")
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+os.environ.setdefault("ADMISSION_CONTROL", "off")
+# mongomock has no $geoNear, so /rooms/nearby uses the in-memory grid unless a test says otherwise.
+os.environ.setdefault("GEO_BACKEND", "memory")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx  # noqa: E402
+import pytest  # noqa: E402
+from mongomock.collection import BulkOperationBuilder  # noqa: E402
+from mongomock_motor import AsyncMongoMockClient  # noqa: E402
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from app.auth.jwt_handler import create_access_token  # noqa: E402
+from app.db import mongodb  # noqa: E402
+from app.services import campus, http_client, response_cache  # noqa: E402
+from app.services.cache import local_cache, use_shared_backend  # noqa: E402
+from app.services.fallback import UPSTREAMS  # noqa: E402
+from app.services.geo_index import room_geo_index  # noqa: E402
+
+# Where the fake postcodes.io puts postcodes (normalised), anything else is at DEFAULT_POINT.
+POINTS = {"E14NS": (51.5246, -0.0403), "E16AN": (51.5200, -0.0700), "E29PL": (51.5310, -0.0550)}
+DEFAULT_POINT = (51.5000, -0.1000)
+
+
+def run(coro):
+    """Run a coroutine to completion (the tests are plain functions, no async plugin needed)."""
+    return asyncio.run(coro)
+
+
+def _drop_sort(add):
+    # pymongo 4.x passes sort= to bulk update/replace ops; mongomock's bulk builder predates it.
+    def wrapper(*args, sort=None, **kwargs):
+        return add(*args, **kwargs)
+    return wrapper
+
+
+@pytest.fixture
+def mongo(monkeypatch):
+    """An in-memory MongoDB stand-in behind app.db.mongodb's db and read_db."""
+    for name in ("add_update", "add_replace"):
+        monkeypatch.setattr(BulkOperationBuilder, name, _drop_sort(getattr(BulkOperationBuilder, name)))
+    mongodb.set_client(AsyncMongoMockClient())
+    yield mongodb.get_database()
+    mongodb._client = None
+    mongodb._databases.clear()
+
+
+@pytest.fixture
+def upstream():
+    """
+    Fake postcodes.io/OSRM: call the fixture with a handler(request) -> httpx.Response
+    and every outgoing call goes to it.
+    """
+    def use(handler):
+        http_client.set_http_client(http_client.create_http_client(httpx.MockTransport(handler)))
+
+    yield use
+    http_client.set_http_client(None)
+
+
+def fake_upstreams(calls: list = None, osrm: bool = True, postcodes_io: bool = True):
+    """
+    A handler for the upstream fixture that plays postcodes.io (single and bulk lookups,
+    answering from POINTS) and OSRM /route and /table (1 km and 100 s for every route/source).
+    osrm/postcodes_io=False makes that service answer 503. Requests are appended to `calls`.
+    """
+    def handler(request: httpx.Request) -> httpx.Response:
+        if calls is not None:
+            calls.append(request)
+        if "/route/" in request.url.path:
+            if not osrm:
+                return httpx.Response(503)
+            return httpx.Response(200, json={"code": "Ok", "routes": [{"distance": 1000.0, "duration": 100.0}]})
+        if "/table/" in request.url.path:
+            if not osrm:
+                return httpx.Response(503)
+            sources = request.url.params["sources"].split(";")
+            return httpx.Response(200, json={
+                "code": "Ok", "distances": [[1000.0]] * len(sources), "durations": [[100.0]] * len(sources),
+            })
+        if not postcodes_io:
+            return httpx.Response(503)
+        if request.method == "POST":
+            postcodes = json.loads(request.content)["postcodes"]
+            return httpx.Response(200, json={"status": 200, "result": [
+                {"query": p, "result": dict(zip(("latitude", "longitude"), POINTS.get(p, DEFAULT_POINT)))}
+                for p in postcodes
+            ]})
+        postcode = request.url.path.rsplit("/", 1)[1].upper()
+        lat, lon = POINTS.get(postcode, DEFAULT_POINT)
+        return httpx.Response(200, json={"status": 200, "result": {"latitude": lat, "longitude": lon}})
+
+    return handler
+
+
+@pytest.fixture
+def client(mongo):
+    """The API on the in-memory database. The lifespan isn't run (no campus lookups or workers)."""
+    from app.main import app
+    return TestClient(app)
+
+
+@pytest.fixture
+def auth():
+    """Authorization header for a signed-in student."""
+    return {"Authorization": "Bearer " + create_access_token({"sub": "student@example.com"})}
+
+
+def _clear_caches():
+    local_cache.clear()
+    use_shared_backend(None)
+    response_cache._bodies.clear()
+    response_cache._room_versions.clear()
+    response_cache.use_version_store(None)
+    campus._coords.clear()
+    for name in list(room_geo_index._points):
+        room_geo_index.remove(name)
+    for upstream in UPSTREAMS:
+        upstream.breaker.record_success()
+
+
+@pytest.fixture(autouse=True)
+def clean_cache():
+    """Every test starts with empty caches, no shared tier, an empty geo index and closed circuits."""
+    _clear_caches()
+    yield
+    _clear_caches()
@@ -0,0 +1,189 @@
+import asyncio
+
+import fakeredis
+import httpx
+import pytest
+from fastapi import FastAPI
+from redis.exceptions import RedisError
+
+from app.auth.jwt_handler import create_access_token
+from app.services import admission
+from app.services.admission import (
+    AdmissionMiddleware, MemoryRateLimiter, RedisRateLimiter, RouteLimit, parse_route_limits, use_rate_limiter,
+)
+from tests.conftest import run
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture(autouse=True)
+def fresh_limiters(monkeypatch):
+    """Every test starts with empty buckets and no concurrency limiters."""
+    monkeypatch.setattr(admission, "_limiters", {})
+    use_rate_limiter(MemoryRateLimiter())
+    yield
+    use_rate_limiter(MemoryRateLimiter())
+
+
+def make_app(limits: dict):
+    """A small app behind the middleware. GET /slow/{n} waits until `release` is set."""
+    api = FastAPI()
+    release = asyncio.Event()
+
+    @api.get("/rooms/{room_id}")
+    async def get_room(room_id: str):
+        return {"id": room_id}
+
+    @api.post("/rooms/bulk")
+    async def bulk():
+        return {"ok": True}
+
+    @api.get("/slow/{n}")
+    async def slow(n: int):
+        await release.wait()
+        return {"n": n}
+
+    api.add_middleware(AdmissionMiddleware, limits=limits, enabled=True)
+    return api, release
+
+
+def client_for(api):
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=api), base_url="http://test")
+
+
+def test_memory_bucket_refills_at_its_rate(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(admission.time, "monotonic", clock)
+    limiter = MemoryRateLimiter()
+
+    async def take():
+        return await limiter.take("ip:test", rate=2, burst=3)
+
+    # A full bucket allows a burst, then each token takes 1/rate seconds to come back.
+    assert [run(take()) for _ in range(3)] == [0, 0, 0]
+    assert run(take()) == pytest.approx(0.5)
+    clock.now += 0.25
+    assert run(take()) == pytest.approx(0.25)
+    clock.now += 0.25
+    assert run(take()) == 0
+    # Tokens never pile up beyond the burst size.
+    clock.now += 60
+    assert [run(take()) for _ in range(4)][-1] == pytest.approx(0.5)
+    # Other keys have their own bucket.
+    assert run(limiter.take("ip:other", rate=2, burst=3)) == 0
+
+
+def test_redis_bucket_runs_the_lua_script():
+    client = fakeredis.FakeAsyncRedis()
+    limiter = RedisRateLimiter(client, prefix="test:")
+
+    async def scenario():
+        waits = [await limiter.take("ip:1.2.3.4", rate=0.5, burst=2) for _ in range(3)]
+        ttl = await client.pttl("test:ip:1.2.3.4")
+        # Another worker shares the same bucket.
+        other = await RedisRateLimiter(client, prefix="test:").take("ip:1.2.3.4", rate=0.5, burst=2)
+        return waits, ttl, other
+
+    waits, ttl, other = run(scenario())
+    assert waits[:2] == [0, 0]
+    assert waits[2] == pytest.approx(2, abs=0.05)
+    assert 0 < ttl <= 5000  # burst / rate seconds, plus one
+    assert other == pytest.approx(2, abs=0.05)
+
+
+def test_redis_errors_fall_back_to_memory_buckets():
+    class BrokenRedis:
+        def register_script(self, script):
+            async def call(keys, args):
+                raise RedisError("down")
+            return call
+
+    limiter = RedisRateLimiter(BrokenRedis())
+    assert [run(limiter.take("ip:1.2.3.4", rate=1, burst=1)) for _ in range(2)] == [0, pytest.approx(1, abs=0.01)]
+
+
+def test_rate_limited_requests_get_429_with_retry_after():
+    api, _ = make_app({"GET /rooms/{room_id}": RouteLimit(ip_rate=0.5, ip_burst=2),
+                       "POST /rooms/bulk": RouteLimit(user_rate=0.1, user_burst=1)})
+    alice = {"Authorization": "Bearer " + create_access_token({"sub": "alice@example.com"})}
+    bob = {"Authorization": "Bearer " + create_access_token({"sub": "bob@example.com"})}
+
+    async def scenario():
+        async with client_for(api) as client:
+            # The IP bucket covers every room ID: the limit is per route template.
+            ip = [await client.get(f"/rooms/{i}") for i in range(3)]
+            users = [await client.post("/rooms/bulk", headers=alice), await client.post("/rooms/bulk", headers=alice),
+                     await client.post("/rooms/bulk", headers=bob)]
+            return ip, users
+
+    ip, users = run(scenario())
+    assert [resp.status_code for resp in ip] == [200, 200, 429]
+    assert ip[2].headers["Retry-After"] == "2"
+    assert ip[2].json() == {"detail": "Too many requests, slow down"}
+    assert [resp.status_code for resp in users] == [200, 429, 200]
+    assert users[1].headers["Retry-After"] == "10"
+
+
+def test_full_route_sheds_with_503():
+    api, release = make_app({"GET /slow/{n}": RouteLimit(max_concurrency=1, max_queue=1, queue_timeout=5)})
+
+    async def scenario():
+        async with client_for(api) as client:
+            running = asyncio.ensure_future(client.get("/slow/1"))
+            await asyncio.sleep(0.01)
+            queued = asyncio.ensure_future(client.get("/slow/2"))
+            await asyncio.sleep(0.01)
+            shed = await client.get("/slow/3")  # slot taken and queue full
+            release.set()
+            return shed, await running, await queued
+
+    shed, running, queued = run(scenario())
+    assert shed.status_code == 503
+    assert shed.headers["Retry-After"] == "5"
+    assert (running.status_code, queued.status_code) == (200, 200)
+    assert admission._limiters["GET /slow/{n}"].active == 0
+
+
+def test_queued_request_gives_up_after_the_queue_timeout():
+    api, release = make_app({"GET /slow/{n}": RouteLimit(max_concurrency=1, max_queue=4, queue_timeout=0.05)})
+
+    async def scenario():
+        async with client_for(api) as client:
+            running = asyncio.ensure_future(client.get("/slow/1"))
+            await asyncio.sleep(0.01)
+            timed_out = await client.get("/slow/2")
+            release.set()
+            return timed_out, await running
+
+    timed_out, running = run(scenario())
+    assert timed_out.status_code == 503
+    assert timed_out.headers["Retry-After"] == "1"
+    assert running.status_code == 200
+    assert admission._limiters["GET /slow/{n}"].waiting == 0
+
+
+@pytest.mark.parametrize("method, path, route", [
+    ("GET", "/rooms/6650f0c2a1b2c3d4e5f60718", "GET /rooms/{room_id}"),
+    ("POST", "/rooms/bulk", "POST /rooms/bulk"),
+    ("GET", "/rooms/bulk", "GET /rooms/{room_id}"),  # the right method wins, not the first path match
+    ("PATCH", "/applications/abc/cancel", "PATCH /applications/{application_id}/cancel"),
+    ("GET", "/external/room-distance", "GET /external/room-distance"),
+    ("GET", "/no/such/route", None),
+])
+def test_requests_are_matched_to_route_templates(method, path, route):
+    from app.main import app
+    assert admission._match_route({"app": app, "method": method, "path": path}) == route
+
+
+def test_route_limit_overrides():
+    limits = parse_route_limits('{"POST /users/login": {"max_concurrency": 2}, "GET /rooms/": {"ip_rate": 50}}')
+    assert limits["POST /users/login"] == RouteLimit(max_concurrency=2, max_queue=32, ip_rate=2, ip_burst=20)
+    assert limits["GET /rooms/"] == RouteLimit(ip_rate=50)
+    with pytest.raises(ValueError, match="unknown setting"):
+        parse_route_limits('{"GET /rooms/": {"rate": 5}}')
@@ -0,0 +1,97 @@
+import json
+from datetime import datetime
+
+from bson.objectid import ObjectId
+
+from tests.conftest import run
+
+
+def add_room(mongo) -> str:
+    result = run(mongo.rooms.insert_one({
+        "title": "Double room", "address": "1 Mile End Road", "price_per_month": 700.0, "postcode": "E1 4NS",
+    }))
+    return str(result.inserted_id)
+
+
+def test_applied_at_matches_what_is_read_back(client, mongo, auth):
+    room_id = add_room(mongo)
+    created = client.post("/applications/", json={"room_id": room_id}, headers=auth)
+    assert created.status_code == 201
+    # MongoDB keeps milliseconds, so the returned time is truncated the same way.
+    applied_at = created.json()["applied_at"]
+    assert datetime.fromisoformat(applied_at).microsecond % 1000 == 0
+    assert client.get("/applications/", headers=auth).json()["items"][0]["applied_at"] == applied_at
+
+
+def add_applications(mongo, rooms: list, user: str = "student@example.com") -> list:
+    docs = [{"_id": ObjectId(), "user_email": user, "room_id": room_id, "status": "applied", "applied_at": datetime(2025, 1, 1)}
+            for room_id in rooms]
+    run(mongo.applications.insert_many(docs))
+    return [str(doc["_id"]) for doc in docs]
+
+
+def test_applications_are_paged_newest_first(client, mongo, auth):
+    rooms = [add_room(mongo) for _ in range(2)]
+    ids = add_applications(mongo, rooms * 3)
+    add_applications(mongo, rooms, user="someone.else@example.com")
+
+    seen, cursor = [], None
+    while True:
+        resp = client.get("/applications/", params={"limit": 4, **({"cursor": cursor} if cursor else {})},
+                          headers=auth)
+        page = resp.json()
+        assert len(page["items"]) <= 4
+        assert all(app["room"] is None for app in page["items"])
+        seen += [app["id"] for app in page["items"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == ids[::-1]
+
+    assert client.get("/applications/", params={"cursor": "not-a-cursor"}, headers=auth).status_code == 400
+
+
+def test_expand_room_loads_each_room_once(client, mongo, auth, monkeypatch):
+    rooms = [add_room(mongo) for _ in range(2)]
+    missing_room = str(ObjectId())
+    add_applications(mongo, rooms * 3 + [missing_room])
+    finds = []
+    original = type(mongo.rooms).find
+
+    def find(self, *args, **kwargs):
+        if self.name == "rooms":
+            finds.append(args[0])
+        return original(self, *args, **kwargs)
+
+    monkeypatch.setattr(type(mongo.rooms), "find", find)
+    first = client.get("/applications/", params={"limit": 5, "expand": "room"}, headers=auth).json()
+    second = client.get("/applications/", params={"limit": 5, "expand": "room", "cursor": first["next_cursor"]},
+                        headers=auth).json()
+
+    items = first["items"] + second["items"]
+    assert [app["room"]["id"] if app["room"] else None for app in items] == [None] + rooms[::-1] * 3
+    assert items[1]["room"] == {"id": rooms[1], "title": "Double room", "address": "1 Mile End Road",
+                                "postcode": "E1 4NS", "price_per_month": 700.0}
+    # One $in query per page, each room asked for once.
+    assert [sorted(map(str, query["_id"]["$in"])) for query in finds] == [
+        sorted(rooms + [missing_room]), sorted(rooms)]
+
+
+def test_expand_cannot_be_streamed(client, auth):
+    resp = client.get("/applications/", params={"expand": "room", "stream": "true"}, headers=auth)
+    assert resp.status_code == 400
+
+
+def test_applications_stream_newest_first(client, mongo, auth):
+    rooms = [add_room(mongo) for _ in range(3)]
+    ids = add_applications(mongo, rooms * 50)
+    add_applications(mongo, rooms, user="someone.else@example.com")
+
+    array = client.get("/applications/", params={"stream": "true", "limit": 1}, headers=auth)
+    assert array.headers["content-type"] == "application/json"
+    assert [app["id"] for app in array.json()] == ids[::-1]
+
+    ndjson = client.get("/applications/", headers={**auth, "Accept": "application/x-ndjson"})
+    assert ndjson.headers["content-type"] == "application/x-ndjson"
+    assert [json.loads(line)["id"] for line in ndjson.text.splitlines()] == ids[::-1]
+    assert client.get("/applications/", params={"stream": "true"}).status_code == 401
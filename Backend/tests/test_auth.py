@@ -0,0 +1,169 @@
+import asyncio
+import threading
+from datetime import timedelta
+
+import fakeredis
+import pytest
+from fastapi import HTTPException
+from passlib.context import CryptContext
+
+from app.api import users as users_api
+from app.auth import dependencies, jwt_handler
+from app.auth.jwt_handler import (
+    REVOKED_KEY_PREFIX, create_access_token, decode_access_token, revoke_token,
+    use_revocation_store, verify_access_token,
+)
+from tests.conftest import run
+
+
+@pytest.fixture(autouse=True)
+def clean_denylist(monkeypatch):
+    monkeypatch.setattr(jwt_handler, "_revoked", {})
+    monkeypatch.setattr(jwt_handler, "_revoked_expiry", [])
+    jwt_handler._verified_tokens.clear()
+    yield
+    use_revocation_store(None)
+
+
+def test_revocations_are_not_evicted(monkeypatch):
+    monkeypatch.setattr(jwt_handler, "TOKEN_CACHE_SIZE", 10)
+    first = create_access_token({"sub": "first@example.com"})
+    run(revoke_token(first))
+    for i in range(50):
+        run(revoke_token(create_access_token({"sub": f"student{i}@example.com"})))
+    assert decode_access_token(first) is None
+    assert jwt_handler.token_cache_stats()["revoked"] == 51
+
+
+def test_revocation_is_per_token():
+    token = create_access_token({"sub": "student@example.com"})
+    other = create_access_token({"sub": "student@example.com"})
+    assert decode_access_token(token)["jti"] != decode_access_token(other)["jti"]
+    run(revoke_token(token))
+    assert decode_access_token(token) is None
+    assert decode_access_token(other)["sub"] == "student@example.com"
+
+
+def test_expired_revocations_are_pruned():
+    expired = create_access_token({"sub": "student@example.com"}, expires_delta=timedelta(seconds=-1))
+    live = create_access_token({"sub": "student@example.com"})
+    jwt_handler._add_revoked("jti:old", 1.0)  # expired long ago
+    run(revoke_token(expired))  # already rejected: nothing to remember
+    run(revoke_token(live))
+    assert list(jwt_handler._revoked) == ["jti:" + jwt_handler._verify_token(live)["jti"]]
+
+
+def test_revocations_are_shared_through_redis(monkeypatch):
+    store = fakeredis.FakeAsyncRedis()
+    use_revocation_store(store)
+    token = create_access_token({"sub": "student@example.com"})
+    assert run(verify_access_token(token))["sub"] == "student@example.com"
+    run(revoke_token(token))
+
+    # Another worker: same Redis, empty local denylist.
+    monkeypatch.setattr(jwt_handler, "_revoked", {})
+    assert decode_access_token(token) is not None
+    assert run(verify_access_token(token)) is None
+
+    key = REVOKED_KEY_PREFIX + "jti:" + jwt_handler._verify_token(token)["jti"]
+    assert 0 < run(store.ttl(key)) <= 3601
+
+
+def test_logged_out_token_is_rejected_by_routes(client):
+    token = create_access_token({"sub": "student@example.com"})
+    headers = {"Authorization": f"Bearer {token}"}
+    assert client.get("/applications/", headers=headers).status_code == 200
+    run(revoke_token(token))
+    assert client.get("/applications/", headers=headers).status_code == 401
+
+
+@pytest.mark.parametrize("exp", ["tomorrow", None, True, [1]])
+def test_native_backend_rejects_a_non_numeric_exp(monkeypatch, client, exp):
+    monkeypatch.setattr(jwt_handler, "JWT_BACKEND", "native")
+    token = jwt_handler._native_encode({"sub": "student@example.com", "exp": exp})
+    assert decode_access_token(token) is None
+    assert client.get("/applications/", headers={"Authorization": f"Bearer {token}"}).status_code == 401
+
+
+def test_native_and_jose_tokens_are_interchangeable(monkeypatch):
+    jose_token = create_access_token({"sub": "student@example.com"})
+    monkeypatch.setattr(jwt_handler, "JWT_BACKEND", "native")
+    native_token = create_access_token({"sub": "student@example.com"})
+    assert jwt_handler._native_decode(jose_token)["sub"] == "student@example.com"
+    monkeypatch.setattr(jwt_handler, "JWT_BACKEND", "jose")
+    assert decode_access_token(native_token)["sub"] == "student@example.com"
+    expired = create_access_token({"sub": "student@example.com"}, expires_delta=timedelta(seconds=-1))
+    assert jwt_handler._native_decode(expired) is None
+
+
+def test_password_pool_refuses_work_when_full(monkeypatch, client):
+    monkeypatch.setattr(dependencies, "PASSWORD_HASH_MAX_PENDING", 2)
+    release = threading.Event()
+
+    async def scenario():
+        busy = [asyncio.ensure_future(dependencies._run_in_hash_pool(release.wait)) for _ in range(2)]
+        await asyncio.sleep(0)
+        with pytest.raises(HTTPException) as refused:
+            await dependencies._run_in_hash_pool(release.wait)
+        release.set()
+        await asyncio.gather(*busy)
+        return refused.value
+
+    rejected = dependencies._hash_pool_stats["rejected"]
+    refused = run(scenario())
+    assert refused.status_code == 503
+    assert refused.headers == {"Retry-After": "1"}
+    assert dependencies._hash_pool_stats["rejected"] == rejected + 1
+    assert dependencies._hash_pool_stats["pending"] == 0
+
+    # Routes pass the 503 on.
+    monkeypatch.setitem(dependencies._hash_pool_stats, "pending", 2)
+    resp = client.post("/users/register", json={"email": "new@example.com", "password": "secret123"})
+    assert resp.status_code == 503
+    assert resp.headers["Retry-After"] == "1"
+
+
+def test_login_upgrades_hashes_made_with_an_old_cost(client, mongo):
+    old_hash = CryptContext(schemes=["bcrypt"], bcrypt__rounds=5).hash("secret123")
+    run(mongo.users.insert_one({"email": "old@example.com", "hashed_password": old_hash}))
+
+    resp = client.post("/users/login", json={"email": "old@example.com", "password": "secret123"})
+    assert resp.status_code == 200
+    new_hash = run(mongo.users.find_one({"email": "old@example.com"}))["hashed_password"]
+    assert new_hash != old_hash
+    assert new_hash.startswith(f"$2b${dependencies.BCRYPT_ROUNDS:02d}$")
+    # The new hash works, and isn't replaced again.
+    assert client.post("/users/login", json={"email": "old@example.com", "password": "secret123"}).status_code == 200
+    assert run(mongo.users.find_one({"email": "old@example.com"}))["hashed_password"] == new_hash
+    assert client.post("/users/login", json={"email": "old@example.com", "password": "wrong"}).status_code == 401
+
+
+def test_duplicate_registration_is_refused_before_hashing(client, mongo, monkeypatch):
+    run(mongo.users.create_index("email", unique=True))
+    assert client.post("/users/register", json={"email": "dup@example.com", "password": "secret123"}).status_code == 200
+    hashed = []
+    original = users_api.hash_password_async
+
+    async def counting_hash(password):
+        hashed.append(password)
+        return await original(password)
+
+    monkeypatch.setattr(users_api, "hash_password_async", counting_hash)
+    resp = client.post("/users/register", json={"email": "dup@example.com", "password": "secret123"})
+    assert resp.status_code == 400
+    assert hashed == []
+
+
+def test_concurrent_duplicate_registration_is_refused(client, mongo, monkeypatch):
+    run(mongo.users.create_index("email", unique=True))
+    original = users_api.hash_password_async
+
+    async def racing_hash(password):
+        # Another registration for the same email lands while we hash.
+        await mongo.users.insert_one({"email": "race@example.com", "hashed_password": "x"})
+        return await original(password)
+
+    monkeypatch.setattr(users_api, "hash_password_async", racing_hash)
+    resp = client.post("/users/register", json={"email": "race@example.com", "password": "secret123"})
+    assert resp.status_code == 400
+    assert run(mongo.users.count_documents({"email": "race@example.com"})) == 1
@@ -0,0 +1,122 @@
+import json
+
+from bson.objectid import ObjectId
+
+from app.api import rooms as rooms_api
+from tests.conftest import run
+
+CSV = "text/csv"
+NDJSON = "application/x-ndjson"
+
+
+def upload(client, auth, body: str, content_type: str, **params):
+    resp = client.post("/rooms/bulk", content=body.encode(), params=params,
+                       headers={**auth, "Content-Type": content_type})
+    assert resp.status_code == 200, resp.text
+    return resp.json()
+
+
+def stored_titles(mongo) -> list:
+    return sorted(room["title"] for room in run(mongo.rooms.find({}).to_list(None)))
+
+
+def test_csv_import_reports_bad_rows_and_keeps_the_rest(client, mongo, auth):
+    body = (
+        "Title,Address,Price_per_month,Postcode\n"
+        "Room A,1 Mile End Road,650,e1 4ns\n"
+        "Room B,2 Mile End Road,cheap,E1 4NS\n"
+        "Room C,3 Mile End Road\n"
+        "\n"
+        '"Room D, with a view","4 Mile End Road\n(top floor)",700,E2 9PL\n'
+        "Room E,5 Mile End Road,800,\n"
+    )
+    report = upload(client, auth, body, CSV)
+    assert report["inserted"] == 2
+    assert report["failed"] == 3
+    assert [error["row"] for error in report["errors"]] == [2, 3, 5]
+    assert report["errors"][0]["error"].startswith("price_per_month:")
+    assert report["errors"][1]["error"] == "Expected 4 columns, got 2"
+    assert report["errors"][2]["error"].startswith("postcode:")  # empty values are left out
+    assert not report["errors_truncated"] and report["aborted"] is None
+
+    assert stored_titles(mongo) == ["Room A", "Room D, with a view"]
+    room = run(mongo.rooms.find_one({"title": "Room A"}))
+    assert room["postcode_key"] == "E14NS"
+    assert room["price_per_month"] == 650.0
+
+
+def test_ndjson_import_reports_bad_rows(client, mongo, auth):
+    lines = [
+        json.dumps({"title": "Room A", "address": "1 Mile End Road", "price_per_month": 650, "postcode": "E1 4NS"}),
+        "{not json",
+        "[1, 2]",
+        "",
+        json.dumps({"title": "Room B", "address": "2 Mile End Road", "postcode": "E1 4NS"}),
+        json.dumps({"title": "Room C", "address": "3 Mile End Road", "price_per_month": 700, "postcode": "E2 9PL"}),
+    ]
+    report = upload(client, auth, "\n".join(lines), NDJSON)
+    assert report["inserted"] == 2
+    assert report["errors"] == [
+        {"row": 2, "error": "Invalid JSON"},
+        {"row": 3, "error": "Expected a JSON object"},
+        {"row": 5, "error": "price_per_month: Field required"},
+    ]
+    assert stored_titles(mongo) == ["Room A", "Room C"]
+
+
+def test_format_comes_from_the_query_or_content_type(client, auth):
+    row = json.dumps({"title": "Room A", "address": "1 Mile End Road", "price_per_month": 650, "postcode": "E1 4NS"})
+    assert upload(client, auth, row, "text/plain", format="ndjson")["inserted"] == 1
+    resp = client.post("/rooms/bulk", content=row.encode(), headers={**auth, "Content-Type": "text/plain"})
+    assert resp.status_code == 415
+
+
+def test_import_is_stored_in_batches(client, mongo, auth, monkeypatch):
+    monkeypatch.setattr(rooms_api, "BULK_BATCH_SIZE", 2)
+    inserts = []
+    original = type(mongo.rooms).insert_many
+
+    async def insert_many(self, docs, **kwargs):
+        inserts.append(len(docs))
+        return await original(self, docs, **kwargs)
+
+    monkeypatch.setattr(type(mongo.rooms), "insert_many", insert_many)
+    body = "title,address,price_per_month,postcode\n" + "".join(
+        f"Room {i},{i} Mile End Road,650,E1 4NS\n" for i in range(5))
+    assert upload(client, auth, body, CSV)["inserted"] == 5
+    assert inserts == [2, 2, 1]
+
+
+def test_errors_listed_are_capped_but_counted(client, auth, monkeypatch):
+    monkeypatch.setattr(rooms_api, "BULK_MAX_ERRORS", 2)
+    report = upload(client, auth, "{bad\n" * 5, NDJSON)
+    assert report["failed"] == 5
+    assert len(report["errors"]) == 2
+    assert report["errors_truncated"]
+
+
+def test_oversized_row_aborts_but_keeps_earlier_rows(client, mongo, auth, monkeypatch):
+    monkeypatch.setattr(rooms_api, "BULK_MAX_ROW_BYTES", 200)
+    rows = [
+        json.dumps({"title": "Room A", "address": "1 Mile End Road", "price_per_month": 650, "postcode": "E1 4NS"}),
+        json.dumps({"title": "Room B", "address": "x" * 500, "price_per_month": 650, "postcode": "E1 4NS"}),
+        json.dumps({"title": "Room C", "address": "3 Mile End Road", "price_per_month": 650, "postcode": "E1 4NS"}),
+    ]
+    report = upload(client, auth, "\n".join(rows), NDJSON)
+    assert report["inserted"] == 1
+    assert report["aborted"] == "line longer than 200 bytes"
+    assert stored_titles(mongo) == ["Room A"]
+
+
+def test_bulk_price_update_reports_unknown_rooms(client, mongo, auth):
+    room_id = str(run(mongo.rooms.insert_one({"title": "Room A", "address": "1 Mile End Road",
+                                               "price_per_month": 650.0, "postcode": "E1 4NS"})).inserted_id)
+    missing = str(ObjectId())
+    resp = client.patch("/rooms/bulk", headers=auth, json={"updates": [
+        {"id": room_id, "price_per_month": 700}, {"id": missing, "price_per_month": 700},
+        {"id": "not-an-id", "price_per_month": 700},
+    ]})
+    assert resp.json() == {"matched": 1, "modified": 1, "errors": [
+        {"id": "not-an-id", "error": "Invalid room ID"}, {"id": missing, "error": "Room not found"},
+    ]}
+    assert run(mongo.rooms.find_one({"title": "Room A"}))["price_per_month"] == 700.0
@@ -0,0 +1,290 @@
+import asyncio
+import time
+
+import fakeredis
+import pytest
+from redis.exceptions import RedisError
+
+from app.services import cache as cache_module, fallback
+from app.services.cache import (
+    RedisCacheBackend, TieredCache, TTLCache, delete_cache, local_cache, use_shared_backend,
+)
+from app.services.fallback import UpstreamUnavailable, get_with_stale
+from tests.conftest import run
+
+
+class Clock:
+    """Stands in for time.monotonic so tests can move time forward."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache_module.time, "monotonic", clock)
+    return clock
+
+
+def test_concurrent_callers_share_one_load():
+    cache = TTLCache()
+    calls = []
+
+    async def loader():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "value"
+
+    async def scenario():
+        return await asyncio.gather(*(cache.get_or_set("k", loader) for _ in range(10)))
+
+    assert run(scenario()) == ["value"] * 10
+    assert len(calls) == 1
+    assert cache.get("k") == "value"
+    assert cache.stats()["inflight"] == 0
+
+
+def test_loader_errors_reach_every_waiter_and_are_not_cached():
+    cache = TTLCache()
+    calls = []
+
+    async def loader():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        raise ValueError("upstream down")
+
+    async def scenario():
+        return await asyncio.gather(*(cache.get_or_set("k", loader) for _ in range(3)), return_exceptions=True)
+
+    assert [type(result) for result in run(scenario())] == [ValueError] * 3
+    assert len(calls) == 1
+    assert "k" not in cache._data
+
+
+def test_none_is_not_cached():
+    cache = TTLCache()
+
+    async def loader():
+        return None
+
+    assert run(cache.get_or_set("k", loader)) is None
+    assert len(cache) == 0
+
+
+def test_entries_expire_after_their_own_ttl(clock):
+    cache = TTLCache(default_ttl=60)
+    cache.set("short", 1, ttl=10)
+    cache.set("default", 2)
+    clock.now += 10
+    assert cache.get("short") is None
+    assert cache.get("default") == 2
+    # Reading a key doesn't extend its TTL.
+    clock.now += 50
+    assert cache.get("default") is None
+    assert cache.stats()["expirations"] == 2
+
+
+def test_sweep_drops_expired_entries(clock):
+    cache = TTLCache()
+    cache.set("a", 1, ttl=10)
+    cache.set("b", 2, ttl=100)
+    clock.now += 50
+    assert cache.sweep() == 1
+    assert list(cache._data) == ["b"]
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TTLCache(max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")  # "b" is now the least recently used
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_byte_budget_evicts_and_skips_oversized_values():
+    value = "x" * 1000
+    cache = TTLCache(max_bytes=3 * len(value))
+    for key in "abcd":
+        cache.set(key, value)
+    assert cache.stats()["bytes"] <= cache.max_bytes
+    assert cache.get("a") is None
+    assert cache.get("d") == value
+    cache.set("huge", "x" * 10_000)
+    assert cache.get("huge") is None
+    assert cache.get("d") == value
+
+
+def test_cancelled_loader_does_not_fail_waiters():
+    cache = TTLCache()
+    calls = []
+
+    async def loader():
+        calls.append(1)
+        await asyncio.sleep(0.05 if len(calls) == 1 else 0)
+        return f"value {len(calls)}"
+
+    async def scenario():
+        leader = asyncio.ensure_future(cache.get_or_set("k", loader))
+        await asyncio.sleep(0)
+        waiters = [asyncio.ensure_future(cache.get_or_set("k", loader)) for _ in range(5)]
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await asyncio.gather(*waiters)
+
+    # One waiter takes over the load; the others share its result.
+    assert run(scenario()) == ["value 2"] * 5
+    assert len(calls) == 2
+    assert cache.stats()["inflight"] == 0
+
+
+def test_tiered_cache_reads_through_redis():
+    shared = RedisCacheBackend(fakeredis.FakeAsyncRedis(), prefix="test:")
+    worker_a = TieredCache(TTLCache(), shared, l1_ttl=5)
+    worker_b = TieredCache(TTLCache(), shared, l1_ttl=5)
+    calls = []
+
+    async def loader():
+        calls.append(1)
+        return {"lat": 51.5, "lon": -0.1}
+
+    async def scenario():
+        assert await worker_a.get_or_set("geo:E14NS", loader, ttl=600) == {"lat": 51.5, "lon": -0.1}
+        # Another worker finds it in Redis instead of calling the upstream again.
+        assert await worker_b.get_or_set("geo:E14NS", loader, ttl=600) == {"lat": 51.5, "lon": -0.1}
+        assert await shared.client.ttl("test:geo:E14NS") > 5
+        assert await worker_b.get_many(["geo:E14NS", "geo:E16AN"]) == {"geo:E14NS": {"lat": 51.5, "lon": -0.1}}
+        await worker_a.delete("geo:E14NS")
+        return await shared.get_many(["geo:E14NS"])
+
+    assert run(scenario()) == {}
+    assert len(calls) == 1
+    assert worker_b.l2_hits == 1
+    assert worker_b.l2_misses == 1  # geo:E16AN
+    # worker_b's own copy only lives for l1_ttl, not the full 600 s.
+    assert worker_b.local._data["geo:E14NS"][0] - time.monotonic() <= 5
+
+
+def test_tiered_cache_carries_on_without_redis():
+    class BrokenRedis:
+        async def get_many_with_ttl(self, keys):
+            raise RedisError("down")
+
+        async def set_many(self, items, ttl):
+            raise RedisError("down")
+
+    tiered = TieredCache(TTLCache(), BrokenRedis())
+
+    async def loader():
+        return "value"
+
+    assert run(tiered.get_or_set("k", loader)) == "value"
+    assert tiered.local.get("k") == "value"
+    assert tiered.l2_errors == 2
+
+
+def test_get_with_stale_serves_stale_values_and_refreshes_them():
+    use_shared_backend(RedisCacheBackend(fakeredis.FakeAsyncRedis()))
+    values = iter(["first", "second"])
+    calls = []
+
+    async def loader():
+        calls.append(1)
+        return next(values)
+
+    async def scenario():
+        assert await get_with_stale("geo:E14NS", loader, ttl=60, stale_ttl=600) == "first"
+        assert await get_with_stale("geo:E14NS", loader, ttl=60, stale_ttl=600) == "first"
+        # The value goes stale: it's still served at once, and refreshed in the background.
+        await delete_cache("fresh:geo:E14NS")
+        assert await get_with_stale("geo:E14NS", loader, ttl=60, stale_ttl=600) == "first"
+        await asyncio.gather(*fallback._refreshing.values())
+        return await get_with_stale("geo:E14NS", loader, ttl=60, stale_ttl=600)
+
+    assert run(scenario()) == "second"
+    assert len(calls) == 2
+
+
+def test_get_with_stale_keeps_the_stale_value_when_the_refresh_fails():
+    calls = []
+
+    async def loader():
+        calls.append(1)
+        if len(calls) > 1:
+            raise UpstreamUnavailable("postcodes.io is down")
+        return "first"
+
+    async def scenario():
+        await get_with_stale("geo:E14NS", loader, ttl=60, stale_ttl=600)
+        await delete_cache("fresh:geo:E14NS")
+        assert await get_with_stale("geo:E14NS", loader, ttl=60, stale_ttl=600) == "first"
+        await asyncio.gather(*fallback._refreshing.values())
+        return await get_with_stale("geo:E14NS", loader, ttl=60, stale_ttl=600)
+
+    assert run(scenario()) == "first"
+    assert len(calls) == 3
+
+
+class RecordingBackend(RedisCacheBackend):
+    """A fakeredis backend that remembers every key written to it."""
+
+    def __init__(self):
+        super().__init__(fakeredis.FakeAsyncRedis())
+        self.written = []
+
+    async def set_many(self, items: dict, ttl: int):
+        self.written += list(items)
+        await super().set_many(items, ttl)
+
+
+def test_non_cacheable_values_are_never_stored():
+    shared = RecordingBackend()
+    use_shared_backend(shared)
+    calls = []
+
+    async def estimate():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"distance_meters": 1000.0, "estimated": True}
+
+    def not_estimated(value):
+        return not value.get("estimated")
+
+    async def scenario():
+        # Requests sharing the load all get the estimate...
+        results = await asyncio.gather(*(
+            get_with_stale("distance:main:r1", estimate, cacheable=not_estimated) for _ in range(3)))
+        assert results == [{"distance_meters": 1000.0, "estimated": True}] * 3
+        # ...but it never reaches either tier, so the next request asks again.
+        assert local_cache.get("distance:main:r1") is None
+        await get_with_stale("distance:main:r1", estimate, cacheable=not_estimated)
+
+    run(scenario())
+    assert shared.written == []
+    assert len(calls) == 2
+
+
+def test_local_copy_never_outlives_the_redis_key(clock):
+    shared = RedisCacheBackend(fakeredis.FakeAsyncRedis())
+    worker = TieredCache(TTLCache(), shared, l1_ttl=60)
+
+    async def scenario():
+        await shared.set_many({"geo:E14NS": "soon gone", "geo:E16AN": "long lived"}, ttl=600)
+        await shared.client.pexpire(shared.prefix + "geo:E14NS", 2000)
+        await shared.client.persist(shared.prefix + "geo:E16AN")
+        return await worker.get_many(["geo:E14NS", "geo:E16AN"])
+
+    assert run(scenario()) == {"geo:E14NS": "soon gone", "geo:E16AN": "long lived"}
+    assert worker.local._data["geo:E14NS"][0] - clock.now == pytest.approx(2, abs=0.1)
+    assert worker.local._data["geo:E16AN"][0] - clock.now == 60
+    clock.now += 2
+    assert worker.local.get("geo:E14NS") is None
@@ -0,0 +1,96 @@
+import json
+from collections import Counter
+
+import pytest
+
+from app.services import campus, geocode_warmup
+from app.services.cache import get_many_cache, local_cache
+from app.services.campus import get_campus_coords, load_campuses, parse_campuses
+from app.services.geocode_warmup import save_geocode_snapshot, warm_geocode_cache
+from tests.conftest import POINTS, fake_upstreams, run
+
+
+@pytest.fixture
+def campuses(monkeypatch):
+    monkeypatch.setattr(campus, "CAMPUS_POSTCODES", {"whitechapel": "E1 4NS", "bethnal_green": "E2 9PL"})
+    monkeypatch.setattr(campus, "DEFAULT_CAMPUS", "whitechapel")
+
+
+@pytest.fixture
+def requests(monkeypatch):
+    """Fresh per-postcode request counts for the snapshot."""
+    counts = Counter()
+    monkeypatch.setattr(geocode_warmup, "_requests", counts)
+    return counts
+
+
+def test_parse_campuses():
+    assert parse_campuses(" b = E2 9PL ;a=E1 4NS;") == {"b": "E2 9PL", "a": "E1 4NS"}
+    for value in ("", " ; ", "main", "main=", "=E1 4NS"):
+        with pytest.raises(ValueError):
+            parse_campuses(value)
+
+
+def test_campuses_are_geocoded_in_one_bulk_lookup(upstream, campuses):
+    calls = []
+    upstream(fake_upstreams(calls))
+    assert run(load_campuses()) == {"whitechapel": POINTS["E14NS"], "bethnal_green": POINTS["E29PL"]}
+    assert [request.method for request in calls] == ["POST"]
+    # /external/geocode gets them from the cache.
+    assert run(get_many_cache(["geocode:E14NS"])) == {
+        "geocode:E14NS": {"latitude": POINTS["E14NS"][0], "longitude": POINTS["E14NS"][1]}}
+
+    assert run(get_campus_coords()) == POINTS["E14NS"]
+    assert run(get_campus_coords("bethnal_green")) == POINTS["E29PL"]
+    assert len(calls) == 1
+    with pytest.raises(KeyError):
+        run(get_campus_coords("nowhere"))
+
+
+def test_campuses_missed_on_startup_are_looked_up_once_on_use(upstream, campuses):
+    calls = []
+    upstream(fake_upstreams(calls, postcodes_io=False))
+    assert run(load_campuses()) == {}
+    assert run(get_campus_coords()) == (None, None)
+
+    upstream(fake_upstreams(calls))
+    calls.clear()
+    assert run(get_campus_coords()) == POINTS["E14NS"]
+    assert run(get_campus_coords()) == POINTS["E14NS"]
+    assert len(calls) == 1
+
+
+def test_geocode_cache_is_warmed_from_the_last_snapshot(client, upstream, requests, tmp_path):
+    calls = []
+    upstream(fake_upstreams(calls))
+    for postcode in ["E1 4NS", "e14ns", "E1 4NS", "E2 9PL", "E1 6AN", "E1 6AN"]:
+        assert client.get("/external/geocode", params={"postcode": postcode}).status_code == 200
+    # Counted but never cached, so it can't go in the snapshot.
+    requests["ZZ99ZZ"] += 10
+    path = str(tmp_path / "snapshots" / "geocode.json")
+
+    assert run(save_geocode_snapshot(path, size=3)) == 2
+    with open(path, encoding="utf-8") as f:
+        assert [(e["postcode"], e["count"]) for e in json.load(f)["postcodes"]] == [("E14NS", 3), ("E16AN", 2)]
+
+    # A restart: empty cache, no counts.
+    local_cache.clear()
+    requests.clear()
+    assert run(warm_geocode_cache(path)) == 2
+    assert dict(requests) == {"E14NS": 1, "E16AN": 1}
+    calls.clear()
+    resp = client.get("/external/geocode", params={"postcode": "E1 6AN"})
+    assert resp.json() == {"latitude": POINTS["E16AN"][0], "longitude": POINTS["E16AN"][1]}
+    assert calls == []
+    assert client.get("/external/geocode", params={"postcode": "E2 9PL"}).status_code == 200
+    assert len(calls) == 1
+
+
+def test_a_missing_or_unreadable_snapshot_is_skipped(tmp_path, requests):
+    assert run(warm_geocode_cache(str(tmp_path / "missing.json"))) == 0
+    assert run(warm_geocode_cache("")) == 0
+    assert run(save_geocode_snapshot("")) == 0
+    broken = tmp_path / "broken.json"
+    broken.write_text('{"postcodes": [', encoding="utf-8")
+    assert run(warm_geocode_cache(str(broken))) == 0
+    assert not requests
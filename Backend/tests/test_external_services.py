@@ -0,0 +1,228 @@
+import asyncio
+import json
+import time
+
+import httpx
+import pytest
+from bson.objectid import ObjectId
+
+from app.services import distance_service, fallback, geocode_service
+from app.services.distance_service import calculate_osrm_distances, estimate_distances
+from app.services.fallback import CircuitBreaker, Upstream, UpstreamUnavailable
+from tests.conftest import POINTS, fake_upstreams, run
+
+
+def half_open_upstream(**kwargs) -> Upstream:
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=0)
+    breaker.state = "open"
+    breaker.opened_at = time.monotonic() - 1
+    return Upstream("test", timeout=1, retries=0, backoff=0, breaker=breaker, **kwargs)
+
+
+def test_breaker_opens_after_threshold_and_probe_closes_it(upstream):
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(503 if len(calls) <= 2 else 200)
+
+    upstream(handler)
+    policy = Upstream("test", timeout=1, retries=0, backoff=0,
+                      breaker=CircuitBreaker("test", failure_threshold=2, reset_timeout=0.05))
+
+    async def scenario():
+        for _ in range(2):
+            with pytest.raises(UpstreamUnavailable):
+                await policy.request("GET", "http://upstream/")
+        assert policy.breaker.state == "open"
+        with pytest.raises(UpstreamUnavailable, match="circuit is open"):
+            await policy.request("GET", "http://upstream/")
+        await asyncio.sleep(0.06)
+        resp = await policy.request("GET", "http://upstream/")
+        assert resp.status_code == 200
+        assert policy.breaker.state == "closed"
+
+    run(scenario())
+    assert len(calls) == 3
+
+
+def test_probe_is_not_claimed_while_queued(upstream):
+    upstream(lambda request: httpx.Response(200))
+    policy = half_open_upstream(max_concurrency=1, queue_timeout=0.01)
+
+    async def scenario():
+        await policy._semaphore.acquire()  # every slot busy
+        with pytest.raises(UpstreamUnavailable, match="busy"):
+            await policy.request("GET", "http://upstream/")
+        policy._semaphore.release()
+        # The timed-out call must not have left the probe slot taken.
+        resp = await policy.request("GET", "http://upstream/")
+        assert resp.status_code == 200
+        assert policy.breaker.state == "closed"
+
+    run(scenario())
+
+
+def test_cancelled_probe_reopens_the_circuit(upstream):
+    async def handler(request):
+        await asyncio.sleep(10)
+        return httpx.Response(200)
+
+    upstream(handler)
+    policy = half_open_upstream()
+
+    async def scenario():
+        task = asyncio.ensure_future(policy.request("GET", "http://upstream/"))
+        await asyncio.sleep(0.01)
+        assert policy.breaker.state == "half_open"
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    run(scenario())
+    assert policy.breaker.state == "open"
+    assert not policy.breaker._probing
+
+
+def test_unexpected_probe_error_reopens_the_circuit(upstream):
+    def handler(request):
+        raise ValueError("boom")
+
+    upstream(handler)
+    policy = half_open_upstream()
+    with pytest.raises(ValueError):
+        run(policy.request("GET", "http://upstream/"))
+    assert policy.breaker.state == "open"
+    # reset_timeout=0: the next call is the new probe, and it goes through.
+    assert policy.breaker.start_call()
+
+
+def test_osrm_table_requests_are_split_by_the_coordinate_limit(upstream, monkeypatch):
+    calls = []
+    upstream(fake_upstreams(calls))
+    # Three origins plus the destination per request.
+    monkeypatch.setattr(distance_service, "OSRM_TABLE_MAX_COORDINATES", 4)
+    origins = [(51.5 + i / 100, -0.1) for i in range(7)]
+
+    assert run(calculate_osrm_distances(origins, *POINTS["E14NS"])) == [(1000.0, 100.0)] * 7
+    assert sorted(len(call.url.params["sources"].split(";")) for call in calls) == [1, 3, 3]
+    for call in calls:
+        coordinates = call.url.path.rsplit("/", 1)[1].split(";")
+        # OSRM wants lon,lat, and the destination is the last coordinate.
+        assert coordinates[-1] == "{1},{0}".format(*POINTS["E14NS"])
+        assert call.url.params["destinations"] == str(len(coordinates) - 1)
+
+
+def test_failed_osrm_chunk_only_fails_its_own_origins(upstream, monkeypatch):
+    monkeypatch.setattr(fallback.OSRM, "retries", 0)
+    monkeypatch.setattr(distance_service, "OSRM_TABLE_MAX_COORDINATES", 3)
+    answer = fake_upstreams()
+
+    def handler(request):
+        if request.url.params["sources"] == "0":  # the last, one-origin chunk
+            return httpx.Response(503)
+        return answer(request)
+
+    upstream(handler)
+    origins = [(51.5, -0.1)] * 5
+    assert run(calculate_osrm_distances(origins, *POINTS["E14NS"])) == [(1000.0, 100.0)] * 4 + [(None, None)]
+
+
+def test_estimate_distances_uses_the_haversine_distance():
+    # One degree of latitude is ~111.2 km; the estimate stretches it for detours.
+    ((meters, seconds),) = estimate_distances([(51.0, -0.1)], 52.0, -0.1)
+    assert meters == pytest.approx(111_195 * distance_service.ESTIMATE_DETOUR_FACTOR, rel=1e-3)
+    assert seconds == pytest.approx(meters / distance_service.ESTIMATE_SPEED_MPS, abs=0.1)
+    assert estimate_distances([], 52.0, -0.1) == []
+    assert estimate_distances([(52.0, -0.1)], 52.0, -0.1) == [(0.0, 0.0)]
+
+
+def room_ids(mongo, postcodes):
+    docs = [{"_id": ObjectId(), "title": "Room", "address": "1 Mile End Road", "price_per_month": 650.0,
+             "postcode": postcode} for postcode in postcodes]
+    run(mongo.rooms.insert_many(docs))
+    return [str(doc["_id"]) for doc in docs]
+
+
+def test_room_distances_are_routed_in_one_table_request_and_cached(client, mongo, upstream):
+    calls = []
+    upstream(fake_upstreams(calls))
+    ids = room_ids(mongo, ["E1 6AN", "E2 9PL"])
+
+    resp = client.get("/external/room-distance", params={"room_id": ids})
+    assert resp.status_code == 200
+    assert resp.json()["results"] == [
+        {"room_id": room_id, "distance_meters": 1000.0, "duration_seconds": 100.0} for room_id in ids
+    ]
+    assert len([call for call in calls if "/table/" in call.url.path]) == 1
+
+    calls.clear()
+    assert client.get("/external/room-distance", params={"room_id": ids}).json() == resp.json()
+    assert calls == []
+
+
+def test_room_distances_fall_back_to_estimates_when_osrm_is_down(client, mongo, upstream, monkeypatch):
+    monkeypatch.setattr(fallback.OSRM, "retries", 0)
+    calls = []
+    upstream(fake_upstreams(calls, osrm=False))
+    ids = room_ids(mongo, ["E1 6AN", "E2 9PL"])
+
+    results = client.get("/external/room-distance", params={"room_id": ids}).json()["results"]
+    expected = estimate_distances([POINTS["E16AN"], POINTS["E29PL"]], *POINTS["E14NS"])
+    assert [(r["distance_meters"], r["duration_seconds"]) for r in results] == expected
+    assert all(r["estimated"] for r in results)
+
+    single = client.get("/external/room-distance", params={"room_id": ids[0]}).json()
+    assert single == {"distance_meters": expected[0][0], "duration_seconds": expected[0][1], "estimated": True}
+
+    # Estimates aren't cached: once OSRM is back, the next request routes the rooms.
+    fallback.OSRM.breaker.record_success()
+    upstream(fake_upstreams())
+    results = client.get("/external/room-distance", params={"room_id": ids}).json()["results"]
+    assert [r["distance_meters"] for r in results] == [1000.0, 1000.0]
+    assert not any("estimated" in r for r in results)
+    assert client.get("/external/room-distance", params={"room_id": ids[0]}).json() == {
+        "distance_meters": 1000.0, "duration_seconds": 100.0}
+
+
+def test_bulk_geocode_batches_lookups_and_reports_failures(client, upstream, monkeypatch):
+    monkeypatch.setattr(geocode_service, "BULK_CHUNK_SIZE", 2)
+    calls = []
+    answer = fake_upstreams(calls)
+
+    def handler(request):
+        if request.method == "POST" and b"ZZ99ZZ" in request.content:
+            calls.append(request)
+            # postcodes.io answers unknown postcodes with a null result.
+            postcodes = json.loads(request.content)["postcodes"]
+            return httpx.Response(200, json={"status": 200, "result": [
+                {"query": p, "result": None if p == "ZZ99ZZ" else dict(zip(("latitude", "longitude"), POINTS[p]))}
+                for p in postcodes]})
+        return answer(request)
+
+    upstream(handler)
+    body = {"postcodes": ["e1 4ns", "E1 4NS", "E1 6AN", "  ", "ZZ9 9ZZ", "E2 9PL"]}
+    resp = client.post("/external/geocode/bulk", json=body)
+    assert resp.status_code == 200
+    assert resp.json()["results"] == [
+        {"postcode": "E14NS", "latitude": POINTS["E14NS"][0], "longitude": POINTS["E14NS"][1], "error": None},
+        {"postcode": "E16AN", "latitude": POINTS["E16AN"][0], "longitude": POINTS["E16AN"][1], "error": None},
+        {"postcode": "", "latitude": None, "longitude": None, "error": "Invalid postcode"},
+        {"postcode": "ZZ99ZZ", "latitude": None, "longitude": None, "error": "Could not geocode postcode"},
+        {"postcode": "E29PL", "latitude": POINTS["E29PL"][0], "longitude": POINTS["E29PL"][1], "error": None},
+    ]
+    # Four unique postcodes, two per bulk POST.
+    assert sorted(len(json.loads(call.content)["postcodes"]) for call in calls) == [2, 2]
+
+    # Found postcodes are cached; only the unknown one is asked for again.
+    calls.clear()
+    assert client.post("/external/geocode/bulk", json=body).json() == resp.json()
+    assert [json.loads(call.content)["postcodes"] for call in calls] == [["ZZ99ZZ"]]
+
+
+def test_bulk_geocode_marks_a_failed_batch_as_failed(client, upstream, monkeypatch):
+    monkeypatch.setattr(fallback.POSTCODES_IO, "retries", 0)
+    upstream(fake_upstreams(postcodes_io=False))
+    results = client.post("/external/geocode/bulk", json={"postcodes": ["E1 4NS", "E1 6AN"]}).json()["results"]
+    assert [r["error"] for r in results] == ["Could not geocode postcode"] * 2
+    assert client.post("/external/geocode/bulk", json={"postcodes": []}).status_code == 422
@@ -0,0 +1,74 @@
+import os
+
+import pytest
+
+from app.services.gazetteer import Gazetteer, build_gazetteer, local_lookup, set_gazetteer
+from app.services.geocode_service import postcode_to_coords, postcodes_to_coords
+from tests.conftest import fake_upstreams, run
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "fixtures", "postcodes.csv")
+
+
+@pytest.fixture
+def gazetteer(tmp_path):
+    """The fixture postcodes compiled into a gazetteer file and used by the app."""
+    path = str(tmp_path / "postcodes.gaz")
+    assert build_gazetteer(FIXTURE, path) == 4  # no coordinates for GY1 1AA and ZZ9 9ZZ
+    gazetteer = Gazetteer(path)
+    set_gazetteer(gazetteer)
+    yield gazetteer
+    set_gazetteer(None)
+    gazetteer.close()
+
+
+def test_lookup_finds_postcodes_however_they_are_written(gazetteer):
+    assert len(gazetteer) == 4
+    assert gazetteer.lookup("E1 4NS") == (51.524559, -0.040251)
+    assert gazetteer.lookup(" e14ns ") == (51.524559, -0.040251)
+    assert gazetteer.lookup("SW1A 1AA") == (51.501009, -0.141588)
+    assert gazetteer.lookup("E2 9PL") == (51.531, -0.055)
+
+
+def test_lookup_misses(gazetteer):
+    for postcode in ("E1 4NT", "A1", "ZZZZ9ZZZ", "GY1 1AA", ""):
+        assert gazetteer.lookup(postcode) is None
+
+
+def test_build_accepts_plain_postcode_columns(tmp_path):
+    csv_path = tmp_path / "postcodes.csv"
+    csv_path.write_text("postcode,latitude,longitude\nE1 4NS,51.5,-0.04\nE1 4NS,51.6,-0.05\n")
+    path = str(tmp_path / "postcodes.gaz")
+    assert build_gazetteer(str(csv_path), path) == 1
+    gazetteer = Gazetteer(path)
+    assert gazetteer.lookup("E14NS") == (51.6, -0.05)  # the last row for a postcode wins
+    gazetteer.close()
+
+
+def test_other_files_are_rejected(tmp_path):
+    path = tmp_path / "not-a-gazetteer"
+    path.write_bytes(b"\0" * 64)
+    with pytest.raises(ValueError):
+        Gazetteer(str(path))
+
+
+def test_geocoding_only_calls_postcodes_io_for_unknown_postcodes(gazetteer, upstream):
+    calls = []
+    upstream(fake_upstreams(calls))
+    assert local_lookup("E1 6AN") == (51.52, -0.07)
+    assert run(postcode_to_coords("E1 6AN")) == (51.52, -0.07)
+    assert calls == []
+
+    coords = run(postcodes_to_coords(["E1 4NS", "N1 9GU"]))
+    assert coords["E14NS"] == (51.524559, -0.040251)
+    assert coords["N19GU"] == (51.5, -0.1)  # from the fake postcodes.io
+    (call,) = calls
+    assert b"N19GU" in call.content and b"E14NS" not in call.content
+
+
+def test_without_a_gazetteer_everything_goes_to_postcodes_io(upstream):
+    set_gazetteer(None)
+    calls = []
+    upstream(fake_upstreams(calls))
+    assert local_lookup("E1 4NS") is None
+    assert run(postcode_to_coords("E1 4NS")) == (51.5246, -0.0403)
+    assert len(calls) == 1
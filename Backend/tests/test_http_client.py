@@ -0,0 +1,40 @@
+import httpx
+
+from app.services import http_client
+from app.services.distance_service import calculate_osrm_distance
+from app.services.geocode_service import postcode_to_coords
+from tests.conftest import POINTS, fake_upstreams, run
+
+
+def test_one_client_is_shared_until_it_is_closed():
+    http_client.set_http_client(None)
+    run(http_client.start_http_client())
+    client = http_client.get_http_client()
+    assert http_client.get_http_client() is client
+    assert client.timeout == httpx.Timeout(connect=http_client.HTTP_CONNECT_TIMEOUT, read=http_client.HTTP_READ_TIMEOUT,
+                                           write=http_client.HTTP_READ_TIMEOUT, pool=http_client.HTTP_POOL_TIMEOUT)
+
+    run(http_client.close_http_client())
+    assert client.is_closed
+    # A script that calls out after shutdown gets a fresh client instead of a closed one.
+    replacement = http_client.get_http_client()
+    assert replacement is not client and not replacement.is_closed
+    run(http_client.close_http_client())
+
+
+def test_geocoding_and_routing_go_through_the_shared_client(upstream):
+    calls = []
+    upstream(fake_upstreams(calls))
+    shared = http_client.get_http_client()
+    opened = []
+    original_send = shared.send
+
+    async def send(request, **kwargs):
+        opened.append(request.url.host)
+        return await original_send(request, **kwargs)
+
+    shared.send = send
+    assert run(postcode_to_coords("E1 6AN")) == POINTS["E16AN"]
+    assert run(calculate_osrm_distance(*POINTS["E16AN"], *POINTS["E14NS"])) == (1000.0, 100.0)
+    assert opened == ["api.postcodes.io", "router.project-osrm.org"]
+    assert len(calls) == 2
@@ -0,0 +1,68 @@
+from pymongo import ASCENDING, IndexModel
+
+from app.db import indexes
+from app.db.indexes import INDEXES, ensure_indexes
+from app.scripts import ensure_indexes as ensure_indexes_script
+from tests.conftest import run
+
+REGISTRY = {
+    "users": [IndexModel([("email", ASCENDING)], name="email_unique", unique=True)],
+    "rooms": [IndexModel([("postcode_key", ASCENDING)], name="postcode_key")],
+}
+
+
+def statuses(report: list) -> dict:
+    return {(entry["collection"], entry["index"]): entry["status"] for entry in report}
+
+
+def test_every_registered_index_is_created(mongo):
+    report = run(ensure_indexes(mongo))
+    assert statuses(report) == {
+        (collection, model.document["name"]): "created" for collection, models in INDEXES.items() for model in models}
+    assert run(mongo.users.index_information())["email_unique"]["unique"]
+
+
+def test_ensure_indexes_is_idempotent_and_can_only_check(mongo, monkeypatch):
+    monkeypatch.setattr(indexes, "INDEXES", REGISTRY)
+    assert set(statuses(run(ensure_indexes(mongo, create=False))).values()) == {"missing"}
+    assert run(mongo.list_collection_names()) == []
+
+    assert set(statuses(run(ensure_indexes(mongo))).values()) == {"created"}
+    assert set(statuses(run(ensure_indexes(mongo))).values()) == {"exists"}
+    assert set(statuses(run(ensure_indexes(mongo, create=False))).values()) == {"exists"}
+
+
+def test_drift_and_unmanaged_indexes_are_reported_not_changed(mongo, monkeypatch):
+    monkeypatch.setattr(indexes, "INDEXES", REGISTRY)
+    # Same name, but not unique; and an index nobody registered.
+    run(mongo.users.create_index([("email", ASCENDING)], name="email_unique"))
+    run(mongo.rooms.create_index([("title", ASCENDING)], name="title"))
+
+    assert statuses(run(ensure_indexes(mongo))) == {
+        ("users", "email_unique"): "drift",
+        ("rooms", "postcode_key"): "created",
+        ("rooms", "title"): "unmanaged",
+    }
+    assert not run(mongo.users.index_information())["email_unique"].get("unique")
+
+
+def test_duplicates_make_the_unique_index_fail(mongo, monkeypatch, capsys):
+    monkeypatch.setattr(indexes, "INDEXES", REGISTRY)
+    run(mongo.users.insert_many([{"email": "a@example.com"}, {"email": "a@example.com"}]))
+
+    [entry] = [entry for entry in run(ensure_indexes(mongo)) if entry["index"] == "email_unique"]
+    assert entry["status"] == "failed"
+    assert "duplicate" in entry["error"].lower()
+    # The script prints the report and exits 1 while something is failed, missing or drifted.
+    assert run(ensure_indexes_script.main(check_only=False)) == 1
+    assert "users.email_unique: failed (" in capsys.readouterr().out
+
+    run(mongo.users.delete_one({"email": "a@example.com"}))
+    assert run(ensure_indexes_script.main(check_only=False)) == 0
+
+
+def test_partial_filters_are_compared():
+    [model] = [model for model in INDEXES["rooms"] if model.document["name"] == "location_pending"]
+    stored = {"key": [("location.pending", 1)], "v": 2, "partialFilterExpression": {"location.pending": True}}
+    assert indexes._spec(stored) == indexes._spec(model.document)
+    assert indexes._spec({**stored, "partialFilterExpression": None}) != indexes._spec(model.document)
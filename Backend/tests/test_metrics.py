@@ -0,0 +1,99 @@
+import httpx
+import pytest
+
+from app.services import geocode_service
+from app.utils import metrics
+from app.utils.metrics import Counter, Gauge, Histogram, add_collector, render_metrics, track_upstream
+from tests.conftest import run
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    """Metrics created in a test only show up in that test's render_metrics()."""
+    monkeypatch.setattr(metrics, "_registry", [])
+    monkeypatch.setattr(metrics, "_collectors", [])
+
+
+def upstream_calls(service: str, operation: str, outcome: str) -> float:
+    return metrics.upstream_requests_total._values.get((service, operation, outcome), 0)
+
+
+def test_metrics_render_in_the_prometheus_text_format(registry):
+    requests = Counter("requests_total", "Requests.", ("route", "status"))
+    in_flight = Gauge("in_flight", "In flight.")
+    latency = Histogram("latency_seconds", "Latency.", ("route",), buckets=(0.1, 1.0))
+    requests.inc(route="/rooms/{room_id}", status="200")
+    requests.inc(2, route='/say "hi"\n', status="500")
+    in_flight.inc()
+    in_flight.inc()
+    in_flight.dec()
+    for value in (0.05, 0.5, 5):
+        latency.observe(value, route="/rooms/")
+    add_collector(lambda: [("cache_hits_total", "counter", "Cache hits.", {"cache": "app"}, 3)])
+    add_collector(lambda: [("cache_hits_total", "counter", "Cache hits.", {"cache": "jwt"}, 4)])
+
+    assert render_metrics().splitlines() == [
+        "# HELP requests_total Requests.",
+        "# TYPE requests_total counter",
+        'requests_total{route="/rooms/{room_id}",status="200"} 1',
+        'requests_total{route="/say \\"hi\\"\\n",status="500"} 2',
+        "# HELP in_flight In flight.",
+        "# TYPE in_flight gauge",
+        "in_flight 1",
+        "# HELP latency_seconds Latency.",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{route="/rooms/",le="0.1"} 1',
+        'latency_seconds_bucket{route="/rooms/",le="1.0"} 2',
+        'latency_seconds_bucket{route="/rooms/",le="+Inf"} 3',
+        'latency_seconds_sum{route="/rooms/"} 5.55',
+        'latency_seconds_count{route="/rooms/"} 3',
+        # Samples from different collectors are grouped under one HELP/TYPE.
+        "# HELP cache_hits_total Cache hits.",
+        "# TYPE cache_hits_total counter",
+        'cache_hits_total{cache="app"} 3',
+        'cache_hits_total{cache="jwt"} 4',
+    ]
+
+
+@pytest.mark.parametrize("error, outcome", [
+    (httpx.ReadTimeout("slow"), "timeout"),
+    (httpx.ConnectError("refused"), "error"),
+])
+def test_track_upstream_counts_outcomes(error, outcome):
+    async def call(fail: bool, status: str = None):
+        async with track_upstream("test_service", "op") as tracked:
+            if fail:
+                raise error
+            if status:
+                tracked.outcome = status
+
+    before = {name: upstream_calls("test_service", "op", name) for name in ("ok", "404", outcome)}
+    duration_before = metrics.upstream_request_duration_seconds._values.get(("test_service", "op"), [0] * 13)[-1]
+    run(call(False))
+    run(call(False, "404"))
+    with pytest.raises(type(error)):
+        run(call(True))
+    assert {name: upstream_calls("test_service", "op", name) - before[name] for name in before} == {
+        "ok": 1, "404": 1, outcome: 1}
+    assert metrics.upstream_request_duration_seconds._values[("test_service", "op")][-1] == duration_before + 3
+
+
+def test_metrics_endpoint_reports_routes_and_upstream_calls(client, upstream, monkeypatch):
+    monkeypatch.setattr(geocode_service, "local_lookup", lambda postcode: None)
+    upstream(lambda request: httpx.Response(404, json={"status": 404, "error": "Invalid postcode"}))
+    before = upstream_calls("postcodes_io", "lookup", "404")
+    assert run(geocode_service.postcode_to_coords("ZZ9 9ZZ")) == (None, None)
+    assert upstream_calls("postcodes_io", "lookup", "404") == before + 1
+
+    client.get("/rooms/not-an-id")
+    resp = client.get("/metrics")
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/plain; version=0.0.4")
+    lines = resp.text.splitlines()
+    # Routes are labelled by template, not by the URL that was asked for.
+    assert any(line.startswith('http_requests_total{method="GET",route="/rooms/{room_id}",status="400"}')
+               for line in lines)
+    assert not any("not-an-id" in line for line in lines)
+    assert f'upstream_requests_total{{service="postcodes_io",operation="lookup",outcome="404"}} {before + 1}' in lines
+    for name in ("cache_hit_ratio", "password_pool_pending", "http_request_duration_seconds_bucket"):
+        assert any(line.startswith(name) for line in lines)
@@ -0,0 +1,126 @@
+from types import SimpleNamespace
+
+import mongomock
+import pytest
+from bson.objectid import ObjectId
+
+from app.api import rooms as rooms_api
+from app.db import mongodb
+from app.services.geo_index import GeoGridIndex, geo_point, haversine_meters, load_geo_index
+from tests.conftest import run
+
+CAMPUS = (51.5246, -0.0403)
+# Rooms due east of the campus, roughly 0, 350, 700, ... meters away.
+ROOMS = [(CAMPUS[0], CAMPUS[1] + i * 0.005, 400.0 + 100 * i) for i in range(8)]
+
+
+@pytest.fixture
+def rooms(mongo):
+    docs = [{"_id": ObjectId(), "title": f"Room {i}", "address": f"{i} Mile End Road", "postcode": "E1 4NS",
+             "price_per_month": price, "geo": geo_point(lat, lon)} for i, (lat, lon, price) in enumerate(ROOMS)]
+    run(mongo.rooms.insert_many([dict(doc) for doc in docs]))
+    run(load_geo_index())
+    return docs
+
+
+class _Results:
+    def __init__(self, docs):
+        self.docs = docs
+
+    async def to_list(self, length=None):
+        return self.docs
+
+
+@pytest.fixture
+def geo_near(rooms, monkeypatch):
+    """
+    Use the $geoNear backend. mongomock has no $geoNear, so the stage is worked out here
+    and the rest of the pipeline runs on a plain mongomock collection. Returns the pipelines sent.
+    """
+    monkeypatch.setattr(rooms_api, "GEO_BACKEND", "mongo")
+    pipelines = []
+
+    def aggregate(pipeline):
+        pipelines.append(pipeline)
+        stage = pipeline[0]["$geoNear"]
+        assert stage["key"] == "geo" and stage["spherical"]
+        lon, lat = stage["near"]["coordinates"]
+        source = mongomock.MongoClient().db.rooms
+        source.insert_many([dict(doc) for doc in rooms])
+        matches = mongomock.MongoClient().db.matches
+        for doc in source.find(stage.get("query", {})):
+            plon, plat = doc["geo"]["coordinates"]
+            distance = haversine_meters(lat, lon, plat, plon)
+            if stage.get("minDistance", 0) <= distance <= stage["maxDistance"]:
+                matches.insert_one(dict(doc, **{stage["distanceField"]: distance}))
+        return _Results(list(matches.aggregate(pipeline[1:])))
+
+    monkeypatch.setitem(mongodb._databases, "read", SimpleNamespace(rooms=SimpleNamespace(aggregate=aggregate)))
+    return pipelines
+
+
+def nearby(client, **params):
+    resp = client.get("/rooms/nearby", params={"lat": CAMPUS[0], "lon": CAMPUS[1], **params})
+    assert resp.status_code == 200, resp.text
+    return resp.json()
+
+
+def all_pages(client, **params):
+    ids, cursor = [], None
+    while True:
+        page = nearby(client, **params, **({"cursor": cursor} if cursor else {}))
+        ids += [room["id"] for room in page["items"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return ids
+
+
+def test_grid_index_finds_points_in_range_nearest_first():
+    index = GeoGridIndex()
+    for i, (lat, lon, _) in enumerate(ROOMS):
+        index.add(f"room{i}", lat, lon)
+    found = index.within(*CAMPUS, 1200)
+    assert [room_id for _, room_id in found] == ["room0", "room1", "room2", "room3"]
+    assert [round(distance, -1) for distance, _ in found] == [0, 350, 690, 1040]
+    # Moving a point takes it out of its old cell.
+    index.add("room1", CAMPUS[0] + 0.5, CAMPUS[1])
+    index.remove("room2")
+    assert [room_id for _, room_id in index.within(*CAMPUS, 1200)] == ["room0", "room3"]
+    assert len(index) == 7
+
+
+@pytest.mark.parametrize("backend", ["memory", "mongo"])
+def test_nearby_pages_through_rooms_in_distance_order(client, rooms, request, backend):
+    if backend == "mongo":
+        request.getfixturevalue("geo_near")
+    ids = [str(room["_id"]) for room in rooms]
+    page = nearby(client, radius_m=2000, limit=2)
+    assert [room["id"] for room in page["items"]] == ids[:2]
+    assert [round(room["distance_meters"], -1) for room in page["items"]] == [0, 350]
+    assert all_pages(client, radius_m=2000, limit=2) == ids[:6]
+    assert all_pages(client, radius_m=2000, max_price=650, limit=2) == ids[:3]
+
+
+def test_nearby_rooms_at_the_same_distance_page_by_id(client, mongo):
+    point = geo_point(*CAMPUS)
+    docs = [{"_id": ObjectId(), "title": "Room", "address": "1 Mile End Road", "postcode": "E1 4NS",
+             "price_per_month": 500.0, "geo": point} for _ in range(5)]
+    run(mongo.rooms.insert_many(docs))
+    run(load_geo_index())
+    assert all_pages(client, limit=2) == sorted(str(doc["_id"]) for doc in docs)
+
+
+def test_geo_near_pipeline(client, geo_near):
+    first = nearby(client, radius_m=1500, max_price=900, limit=3)
+    nearby(client, radius_m=1500, max_price=900, limit=3, cursor=first["next_cursor"])
+    (stage, *rest), (next_stage, keyset, *_) = geo_near
+    assert stage["$geoNear"] == {
+        "near": {"type": "Point", "coordinates": [CAMPUS[1], CAMPUS[0]]}, "distanceField": "distance_meters",
+        "maxDistance": 1500, "spherical": True, "key": "geo", "query": {"price_per_month": {"$lte": 900}},
+    }
+    assert rest[:2] == [{"$sort": {"distance_meters": 1, "_id": 1}}, {"$limit": 4}]
+    # The next page starts at the last distance returned, and the keyset match skips what was sent.
+    last = first["items"][-1]
+    assert next_stage["$geoNear"]["minDistance"] == last["distance_meters"]
+    assert "$match" in keyset
+
@@ -0,0 +1,64 @@
+import json
+from datetime import datetime
+
+import pytest
+from bson.objectid import ObjectId
+
+from app.api.applications import application_serializer
+from app.api.rooms import room_serializer
+from app.models.application import ApplicationPage, ApplicationPublic, RoomSummary
+from app.models.room import RoomPage, RoomPublic, RoomStats
+from app.services.room_loader import room_summary_serializer
+from app.services.room_stats import stats_serializer
+from app.utils.responses import FastJSONResponse, dumps
+
+ROOM_DOC = {"_id": ObjectId(), "title": "Double room", "description": None, "address": "1 Mile End Road",
+            "price_per_month": 650, "postcode": "E1 4NS"}
+APPLICATION_DOC = {"_id": ObjectId(), "user_email": "student@example.com", "room_id": str(ROOM_DOC["_id"]),
+                   "status": "applied", "applied_at": datetime(2025, 1, 2, 3, 4, 5, 678000)}
+
+
+def as_validated(model, content) -> dict:
+    """What FastAPI would send for `content` after validating it against the response model."""
+    return json.loads(model.model_validate(content).model_dump_json())
+
+
+@pytest.mark.parametrize("model, content", [
+    (RoomPublic, room_serializer(ROOM_DOC)),
+    (RoomPublic, room_serializer({**ROOM_DOC, "description": "Bright, near the park"})),
+    (RoomSummary, room_summary_serializer(ROOM_DOC)),
+    (ApplicationPublic, application_serializer(APPLICATION_DOC)),
+    (ApplicationPublic, {**application_serializer(APPLICATION_DOC), "room": room_summary_serializer(ROOM_DOC)}),
+    (RoomStats, stats_serializer(str(ROOM_DOC["_id"]), None)),
+    (RoomStats, stats_serializer(str(ROOM_DOC["_id"]), {"counts": {"applied": 2, "cancelled": 1}})),
+    (RoomPage, {"items": [room_serializer(ROOM_DOC)], "next_cursor": None}),
+    (ApplicationPage, {"items": [application_serializer(APPLICATION_DOC)], "next_cursor": "abc"}),
+])
+def test_serializers_give_exactly_what_the_response_model_would(model, content):
+    # Routes send serializer output with orjson and no validation, so it must already match.
+    assert json.loads(dumps(content)) == as_validated(model, content)
+
+
+def test_dumps_handles_mongo_values():
+    assert dumps({"id": ROOM_DOC["_id"], "at": APPLICATION_DOC["applied_at"]}) == (
+        b'{"id":"%s","at":"2025-01-02T03:04:05.678000"}' % str(ROOM_DOC["_id"]).encode())
+    with pytest.raises(TypeError):
+        dumps({"value": object()})
+    response = FastJSONResponse({"price": 650.0, "ok": True}, status_code=201)
+    assert (response.status_code, response.body, response.media_type) == (201, b'{"price":650.0,"ok":true}',
+                                                                          "application/json")
+
+
+def test_api_responses_match_their_models(client, mongo, auth):
+    room = client.post("/rooms/", json={"title": "Double room", "address": "1 Mile End Road",
+                                        "price_per_month": 650, "postcode": "E1 4NS"}, headers=auth)
+    assert room.json() == as_validated(RoomPublic, room.json())
+    room_id = room.json()["id"]
+    application = client.post("/applications/", json={"room_id": room_id}, headers=auth)
+    assert application.json() == as_validated(ApplicationPublic, application.json())
+
+    for url, model in [("/rooms/", RoomPage), (f"/rooms/{room_id}", RoomPublic),
+                       ("/applications/?expand=room", ApplicationPage), (f"/rooms/{room_id}/stats", RoomStats)]:
+        resp = client.get(url, headers=auth)
+        assert resp.status_code == 200
+        assert resp.json() == as_validated(model, resp.json()), url
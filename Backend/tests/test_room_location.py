@@ -0,0 +1,76 @@
+from bson.objectid import ObjectId
+
+from app.services import fallback, room_location
+from app.services.geo_index import room_geo_index
+from app.services.room_location import (
+    compute_locations, is_location_fresh, refresh_room_locations, retry_pending_locations, save_locations,
+)
+from tests.conftest import POINTS, fake_upstreams, run
+
+ROOM = {"title": "Double room", "address": "1 Mile End Road", "price_per_month": 650}
+
+
+def insert_rooms(mongo, postcodes):
+    docs = [{**ROOM, "_id": ObjectId(), "postcode": postcode} for postcode in postcodes]
+    run(mongo.rooms.insert_many(docs))
+    return docs
+
+
+def test_locations_are_saved_in_one_bulk_write(mongo, upstream, monkeypatch):
+    upstream(fake_upstreams())
+    rooms = insert_rooms(mongo, ["E1 4NS", "e1 6an", "E2 9PL"])
+    writes = []
+    original = type(mongo.rooms).bulk_write
+
+    async def bulk_write(self, operations, **kwargs):
+        writes.append(len(operations))
+        return await original(self, operations, **kwargs)
+
+    monkeypatch.setattr(type(mongo.rooms), "bulk_write", bulk_write)
+    run(refresh_room_locations([str(room["_id"]) for room in rooms]))
+
+    assert writes == [3]
+    for room in rooms:
+        stored = run(mongo.rooms.find_one({"_id": room["_id"]}))
+        assert is_location_fresh(stored)
+        assert stored["location"]["distance_meters"] == 1000.0
+        lat, lon = POINTS[stored["location"]["postcode"]]
+        assert stored["geo"]["coordinates"] == [lon, lat]
+        assert room_geo_index._points[str(room["_id"])] == (lat, lon)
+
+
+def test_unrouted_rooms_keep_coordinates_and_are_retried(mongo, upstream, monkeypatch):
+    monkeypatch.setattr(fallback.OSRM, "retries", 0)
+    upstream(fake_upstreams(osrm=False))
+    (room,) = insert_rooms(mongo, ["E1 4NS"])
+    run(refresh_room_locations([str(room["_id"])]))
+
+    stored = run(mongo.rooms.find_one({"_id": room["_id"]}))
+    assert stored["location"]["pending"] is True
+    assert stored["location"]["distance_meters"] is None
+    assert not is_location_fresh(stored)
+    # Still found by /rooms/nearby.
+    assert [room_id for _, room_id in room_geo_index.within(*POINTS["E14NS"], 100)] == [str(room["_id"])]
+
+    # The retry round queues it again; once OSRM answers, the location is complete.
+    queued = []
+    monkeypatch.setattr(room_location, "enqueue_room_locations", lambda ids: queued.extend(ids) or True)
+    assert run(retry_pending_locations()) == 1
+    fallback.OSRM.breaker.record_success()
+    upstream(fake_upstreams())
+    run(refresh_room_locations(queued))
+    stored = run(mongo.rooms.find_one({"_id": room["_id"]}))
+    assert "pending" not in stored["location"]
+    assert is_location_fresh(stored)
+    assert run(retry_pending_locations()) == 0
+
+
+def test_rooms_edited_meanwhile_are_not_overwritten(mongo, upstream):
+    upstream(fake_upstreams())
+    rooms = insert_rooms(mongo, ["E1 4NS", "E2 9PL"])
+    locations = run(compute_locations(rooms))
+    run(mongo.rooms.update_one({"_id": rooms[1]["_id"]}, {"$set": {"postcode": "E1 6AN"}}))
+    run(save_locations(rooms, locations))
+
+    assert "location" not in run(mongo.rooms.find_one({"_id": rooms[1]["_id"]}))
+    assert set(room_geo_index._points) == {str(rooms[0]["_id"])}
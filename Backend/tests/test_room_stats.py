@@ -0,0 +1,59 @@
+from bson.objectid import ObjectId
+
+from app.services.room_stats import STATS_COLLECTION, reconcile_room_stats
+from tests.conftest import run
+
+ROOM = {"title": "Double room", "address": "1 Mile End Road", "price_per_month": 650.0, "postcode": "E1 4NS"}
+
+
+def add_room(mongo) -> str:
+    return str(run(mongo.rooms.insert_one(dict(ROOM))).inserted_id)
+
+
+def stats(client, auth, *room_ids) -> list:
+    resp = client.get("/rooms/stats", params={"ids": ",".join(room_ids)}, headers=auth)
+    assert resp.status_code == 200, resp.text
+    return resp.json()
+
+
+def test_applying_and_cancelling_move_the_counters(client, mongo, auth):
+    room_id, other_room = add_room(mongo), add_room(mongo)
+    application = client.post("/applications/", json={"room_id": room_id}, headers=auth).json()
+    assert stats(client, auth, room_id, other_room) == [
+        {"room_id": room_id, "applied": 1, "cancelled": 0, "approved": 0, "total": 1},
+        {"room_id": other_room, "applied": 0, "cancelled": 0, "approved": 0, "total": 0},
+    ]
+
+    assert client.patch(f"/applications/{application['id']}/cancel", headers=auth).status_code == 200
+    # Cancelling twice is refused and doesn't move the counters again.
+    assert client.patch(f"/applications/{application['id']}/cancel", headers=auth).status_code == 400
+    client.post("/applications/", json={"room_id": room_id}, headers=auth)
+    assert stats(client, auth, room_id) == [
+        {"room_id": room_id, "applied": 1, "cancelled": 1, "approved": 0, "total": 2}]
+    # A refused application isn't counted either.
+    assert client.post("/applications/", json={"room_id": room_id}, headers=auth).status_code == 400
+    assert run(mongo[STATS_COLLECTION].find_one({"_id": ObjectId(room_id)}))["counts"] == {
+        "applied": 1, "cancelled": 1}
+
+
+def test_stats_rejects_bad_ids(client, auth):
+    assert client.get("/rooms/stats", params={"ids": "nope"}, headers=auth).status_code == 400
+    assert client.get("/rooms/stats", params={"ids": " , "}, headers=auth).status_code == 400
+
+
+def test_reconcile_fixes_drifted_counters(client, mongo, auth):
+    correct, drifted, missing, gone = (add_room(mongo) for _ in range(4))
+    for room_id in (correct, drifted, missing):
+        client.post("/applications/", json={"room_id": room_id}, headers=auth)
+    # A counter that was bumped too often, one that was never created,
+    # and one for a room whose applications were all removed.
+    run(mongo[STATS_COLLECTION].update_one({"_id": ObjectId(drifted)}, {"$inc": {"counts.applied": 2}}))
+    run(mongo[STATS_COLLECTION].delete_one({"_id": ObjectId(missing)}))
+    run(mongo[STATS_COLLECTION].insert_one({"_id": ObjectId(gone), "counts": {"applied": 3}}))
+    # A counter at 0 is the same as no counter, so it isn't rewritten.
+    run(mongo[STATS_COLLECTION].update_one({"_id": ObjectId(correct)}, {"$set": {"counts.cancelled": 0}}))
+
+    assert run(reconcile_room_stats(batch_size=2)) == {"rooms": 3, "corrected": 2, "removed": 1}
+    assert [s["applied"] for s in stats(client, auth, correct, drifted, missing, gone)] == [1, 1, 1, 0]
+    # Nothing left to fix.
+    assert run(reconcile_room_stats()) == {"rooms": 3, "corrected": 0, "removed": 0}
@@ -0,0 +1,237 @@
+import base64
+import json
+
+import fakeredis
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+from app.db import mongodb
+from app.services import response_cache
+from app.services.cache import TTLCache
+from app.services.response_cache import rooms_changed
+from app.services.room_postcodes import backfill_postcode_keys
+from app.utils import streaming
+from tests.conftest import run
+
+
+def make_cursor(sort: str, values: list) -> str:
+    raw = json.dumps({"s": sort, "v": values}).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+@pytest.mark.parametrize("cursor", [
+    "not-a-cursor",
+    make_cursor("newest", ["not-an-object-id"]),
+    make_cursor("price_asc", [500]),
+    make_cursor("oldest", ["0123456789ab0123456789ab"]),
+])
+def test_list_rooms_rejects_bad_cursor(client, cursor):
+    resp = client.get("/rooms/", params={"cursor": cursor})
+    assert resp.status_code == 400
+
+
+def test_nearby_rejects_tampered_cursor(client):
+    resp = client.get("/rooms/nearby", params={
+        "lat": 51.5, "lon": -0.04, "cursor": make_cursor("nearby", [10.0, "zzz"]),
+    })
+    assert resp.status_code == 400
+
+
+ROOM = {"title": "Double room", "address": "1 Mile End Road", "price_per_month": 650}
+
+
+@pytest.mark.parametrize("query", ["E1", "e1", "e14", "E1 4N", " e1 4ns "])
+def test_postcode_filter_ignores_case_and_spaces(client, auth, query):
+    created = client.post("/rooms/", json={**ROOM, "postcode": "e1 4ns"}, headers=auth)
+    assert created.status_code == 201
+    client.post("/rooms/", json={**ROOM, "postcode": "E2 9PL"}, headers=auth)
+
+    items = client.get("/rooms/", params={"postcode": query}).json()["items"]
+    assert [room["id"] for room in items] == [created.json()["id"]]
+    assert items[0]["postcode"] == "e1 4ns"  # shown as entered
+
+
+def test_postcode_filter_follows_updates(client, auth):
+    room_id = client.post("/rooms/", json={**ROOM, "postcode": "E2 9PL"}, headers=auth).json()["id"]
+    client.put(f"/rooms/{room_id}", json={"postcode": "e3 4aa"}, headers=auth)
+    assert client.get("/rooms/", params={"postcode": "E2"}).json()["items"] == []
+    assert [r["id"] for r in client.get("/rooms/", params={"postcode": "E34"}).json()["items"]] == [room_id]
+
+
+def test_backfill_postcode_keys(mongo, client):
+    run(mongo.rooms.insert_many([{**ROOM, "postcode": "e1 4ns"}, {**ROOM, "postcode": "E1 6AN"}]))
+    assert client.get("/rooms/", params={"postcode": "E1"}).json()["items"] == []
+
+    assert run(backfill_postcode_keys(batch_size=1)) == 2
+    assert run(backfill_postcode_keys()) == 0
+    run(rooms_changed())  # the empty page above is still cached
+    assert len(client.get("/rooms/", params={"postcode": "E1"}).json()["items"]) == 2
+
+
+def test_cached_room_reads_use_the_primary(mongo, client, auth, monkeypatch):
+    # A read handle that lags behind: it has none of the rooms written below.
+    monkeypatch.setitem(mongodb._databases, "read", AsyncMongoMockClient()["lagging"])
+    room_id = client.post("/rooms/", json={**ROOM, "postcode": "E1 4NS"}, headers=auth).json()["id"]
+    client.put(f"/rooms/{room_id}", json={"price_per_month": 700}, headers=auth)
+
+    assert client.get(f"/rooms/{room_id}").json()["price_per_month"] == 700
+    assert [room["id"] for room in client.get("/rooms/").json()["items"]] == [room_id]
+
+
+LISTED = {**ROOM, "postcode": "E1 4NS"}
+
+
+def revalidate(client, url, etag, **kwargs):
+    return client.get(url, headers={"If-None-Match": etag}, **kwargs)
+
+
+def test_room_etag_changes_on_update_and_delete(client, auth):
+    room_id = client.post("/rooms/", json=LISTED, headers=auth).json()["id"]
+    first = client.get(f"/rooms/{room_id}")
+    etag = first.headers["ETag"]
+    assert revalidate(client, f"/rooms/{room_id}", etag).status_code == 304
+    assert revalidate(client, f"/rooms/{room_id}", f'W/{etag}, "other"').status_code == 304
+
+    client.put(f"/rooms/{room_id}", json={"price_per_month": 999}, headers=auth)
+    updated = revalidate(client, f"/rooms/{room_id}", etag)
+    assert updated.status_code == 200
+    assert updated.json()["price_per_month"] == 999
+    assert updated.headers["ETag"] != etag
+
+    client.patch("/rooms/bulk", json={"updates": [{"id": room_id, "price_per_month": 450}]}, headers=auth)
+    bulk_updated = revalidate(client, f"/rooms/{room_id}", updated.headers["ETag"])
+    assert bulk_updated.status_code == 200
+    assert bulk_updated.json()["price_per_month"] == 450
+
+    client.delete(f"/rooms/{room_id}", headers=auth)
+    assert revalidate(client, f"/rooms/{room_id}", bulk_updated.headers["ETag"]).status_code == 404
+
+
+def test_listing_etag_changes_when_any_room_does(client, auth):
+    def listing_etag(previous=None):
+        resp = revalidate(client, "/rooms/", previous) if previous else client.get("/rooms/")
+        assert resp.status_code == 200
+        return resp.headers["ETag"], len(resp.json()["items"])
+
+    room_id = client.post("/rooms/", json=LISTED, headers=auth).json()["id"]
+    etag, count = listing_etag()
+    assert count == 1
+    assert revalidate(client, "/rooms/", etag).status_code == 304
+    # Another page (other query) has its own ETag.
+    assert client.get("/rooms/", params={"sort": "price_asc"}).headers["ETag"] != etag
+
+    steps = [
+        lambda: client.post("/rooms/", json=LISTED, headers=auth),
+        lambda: client.post("/rooms/bulk", content=json.dumps(LISTED).encode(),
+                            headers={**auth, "Content-Type": "application/x-ndjson"}),
+        lambda: client.put(f"/rooms/{room_id}", json={"price_per_month": 999}, headers=auth),
+        lambda: client.patch("/rooms/bulk", json={"updates": [{"id": room_id, "price_per_month": 450}]}, headers=auth),
+        lambda: client.delete(f"/rooms/{room_id}", headers=auth),
+    ]
+    for step in steps:
+        assert step().status_code < 300
+        new_etag, count = listing_etag(etag)
+        assert new_etag != etag
+        etag = new_etag
+    assert count == 2
+
+
+class Worker:
+    """One API process: its own cached bodies, and its own connection to the shared Redis."""
+
+    def __init__(self, server):
+        self.server = server
+        self.redis = fakeredis.FakeAsyncRedis(server=server)
+        self.bodies = TTLCache()
+
+    def __enter__(self):
+        response_cache.use_version_store(self.redis)
+        response_cache._bodies = self.bodies
+        return self
+
+    def __exit__(self, *exc):
+        response_cache.use_version_store(None)
+
+
+@pytest.fixture
+def workers(monkeypatch):
+    monkeypatch.setattr(response_cache, "_bodies", response_cache._bodies)
+    server = fakeredis.FakeServer()
+    return Worker(server), Worker(server)
+
+
+def test_writes_on_one_worker_change_the_etags_of_all(client, auth, workers):
+    a, b = workers
+    with a:
+        room_id = client.post("/rooms/", json=LISTED, headers=auth).json()["id"]
+        room_etag = client.get(f"/rooms/{room_id}").headers["ETag"]
+        list_etag = client.get("/rooms/").headers["ETag"]
+    with b:
+        # Same versions on every worker, so b can answer a's clients with 304.
+        assert revalidate(client, f"/rooms/{room_id}", room_etag).status_code == 304
+        assert revalidate(client, "/rooms/", list_etag).status_code == 304
+        client.put(f"/rooms/{room_id}", json={"price_per_month": 999}, headers=auth)
+    with a:
+        # a still has the old body cached, but never serves it again.
+        assert a.bodies.get(room_etag) is not None
+        room = revalidate(client, f"/rooms/{room_id}", room_etag)
+        assert (room.status_code, room.json()["price_per_month"]) == (200, 999)
+        listing = revalidate(client, "/rooms/", list_etag)
+        assert (listing.status_code, listing.json()["items"][0]["price_per_month"]) == (200, 999)
+    with b:
+        client.post("/rooms/bulk", content=json.dumps(LISTED).encode(),
+                    headers={**auth, "Content-Type": "application/x-ndjson"})
+    with a:
+        assert len(revalidate(client, "/rooms/", listing.headers["ETag"]).json()["items"]) == 2
+
+
+def test_shared_versions_outlive_the_local_caches(client, auth, workers, monkeypatch):
+    a, b = workers
+    with a:
+        room_id = client.post("/rooms/", json=LISTED, headers=auth).json()["id"]
+        etag = client.get(f"/rooms/{room_id}").headers["ETag"]
+        list_etag = client.get("/rooms/").headers["ETag"]
+    # Long after the bodies expired (and the local generation would have been renewed),
+    # the versions are the same, so clients still get 304s.
+    monkeypatch.setattr(response_cache.time, "monotonic", lambda: 10 ** 9)
+    with b:
+        assert revalidate(client, f"/rooms/{room_id}", etag).status_code == 304
+        assert revalidate(client, "/rooms/", list_etag).status_code == 304
+
+
+def test_rooms_are_served_uncached_while_the_version_store_is_down(client, auth, workers):
+    a, _ = workers
+    with a:
+        room_id = client.post("/rooms/", json=LISTED, headers=auth).json()["id"]
+        etag = client.get(f"/rooms/{room_id}").headers["ETag"]
+        a.server.connected = False
+        resp = revalidate(client, f"/rooms/{room_id}", etag)
+        assert resp.status_code == 200
+        assert "ETag" not in resp.headers
+        assert client.put(f"/rooms/{room_id}", json={"price_per_month": 999}, headers=auth).status_code == 200
+        assert client.get("/rooms/").json()["items"][0]["price_per_month"] == 999
+        assert len(a.bodies) == 1
+
+
+@pytest.mark.parametrize("flush_every", [1, 2, 100])
+def test_rooms_stream_as_a_json_array_or_ndjson(client, auth, monkeypatch, flush_every):
+    monkeypatch.setattr(streaming, "STREAM_FLUSH_EVERY", flush_every)
+    prices = [500, 900, 650, 800, 700]
+    for price in prices:
+        client.post("/rooms/", json={**LISTED, "price_per_month": price}, headers=auth)
+
+    # Every matching room, past the page limit, in the requested order and without an ETag.
+    params = {"stream": "true", "limit": 2, "sort": "price_desc", "min_price": 600}
+    array = client.get("/rooms/", params=params)
+    assert array.headers["content-type"] == "application/json"
+    assert "ETag" not in array.headers
+    assert [room["price_per_month"] for room in array.json()] == [900, 800, 700, 650]
+
+    ndjson = client.get("/rooms/", params={"sort": "price_asc"}, headers={"Accept": "application/x-ndjson"})
+    assert ndjson.headers["content-type"] == "application/x-ndjson"
+    lines = ndjson.text.splitlines()
+    assert [json.loads(line)["price_per_month"] for line in lines] == sorted(prices)
+    assert ndjson.text.endswith("\n")
+    assert set(json.loads(lines[0])) == {"id", "title", "description", "address", "price_per_month", "postcode"}
+
+    assert client.get("/rooms/", params={"stream": "true", "min_price": 10_000}).json() == []
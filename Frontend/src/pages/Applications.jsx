@@ -3,28 +3,58 @@ import toast, { Toaster } from "react-hot-toast";
 import { useAuth } from "../contexts/AuthContext";
 
 const API = import.meta.env.VITE_API_URL || "http://localhost:8000";
+// Applications fetched per request; "Load more" asks for the next page.
+const PAGE_SIZE = 20;
+
+// One page of applications, newest first, with each application's room embedded
+// (?expand=room), so we don't need a request per room.
+async function fetchApplicationsPage(cursor) {
+  const url = `${API}/applications/?limit=${PAGE_SIZE}&expand=room` + (cursor ? `&cursor=${cursor}` : "");
+  const res = await fetch(url, {
+    headers: { Authorization: `Bearer ${localStorage.getItem("jwt")}` },
+  });
+  if (!res.ok) throw "Could not fetch";
+  return res.json();
+}
 
 export default function Applications({ embedded }) {
   const { user } = useAuth();
   const [apps, setApps] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [filter, setFilter] = useState({ location: "", status: "", date: "" });
   const [loading, setLoading] = useState(true);
   const [cancelId, setCancelId] = useState(null);
   const [error, setError] = useState("");
 
-  // Fetch applications from backend
+  // Fetch the first page of applications from backend
   useEffect(() => {
     if (!user) return;
     setLoading(true);
     setError("");
-    fetch(`${API}/applications/`, {
-      headers: { Authorization: `Bearer ${localStorage.getItem("jwt")}` },
-    })
-      .then(res => res.ok ? res.json() : Promise.reject("Could not fetch"))
-      .then(setApps)
+    fetchApplicationsPage(null)
+      .then(page => {
+        setApps(page.items);
+        setNextCursor(page.next_cursor);
+      })
       .catch(err => setError(err.toString()))
       .finally(() => setLoading(false));
-  }, [user, cancelId]);
+  }, [user]);
+
+  // Append the next page (next_cursor is null once the last page has been loaded)
+  async function handleLoadMore() {
+    if (!nextCursor) return;
+    setLoadingMore(true);
+    try {
+      const page = await fetchApplicationsPage(nextCursor);
+      setApps(prev => [...prev, ...page.items]);
+      setNextCursor(page.next_cursor);
+    } catch (err) {
+      toast.error(err.toString());
+    } finally {
+      setLoadingMore(false);
+    }
+  }
 
   // Filter logic (client side, on already fetched data)
   const filteredApplications = apps.filter(app => {
@@ -83,12 +113,12 @@ export default function Applications({ embedded }) {
       });
       if (!res.ok) throw new Error("Could not cancel application");
       toast("Application cancelled.", { icon: "🚫" });
-      // Re-fetch applications to reflect new status
-      setCancelId(null); // Will trigger useEffect to reload
+      // Update it in place, so the pages loaded so far are kept
+      setApps(prev => prev.map(a => ((a.id || a._id) === (app.id || app._id) ? { ...a, status: "cancelled" } : a)));
     } catch (err) {
       toast.error(err.message || "Cancel failed");
-      setCancelId(null);
     }
+    setCancelId(null);
   }
 
   function statusBadge(status) {
@@ -202,6 +232,20 @@ export default function Applications({ embedded }) {
           })
         )}
       </div>
+
+      {/* Paging */}
+      {!loading && nextCursor && (
+        <div className="flex justify-center mt-8">
+          <button
+            type="button"
+            onClick={handleLoadMore}
+            disabled={loadingMore}
+            className="bg-gray-200 dark:bg-gray-700 text-gray-700 dark:text-gray-200 px-6 py-2 rounded font-semibold hover:bg-gray-300 dark:hover:bg-gray-800 transition disabled:opacity-50"
+          >
+            {loadingMore ? "Loading..." : "Load more"}
+          </button>
+        </div>
+      )}
     </section>
   );
 }
@@ -3,12 +3,33 @@ import toast, { Toaster } from "react-hot-toast";
 import { useAuth } from "../contexts/AuthContext";
 
 const API = import.meta.env.VITE_API_URL || "http://localhost:8000";
+// Rooms fetched per request; "Load more" asks for the next page.
+const PAGE_SIZE = 20;
+const EMPTY_FILTERS = { location: "", maxPrice: "", language: "", postcode: "" };
+
+// Price and postcode are filtered by the API, so every page only holds matching rooms.
+function roomsUrl(filters, cursor) {
+  const params = new URLSearchParams({ limit: PAGE_SIZE });
+  if (filters.maxPrice) params.set("max_price", filters.maxPrice);
+  if (filters.postcode) params.set("postcode", filters.postcode);
+  if (cursor) params.set("cursor", cursor);
+  return `${API}/rooms/?${params}`;
+}
+
+// Location and language aren't API filters; they narrow down the rooms loaded so far.
+function matchesLocalFilters(room, filters) {
+  const matchesLocation = !filters.location || (room.location?.toLowerCase().includes(filters.location.toLowerCase()) || room.title?.toLowerCase().includes(filters.location.toLowerCase()));
+  const matchesLanguage = !filters.language || (room.languages || []).map(l => l.toLowerCase()).includes(filters.language.toLowerCase());
+  return matchesLocation && matchesLanguage;
+}
 
 export default function Rooms() {
   const { user } = useAuth();
-  const [filters, setFilters] = useState({ location: "", maxPrice: "", language: "", postcode: "" });
+  const [filters, setFilters] = useState(EMPTY_FILTERS);
+  const [appliedFilters, setAppliedFilters] = useState(EMPTY_FILTERS);
   const [rooms, setRooms] = useState([]);
-  const [filteredRooms, setFilteredRooms] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [appStatus, setAppStatus] = useState({});
   const [appIds, setAppIds] = useState({}); // Maps room_id to application_id
   const [loading, setLoading] = useState(true);
@@ -19,17 +40,19 @@ export default function Rooms() {
   const [distanceMap, setDistanceMap] = useState({});
   const [weatherMap, setWeatherMap] = useState({});
 
-  // Fetch rooms from backend
+  const filteredRooms = rooms.filter(room => matchesLocalFilters(room, appliedFilters));
+
+  // Fetch the first page of rooms from backend (again whenever a search is made)
   useEffect(() => {
     async function fetchRooms() {
       setLoading(true);
       setError("");
       try {
-        const res = await fetch(`${API}/rooms/`);
+        const res = await fetch(roomsUrl(appliedFilters, null));
         if (!res.ok) throw new Error("Failed to fetch rooms.");
-        const data = await res.json();
-        setRooms(data);
-        setFilteredRooms(data);
+        const page = await res.json();
+        setRooms(page.items);
+        setNextCursor(page.next_cursor);
       } catch (err) {
         setError(err.message || "Could not load rooms");
       } finally {
@@ -37,7 +60,24 @@ export default function Rooms() {
       }
     }
     fetchRooms();
-  }, []);
+  }, [appliedFilters]);
+
+  // Append the next page (next_cursor is null once the last page has been loaded)
+  async function handleLoadMore() {
+    if (!nextCursor) return;
+    setLoadingMore(true);
+    try {
+      const res = await fetch(roomsUrl(appliedFilters, nextCursor));
+      if (!res.ok) throw new Error("Failed to fetch rooms.");
+      const page = await res.json();
+      setRooms(prev => [...prev, ...page.items]);
+      setNextCursor(page.next_cursor);
+    } catch (err) {
+      toast.error(err.message || "Could not load more rooms");
+    } finally {
+      setLoadingMore(false);
+    }
+  }
 
   // Fetch user's applications to know applied status
   useEffect(() => {
@@ -48,17 +88,19 @@ export default function Rooms() {
         return;
       }
       try {
-        const res = await fetch(`${API}/applications/`, {
+        // The student's latest applications (one page, newest first) are enough to badge the rooms.
+        const res = await fetch(`${API}/applications/?limit=100`, {
           headers: { Authorization: `Bearer ${localStorage.getItem("jwt")}` },
         });
         if (!res.ok) return;
-        const data = await res.json();
+        const data = (await res.json()).items;
         // statusMap: { room_id: status }
         // appIds: { room_id: application_id }
         const statusMap = {};
         const idsMap = {};
         data.forEach(app => {
           const roomId = app.room_id;
+          if (roomId in statusMap) return; // newest first: keep the room's latest application
           const stat = (app.status === "applied") ? "pending" : app.status;
           statusMap[roomId] = stat;
           idsMap[roomId] = app.id || app._id;
@@ -76,19 +118,12 @@ export default function Rooms() {
 
   function handleSearch(e) {
     e.preventDefault();
-    let filtered = rooms.filter(room => {
-      const matchesLocation = !filters.location || (room.location?.toLowerCase().includes(filters.location.toLowerCase()) || room.title?.toLowerCase().includes(filters.location.toLowerCase()));
-      const matchesPrice = !filters.maxPrice || (room.price_per_month ?? room.price) <= Number(filters.maxPrice);
-      const matchesLanguage = !filters.language || (room.languages || []).map(l => l.toLowerCase()).includes(filters.language.toLowerCase());
-      const matchesPostcode = !filters.postcode || (room.postcode && room.postcode.includes(filters.postcode));
-      return matchesLocation && matchesPrice && matchesLanguage && matchesPostcode;
-    });
-    setFilteredRooms(filtered);
+    setAppliedFilters({ ...filters });
   }
 
   function handleReset() {
-    setFilters({ location: "", maxPrice: "", language: "", postcode: "" });
-    setFilteredRooms(rooms);
+    setFilters(EMPTY_FILTERS);
+    setAppliedFilters(EMPTY_FILTERS);
   }
 
   // --- Application Logic ---
@@ -295,6 +330,19 @@ export default function Rooms() {
           );
         })}
       </div>
+      {/* PAGING */}
+      {!loading && nextCursor && (
+        <div className="flex justify-center mt-8">
+          <button
+            type="button"
+            onClick={handleLoadMore}
+            disabled={loadingMore}
+            className="bg-gray-200 dark:bg-gray-700 text-gray-700 dark:text-gray-200 px-6 py-2 rounded font-semibold hover:bg-gray-300 dark:hover:bg-gray-800 transition disabled:opacity-50"
+          >
+            {loadingMore ? "Loading..." : "Load more"}
+          </button>
+        </div>
+      )}
     </section>
   );
 }